@@ -0,0 +1,165 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Sustained requests per minute and burst size, per authenticated user and per client IP
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "120"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "30"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "300"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "60"))
+# Users and IPs whose buckets are kept; the least recently seen are forgotten (a full bucket)
+RATE_LIMIT_TRACKED_KEYS = int(os.getenv("RATE_LIMIT_TRACKED_KEYS", "100000"))
+# Diagnostic sessions alive at once, in memory or spilled to disk
+MAX_ACTIVE_SESSIONS = int(os.getenv("MAX_ACTIVE_SESSIONS", "20000"))
+# Shed load while requests wait longer than this for the event loop or an inference worker
+ADMISSION_MAX_QUEUE_MS = float(os.getenv("ADMISSION_MAX_QUEUE_MS", "250"))
+ADMISSION_PROBE_INTERVAL = float(os.getenv("ADMISSION_PROBE_INTERVAL", "0.1"))
+
+DECISIONS = ("admitted", "user_rate", "ip_rate", "session_cap", "overloaded")
+
+
+class Rejected(Exception):
+    """Request refused by admission control; `retry_after` is in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Token bucket per key, refilled lazily on each request"""
+
+    def __init__(self, per_minute, burst, max_keys=RATE_LIMIT_TRACKED_KEYS):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+
+    def wait(self, key, now):
+        """Refills the bucket; returns 0 when it has a token or the seconds until it will"""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def take(self, key):
+        """Takes the token that `wait` found for `key`"""
+        if self.rate > 0:
+            self._buckets[key][0] -= 1
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """
+    In-process admission control for the diagnostic endpoints: token buckets
+    per user and per IP, a cap on live sessions and load shedding when the
+    event loop falls behind.
+
+    Queue latency is the larger of two EWMAs: the event loop lag (how late a
+    periodic probe wakes up), which delays every request, and the time jobs
+    wait for a worker of the inference pool (observe_queue).
+    """
+
+    def __init__(self):
+        self.users = TokenBuckets(RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST)
+        self.ips = TokenBuckets(RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+        self.max_sessions = MAX_ACTIVE_SESSIONS
+        self.max_queue_ms = ADMISSION_MAX_QUEUE_MS
+        self.loop_lag_ms = 0.0
+        self.pool_wait_ms = 0.0
+        self._pool_observed = False
+        self.decisions = Counter()
+        self._lock = threading.Lock()
+        self._probe = None
+
+    @property
+    def queue_ms(self):
+        return max(self.loop_lag_ms, self.pool_wait_ms)
+
+    def observe_queue(self, wait_ms):
+        """Time a job waited for an inference worker"""
+        self.pool_wait_ms = 0.8 * self.pool_wait_ms + 0.2 * wait_ms
+        self._pool_observed = True
+
+    def check(self, user_id, ip, active_sessions=None):
+        """
+        Raises Rejected when the request must be refused. `active_sessions` is
+        passed only by requests that open a new session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            try:
+                if self.queue_ms > self.max_queue_ms:
+                    raise Rejected("overloaded", max(1.0, self.queue_ms / 1000))
+                if active_sessions is not None and active_sessions >= self.max_sessions:
+                    raise Rejected("session_cap", 5.0)
+                # Both buckets are checked before either is debited, so a request
+                # refused by one limit does not cost a token of the other
+                wait = self.users.wait(user_id, now)
+                if wait:
+                    raise Rejected("user_rate", wait)
+                if ip is not None:
+                    wait = self.ips.wait(ip, now)
+                    if wait:
+                        raise Rejected("ip_rate", wait)
+            except Rejected as rejected:
+                self.decisions[rejected.reason] += 1
+                raise
+            self.users.take(user_id)
+            if ip is not None:
+                self.ips.take(ip)
+            self.decisions["admitted"] += 1
+
+    async def _measure_queue(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(ADMISSION_PROBE_INTERVAL)
+            lag_ms = max(0.0, (loop.time() - start - ADMISSION_PROBE_INTERVAL) * 1000)
+            self.loop_lag_ms = 0.8 * self.loop_lag_ms + 0.2 * lag_ms
+            # An idle pool has no queue; without this, shedding would keep the estimate stuck
+            if not self._pool_observed:
+                self.pool_wait_ms *= 0.8
+            self._pool_observed = False
+
+    def start(self):
+        if self._probe is None:
+            self._probe = asyncio.get_running_loop().create_task(self._measure_queue())
+
+    def stop(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "decisions": {decision: self.decisions[decision] for decision in DECISIONS},
+                "queue_ms": round(self.queue_ms, 3),
+                "loop_lag_ms": round(self.loop_lag_ms, 3),
+                "pool_wait_ms": round(self.pool_wait_ms, 3),
+                "max_queue_ms": self.max_queue_ms,
+                "max_sessions": self.max_sessions,
+                "tracked_users": len(self.users),
+                "tracked_ips": len(self.ips),
+            }
+
+
+def retry_after_header(rejected):
+    return {"Retry-After": str(max(1, math.ceil(rejected.retry_after)))}
@@ -0,0 +1,330 @@
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+
+
+def model_fingerprint(model):
+    """Hash of the structure and parameters of a pgmpy model"""
+    digest = hashlib.sha256()
+    for cpd in sorted(model.get_cpds(), key=lambda cpd: cpd.variable):
+        digest.update(json.dumps([cpd.variable, list(cpd.variables), [int(c) for c in cpd.cardinality]]).encode())
+        digest.update(np.ascontiguousarray(cpd.get_values(), dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class _CircuitBuilder:
+    """
+    Nodes of a circuit under construction. Node ids below `indicator_count`
+    are the evidence indicators; identical sums and products are created once.
+    """
+
+    def __init__(self, indicator_count):
+        self.indicator_count = indicator_count
+        self.nodes = []  # ("sum", ((child, weight), ...)) or ("product", (left, right))
+        self._ids = {}
+
+    def _add(self, node):
+        node_id = self._ids.get(node)
+        if node_id is None:
+            node_id = self._ids[node] = self.indicator_count + len(self.nodes)
+            self.nodes.append(node)
+        return node_id
+
+    def sum(self, edges):
+        """Weighted sum; single-edge sums among the children are folded into the weights"""
+        flat = []
+        for child, weight in edges:
+            if child >= self.indicator_count:
+                kind, child_edges = self.nodes[child - self.indicator_count]
+                if kind == "sum" and len(child_edges) == 1:
+                    child, child_weight = child_edges[0]
+                    weight *= child_weight
+            flat.append((child, weight))
+        return self._add(("sum", tuple(flat)))
+
+    def product(self, children):
+        """Balanced tree of binary products over `children`"""
+        children = list(children)
+        while len(children) > 1:
+            paired = [self._add(("product", tuple(sorted(children[i:i + 2]))))
+                      for i in range(0, len(children) - 1, 2)]
+            children = paired + children[len(children) - len(children) % 2:]
+        return children[0]
+
+
+class ArithmeticCircuit:
+    """
+    Network polynomial of a diagnostic network compiled into flat NumPy arrays.
+
+    The circuit is the trace of variable elimination on the network: every
+    CPD entry is a weighted indicator, eliminating a variable multiplies the
+    factors that mention it and sums it out, and the entries of the resulting
+    factor are nodes shared by everything built on top of them. Independent
+    root causes therefore add to the size of the circuit instead of
+    multiplying it, unlike an enumeration of the joint root states.
+
+    Nodes are stored level by level (a node only depends on lower levels), as
+    binary products and weighted sums given by their edges. A forward pass
+    evaluates P(evidence); one backward pass gives the partial derivative with
+    respect to every indicator, i.e. P(x = v, evidence) for every variable and
+    state at once.
+    """
+
+    FORMAT = 2
+    ARRAYS = ("level_nodes", "product_levels", "product_children", "sum_levels", "sum_parents", "sum_children",
+              "sum_weights")
+
+    def __init__(self, variables, cardinalities, problems, level_nodes, product_levels, product_children,
+                 sum_levels, sum_parents, sum_children, sum_weights, fingerprint=None):
+        self.variables = list(variables)
+        self.cardinalities = [int(card) for card in cardinalities]
+        self.problems = list(problems)
+        # Node ids of level l are level_nodes[l]:level_nodes[l + 1], and so on for the edges
+        self.level_nodes = np.asarray(level_nodes, dtype=np.int64)
+        self.product_levels = np.asarray(product_levels, dtype=np.int64)
+        self.product_children = np.asarray(product_children, dtype=np.int64).reshape(-1, 2)
+        self.sum_levels = np.asarray(sum_levels, dtype=np.int64)
+        self.sum_parents = np.asarray(sum_parents, dtype=np.int64)
+        self.sum_children = np.asarray(sum_children, dtype=np.int64)
+        self.sum_weights = np.asarray(sum_weights, dtype=np.float64)
+        self.fingerprint = fingerprint
+        offsets = np.concatenate([[0], np.cumsum(self.cardinalities)])
+        # Indicator slot of (variable, state) is offsets[variable] + state
+        self.offsets = {variable: int(offset) for variable, offset in zip(self.variables, offsets)}
+        self.indicator_count = int(offsets[-1])
+        self.node_count = int(self.level_nodes[-1])
+        self.problem_slots = np.array([self.offsets[problem] for problem in self.problems])
+        self._levels = [
+            (int(self.level_nodes[level]), int(self.level_nodes[level + 1]),
+             self.product_children[self.product_levels[level]:self.product_levels[level + 1]],
+             self.sum_parents[self.sum_levels[level]:self.sum_levels[level + 1]],
+             self.sum_children[self.sum_levels[level]:self.sum_levels[level + 1]],
+             self.sum_weights[self.sum_levels[level]:self.sum_levels[level + 1]])
+            for level in range(len(self.level_nodes) - 1)
+        ]
+
+    @property
+    def product_count(self):
+        return len(self.product_children)
+
+    @property
+    def sum_count(self):
+        return self.node_count - self.indicator_count - self.product_count
+
+    @classmethod
+    def compile(cls, model, problems):
+        problems = list(problems)
+        cpds = {cpd.variable: cpd for cpd in model.get_cpds()}
+        variables = problems + sorted(variable for variable in cpds if variable not in problems)
+        cards = {variable: int(model.get_cardinality(variable)) for variable in variables}
+        offsets = dict(zip(variables, np.concatenate([[0], np.cumsum([cards[v] for v in variables])]).tolist()))
+        builder = _CircuitBuilder(int(sum(cards.values())))
+
+        # One factor per CPD over (variable, parents): entry = parameter * indicator
+        factors = []
+        for variable in variables:
+            cpd = cpds[variable]
+            scope = tuple(cpd.variables)
+            values = cpd.get_values()
+            table = {}
+            for assignment in itertools.product(*[range(cards[v]) for v in scope]):
+                column = 0
+                for parent, state in zip(scope[1:], assignment[1:]):
+                    column = column * cards[parent] + state
+                table[assignment] = builder.sum([(offsets[variable] + assignment[0],
+                                                  float(values[assignment[0], column]))])
+            factors.append((scope, table))
+
+        remaining = list(variables)
+        while remaining:
+            # Min-size heuristic: eliminate the variable whose product factor has the fewest entries
+            def product_size(variable):
+                scope = set().union(*[scope for scope, _ in factors if variable in scope])
+                return int(np.prod([cards[v] for v in scope]))
+
+            variable = min(remaining, key=product_size)
+            remaining.remove(variable)
+            involved = [factor for factor in factors if variable in factor[0]]
+            factors = [factor for factor in factors if variable not in factor[0]]
+            scope = tuple(v for v in remaining if any(v in factor_scope for factor_scope, _ in involved))
+            table = {}
+            for assignment in itertools.product(*[range(cards[v]) for v in scope]):
+                state = dict(zip(scope, assignment))
+                terms = []
+                for value in range(cards[variable]):
+                    state[variable] = value
+                    terms.append(builder.product(
+                        [entries[tuple(state[v] for v in factor_scope)] for factor_scope, entries in involved]))
+                table[assignment] = builder.sum([(term, 1.0) for term in terms])
+            factors.append((scope, table))
+
+        root = builder.product([entries[()] for _, entries in factors])
+        return cls._from_nodes(variables, [cards[v] for v in variables], problems, builder, root,
+                               model_fingerprint(model))
+
+    @classmethod
+    def _from_nodes(cls, variables, cardinalities, problems, builder, root, fingerprint):
+        """Numbers the nodes level by level and flattens them into edge arrays"""
+        first = builder.indicator_count
+
+        def children_of(node_id):
+            kind, children = builder.nodes[node_id - first]
+            return children if kind == "product" else [child for child, _ in children]
+
+        # Folded single-edge sums are left behind unused; keep what the output depends on
+        used, stack = {root}, [root]
+        while stack:
+            for child in children_of(stack.pop()):
+                if child >= first and child not in used:
+                    used.add(child)
+                    stack.append(child)
+        levels = {node_id: 0 for node_id in range(first)}
+        for node_id in sorted(used):
+            levels[node_id] = 1 + max(levels[child] for child in children_of(node_id))
+        # Within a level the products come first, then the sums
+        order = sorted(used, key=lambda node_id: (levels[node_id], builder.nodes[node_id - first][0] == "sum", node_id))
+        renumber = {node_id: node_id for node_id in range(first)}
+        renumber.update({node_id: position for position, node_id in enumerate(order, first)})
+
+        level_nodes, product_levels, sum_levels = [0, first], [0, 0], [0, 0]
+        product_children, sum_parents, sum_children, sum_weights = [], [], [], []
+        for node_id in order:
+            while levels[node_id] >= len(level_nodes) - 1:
+                level_nodes.append(level_nodes[-1])
+                product_levels.append(product_levels[-1])
+                sum_levels.append(sum_levels[-1])
+            kind, children = builder.nodes[node_id - first]
+            if kind == "product":
+                product_children.append([renumber[child] for child in children])
+                product_levels[-1] += 1
+            else:
+                for child, weight in children:
+                    sum_parents.append(renumber[node_id])
+                    sum_children.append(renumber[child])
+                    sum_weights.append(weight)
+                sum_levels[-1] += len(children)
+            level_nodes[-1] += 1
+        return cls(variables, cardinalities, problems, level_nodes, product_levels, product_children,
+                   sum_levels, sum_parents, sum_children, sum_weights, fingerprint)
+
+    def indicators(self, evidence):
+        """Indicator vector: 1 everywhere except the states ruled out by `evidence`"""
+        indicators = np.ones(self.indicator_count)
+        for variable, value in evidence.items():
+            if variable not in self.offsets:
+                raise ValueError(f"Node {variable} not in graph")
+            offset = self.offsets[variable]
+            card = self.cardinalities[self.variables.index(variable)]
+            indicators[offset:offset + card] = 0.0
+            indicators[offset + int(value)] = 1.0
+        return indicators
+
+    def forward(self, indicators):
+        """Value of every node; the last one is the circuit output"""
+        values = np.zeros(self.node_count)
+        values[:self.indicator_count] = indicators
+        for start, end, products, parents, children, weights in self._levels[1:]:
+            level = values[start:end]
+            level[:len(products)] = values[products].prod(axis=1)
+            level += np.bincount(parents - start, weights=weights * values[children], minlength=end - start)
+        return values
+
+    def backward(self, indicators):
+        """
+        Probability of the evidence and its derivative with respect to every
+        indicator, from one forward and one backward pass.
+        """
+        values = self.forward(indicators)
+        gradient = np.zeros(self.node_count)
+        gradient[-1] = 1.0
+        for start, end, products, parents, children, weights in reversed(self._levels[1:]):
+            if len(products):
+                # d product / d child is the other child
+                upstream = gradient[start:start + len(products), None] * values[products[:, ::-1]]
+                gradient += np.bincount(products.ravel(), weights=upstream.ravel(), minlength=self.node_count)
+            gradient += np.bincount(children, weights=weights * gradient[parents], minlength=self.node_count)
+        return values[-1], gradient[:self.indicator_count]
+
+    def problem_marginals(self, evidence):
+        """P(problem = 1 | evidence) for every root cause, in `problems` order"""
+        total, gradient = self.backward(self.indicators(evidence))
+        return gradient[self.problem_slots + 1] / total
+
+    def marginals(self, evidence):
+        """Posterior of every variable in the network from a single backward pass"""
+        total, gradient = self.backward(self.indicators(evidence))
+        return {variable: gradient[self.offsets[variable]:self.offsets[variable] + card] / total
+                for variable, card in zip(self.variables, self.cardinalities)}
+
+    def save(self, path):
+        metadata = {"variables": self.variables, "cardinalities": self.cardinalities,
+                    "problems": self.problems, "fingerprint": self.fingerprint, "format": self.FORMAT}
+        np.savez_compressed(path, metadata=np.array(json.dumps(metadata)),
+                            **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        """Circuit saved at `path`, or None when it was written in another layout"""
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata.get("format") != cls.FORMAT:
+                return None
+            arrays = {name: data[name] for name in cls.ARRAYS}
+        return cls(metadata["variables"], metadata["cardinalities"], metadata["problems"],
+                   fingerprint=metadata["fingerprint"], **arrays)
+
+
+class CircuitInference:
+    """
+    Inference backend with the interface of StartingInference that answers
+    queries from a compiled arithmetic circuit instead of VariableElimination.
+
+    With `cache_dir`, the compiled circuit is written to disk and reused while
+    the network fingerprint is unchanged.
+    """
+
+    def __init__(self, base, cache_dir=None, name=None):
+        self.model = base.model
+        self.problems = base.problems
+        self.problem_mapping = base.problem_mapping
+        self.circuit = None
+        fingerprint = model_fingerprint(self.model)
+        path = os.path.join(cache_dir, f"{name or type(base).__module__}.npz") if cache_dir else None
+        if path and os.path.exists(path):
+            circuit = ArithmeticCircuit.load(path)
+            if circuit is not None and circuit.fingerprint == fingerprint:
+                self.circuit = circuit
+        if self.circuit is None:
+            self.circuit = ArithmeticCircuit.compile(self.model, self.problems)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                self.circuit.save(path)
+
+    def infer_problem(self, evidence_dict):
+        marginals = self.circuit.problem_marginals(evidence_dict)
+        return {self.problem_mapping[problem]: float(probability)
+                for problem, probability in zip(self.problems, marginals)}
+
+
+def check_parity(base, circuit_inference, trials=200, seed=0, tolerance=1e-9):
+    """
+    Compares the circuit against pgmpy on random evidence sets.
+
+    Returns:
+        float: the largest absolute difference seen.
+    """
+    rng = np.random.default_rng(seed)
+    symptoms = [variable for variable in circuit_inference.circuit.variables if variable not in base.problems]
+    worst = 0.0
+    for _ in range(trials):
+        chosen = rng.choice(symptoms, size=rng.integers(0, len(symptoms) + 1), replace=False)
+        evidence = {str(symptom): bool(rng.integers(0, 2)) for symptom in chosen}
+        expected = base.infer_problem(evidence)
+        actual = circuit_inference.infer_problem(evidence)
+        worst = max(worst, max(abs(expected[label] - actual[label]) for label in expected))
+    if worst > tolerance:
+        raise AssertionError(f"Circuit differs from pgmpy by {worst}")
+    return worst
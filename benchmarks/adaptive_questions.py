@@ -0,0 +1,80 @@
+"""
+Average questions per session: rule tree against information-gain selection.
+
+Simulated users draw a root-cause configuration and their symptoms from each
+diagnostic network, then answer both conversations consistently.
+
+    python -m benchmarks.adaptive_questions [--sessions 2000]
+"""
+import argparse
+import json
+
+import numpy as np
+
+from compiled_network import get_compiled_network
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS
+from information_gain import get_selector
+from question_catalog import get_catalog
+
+
+def sample_user(network, rng):
+    """Symptom answers of one simulated user, plus their true root state"""
+    state = rng.choice(len(network.prior), p=network.prior)
+    answers = {}
+    for symptom, row in network.symptom_index.items():
+        answers[symptom] = bool(rng.random() < network.likelihood[row, 1, state])
+    return state, answers
+
+
+def rule_tree_questions(catalog, answers, rng):
+    node = catalog.tree
+    asked = {}
+    while node is not None and "fact" in node:
+        fact = node["fact"]
+        # Facts outside the network (e.g. hard_braking) get a coin flip
+        value = answers[fact] if fact in answers else bool(rng.random() < 0.5)
+        asked[fact] = value
+        node = node["yes" if value else "no"]
+    return asked
+
+
+def adaptive_questions(selector, answers):
+    asked = {}
+    symptom = selector.next_symptom(asked)
+    while symptom is not None:
+        asked[symptom] = answers[symptom]
+        symptom = selector.next_symptom(asked)
+    return asked
+
+
+def run(sessions=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+        network = get_compiled_network(diagnostic_type)
+        catalog = get_catalog(diagnostic_type)
+        selector = get_selector(diagnostic_type)
+        counts = {"rules": [], "adaptive": []}
+        truth = {"rules": [], "adaptive": []}
+        for _ in range(sessions):
+            state, answers = sample_user(network, rng)
+            for mode, asked in (("rules", rule_tree_questions(catalog, answers, rng)),
+                                ("adaptive", adaptive_questions(selector, answers))):
+                counts[mode].append(len(asked))
+                evidence = {fact: value for fact, value in asked.items() if fact in network.symptom_index}
+                truth[mode].append(network.posterior(evidence)[state])
+        results[diagnostic_type] = {
+            mode: {
+                "average_questions": round(float(np.mean(counts[mode])), 3),
+                "mean_posterior_of_true_cause": round(float(np.mean(truth[mode])), 3),
+            }
+            for mode in counts
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sessions), indent=2))
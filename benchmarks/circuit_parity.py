@@ -0,0 +1,63 @@
+"""
+Arithmetic-circuit backend against pgmpy VariableElimination: parity on random
+evidence sets, compile time, load time and per-query latency.
+
+    python -m benchmarks.circuit_parity [--trials 200] [--queries 500]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from arithmetic_circuit import ArithmeticCircuit, CircuitInference, check_parity
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS, INFERENCE_MODELS
+
+
+def _timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(trials=200, queries=500, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+            base = INFERENCE_MODELS[diagnostic_type]()
+            start = time.perf_counter()
+            circuit_inference = CircuitInference(base, cache_dir, diagnostic_type)
+            compile_ms = (time.perf_counter() - start) * 1000
+            path = os.path.join(cache_dir, f"{diagnostic_type}.npz")
+            start = time.perf_counter()
+            ArithmeticCircuit.load(path)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            symptoms = [v for v in circuit_inference.circuit.variables if v not in base.problems]
+            evidence = {str(s): bool(rng.integers(0, 2))
+                        for s in rng.choice(symptoms, size=len(symptoms) // 2, replace=False)}
+            circuit = circuit_inference.circuit
+            results[diagnostic_type] = {
+                "max_abs_error": check_parity(base, circuit_inference, trials, seed),
+                "compile_ms": round(compile_ms, 3),
+                "load_ms": round(load_ms, 3),
+                "file_bytes": os.path.getsize(path),
+                "sum_nodes": circuit.sum_count,
+                "product_nodes": circuit.product_count,
+                "edges": len(circuit.sum_children) + 2 * circuit.product_count,
+                "pgmpy_query_ms": round(_timed(lambda: base.infer_problem(evidence), queries // 10 or 1), 4),
+                "circuit_query_ms": round(_timed(lambda: circuit_inference.infer_problem(evidence), queries), 4),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.trials, args.queries), indent=2))
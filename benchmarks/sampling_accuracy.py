@@ -0,0 +1,66 @@
+"""
+Likelihood-weighting backend against exact inference: absolute error, how
+often the exact value falls inside the reported bounds, samples drawn and
+latency, for a few tolerances.
+
+    python -m benchmarks.sampling_accuracy [--queries 50] [--tolerances 0.02 0.01]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from arithmetic_circuit import CircuitInference
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS, INFERENCE_MODELS
+from sampling_inference import SamplingInference
+
+
+def random_evidence(symptoms, rng):
+    chosen = rng.choice(symptoms, size=rng.integers(0, len(symptoms) // 2 + 1), replace=False)
+    return {str(symptom): bool(rng.integers(0, 2)) for symptom in chosen}
+
+
+def run(queries=50, tolerances=(0.02, 0.01), seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+        base = INFERENCE_MODELS[diagnostic_type]()
+        exact = CircuitInference(base)
+        symptoms = [v for v in exact.circuit.variables if v not in base.problems]
+        evidence_sets = [random_evidence(symptoms, rng) for _ in range(queries)]
+
+        start = time.perf_counter()
+        for evidence in evidence_sets:
+            base.infer_problem(evidence)
+        pgmpy_ms = (time.perf_counter() - start) / queries * 1000
+
+        results[diagnostic_type] = {"pgmpy_query_ms": round(pgmpy_ms, 3)}
+        for tolerance in tolerances:
+            sampler = SamplingInference(base, tolerance=tolerance, seed=seed, cache_size=0)
+            errors, covered, drawn, elapsed = [], [], [], 0.0
+            for evidence in evidence_sets:
+                truth = exact.infer_problem(evidence)
+                start = time.perf_counter()
+                estimate = sampler.query(evidence)
+                elapsed += time.perf_counter() - start
+                drawn.append(estimate["samples"])
+                for label, value in truth.items():
+                    errors.append(abs(estimate["probabilities"][label] - value))
+                    covered.append(estimate["lower"][label] <= value <= estimate["upper"][label])
+            results[diagnostic_type][f"tolerance_{tolerance}"] = {
+                "mean_abs_error": round(float(np.mean(errors)), 5),
+                "max_abs_error": round(float(np.max(errors)), 5),
+                "bound_coverage": round(float(np.mean(covered)), 3),
+                "mean_samples": int(np.mean(drawn)),
+                "query_ms": round(elapsed / queries * 1000, 3),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[0.02, 0.01])
+    args = parser.parse_args()
+    print(json.dumps(run(args.queries, args.tolerances), indent=2))
@@ -0,0 +1,123 @@
+"""
+Concurrent answers through the ASGI app: correctness of per-session locking
+and idempotency keys, and answer throughput across sessions.
+
+Correctness: every turn of every session is sent several times at once with
+the same Idempotency-Key (a client retrying), so each turn must be applied
+exactly once and all copies must get the same response. The engine evidence
+must match the recorded turns at every step.
+
+Throughput: answers per second when sessions are driven one after another
+against all of them at once; the per-session locks must not serialize
+different sessions.
+
+    python -m benchmarks.session_concurrency [--sessions 50] [--retries 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_concurrency_")
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(_tmp, 'bench.db')}")
+os.environ.setdefault("SESSION_SPILL_PATH", ":memory:")
+os.environ.setdefault("SESSION_JOURNAL_PATH", os.path.join(_tmp, "journal.log"))
+# The benchmark drives one user as fast as it can
+os.environ.setdefault("RATE_LIMIT_USER_PER_MINUTE", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_MINUTE", "0")
+os.environ.setdefault("ADMISSION_MAX_QUEUE_MS", "1e9")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+
+async def login(client):
+    await client.post("/register", json={"email": "bench@example.com", "name": "Bench", "phone": "0",
+                                         "password": "bench"})
+    response = await client.post("/token", data={"username": "bench@example.com", "password": "bench"})
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+
+async def start(client, diagnostic_type):
+    response = await client.post("/api/diagnostic/start?prefetch=0", json={"diagnostic_type": diagnostic_type})
+    return response.json()["session_id"]
+
+
+async def converse(client, session_id, rng, retries, errors):
+    """Answers until the diagnosis, sending each turn `retries` times at once; returns the turns"""
+    turns = 0
+    while True:
+        answer = rng.choice(("yes", "no"))
+        key = f"{session_id}-{turns}"
+        responses = await asyncio.gather(*[
+            client.post(f"/api/diagnostic/{session_id}/answer?prefetch=0", json={"answer": answer},
+                        headers={"Idempotency-Key": key})
+            for _ in range(retries)
+        ])
+        turns += 1
+        bodies = [response.json() for response in responses]
+        if any(response.status_code != 200 for response in responses):
+            errors.append({"session_id": session_id, "turn": turns, "status": [r.status_code for r in responses]})
+            return turns
+        if any(body != bodies[0] for body in bodies):
+            errors.append({"session_id": session_id, "turn": turns, "error": "retries got different responses"})
+        if "diagnostic_result" in bodies[0]:
+            return turns
+        session = main.sessions[session_id]
+        if len(session.turns) != turns or len(session.engine.evidence_list) != turns:
+            errors.append({"session_id": session_id, "turn": turns, "recorded": len(session.turns),
+                           "evidence": len(session.engine.evidence_list)})
+
+
+async def drive(client, session_ids, retries, concurrent, seed):
+    errors = []
+    rngs = {session_id: random.Random(f"{seed}-{session_id}") for session_id in session_ids}
+    started = time.perf_counter()
+    if concurrent:
+        turns = await asyncio.gather(*[converse(client, session_id, rngs[session_id], retries, errors)
+                                       for session_id in session_ids])
+    else:
+        turns = [await converse(client, session_id, rngs[session_id], retries, errors)
+                 for session_id in session_ids]
+    elapsed = time.perf_counter() - started
+    return {
+        "sessions": len(session_ids),
+        "answers": sum(turns),
+        "seconds": round(elapsed, 3),
+        "answers_per_second": round(sum(turns) / elapsed, 1),
+        "errors": errors[:10],
+        "error_count": len(errors),
+    }
+
+
+async def run(sessions=50, retries=3, seed=0):
+    await main.restore_journaled_sessions()
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await login(client)
+            types = list(main.DIAGNOSTIC_SYSTEMS)
+            results = {}
+            for name, concurrent in (("sequential", False), ("concurrent", True)):
+                session_ids = [await start(client, types[position % len(types)]) for position in range(sessions)]
+                results[name] = await drive(client, session_ids, retries, concurrent, seed)
+            results["speedup"] = round(results["concurrent"]["answers_per_second"]
+                                       / results["sequential"]["answers_per_second"], 3)
+            results["idempotent_replays"] = main.answer_responses.replays
+            return results
+    finally:
+        await main.close_journal()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main.Base.metadata.create_all(bind=main.engine)
+    print(json.dumps(asyncio.run(run(args.sessions, args.retries, args.seed)), indent=2))
@@ -0,0 +1,108 @@
+"""
+Bytes per active session: the previous dict/list representation against the
+slot-based DiagnosticSession with answers packed as a bitset per turn.
+
+    python -m benchmarks.session_memory [--sessions 5000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("DB_URL", "sqlite://")
+os.environ.setdefault("SESSION_SPILL_PATH", ":memory:")
+os.environ.setdefault("SESSION_JOURNAL_PATH", os.path.join(tempfile.gettempdir(), "bench_session_journal.log"))
+
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS, new_engine  # noqa: E402
+from question_catalog import get_catalog  # noqa: E402
+from main import DiagnosticSession  # noqa: E402
+
+
+class LegacyDiagnosticSession:
+    """Representation used before the compact session model"""
+
+    def __init__(self):
+        self.engine = None
+        self.evidence_list = []
+        self.completed = False
+        self.conversation = []
+
+
+def random_path(catalog, rng):
+    """Answers and facts of a random unfinished walk down the rule tree"""
+    path = []
+    node = catalog.tree
+    while True:
+        answer = rng.choice(("yes", "no"))
+        child = node[answer]
+        if child is None or "fact" not in child:
+            return path
+        path.append((node["fact"], node["question"], answer))
+        node = child
+
+
+def build_legacy(diagnostic_type, path):
+    session = LegacyDiagnosticSession()
+    for fact, question, answer in path:
+        session.evidence_list.append((fact, answer == "yes"))
+        session.conversation.append({"question": question, "answer": answer})
+    return session
+
+
+def build_compact(diagnostic_type, path):
+    session = DiagnosticSession(diagnostic_type)
+    catalog = session.catalog
+    for fact, question, answer in path:
+        if answer == "yes":
+            session.replies |= 1 << len(session.turns)
+        session.turns += bytes((catalog.fact_id(fact),))
+    return session
+
+
+def measure(builder, paths):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [builder(diagnostic_type, path) for diagnostic_type, path in paths]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return allocated / len(paths)
+
+
+def measure_engines(count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [new_engine(diagnostic_type) for diagnostic_type in list(DIAGNOSTIC_SYSTEMS) * count]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return allocated / (count * len(DIAGNOSTIC_SYSTEMS))
+
+
+def run(sessions=5000, seed=0):
+    rng = random.Random(seed)
+    types = list(DIAGNOSTIC_SYSTEMS)
+    for diagnostic_type in types:
+        get_catalog(diagnostic_type)
+    paths = [(diagnostic_type, random_path(get_catalog(diagnostic_type), rng))
+             for diagnostic_type in (rng.choice(types) for _ in range(sessions))]
+    legacy = measure(build_legacy, paths)
+    compact = measure(build_compact, paths)
+    return {
+        "sessions": sessions,
+        "mean_answers": sum(len(path) for _, path in paths) / sessions,
+        "legacy_bytes_per_session": round(legacy, 1),
+        "compact_bytes_per_session": round(compact, 1),
+        "engine_bytes_per_session": round(measure_engines(20), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=5000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sessions), indent=2))
@@ -0,0 +1,229 @@
+"""
+Latency benchmarks of the diagnostic pipeline, compared against a stored baseline.
+
+Cases, for each diagnostic type:
+  construct.<type>           building StartingInference with the CPDs in the code
+  infer_problem.<type>       StartingInference.infer_problem over the evidence
+                             of every complete path through the rule tree
+  engine_answer.<type>.ask   process_answer plus engine.run() on a served
+                             engine, for answers that lead to another question
+  engine_answer.<type>.diagnose  the same, for the answer that reaches the diagnosis
+  conversation.<type>        a whole start -> answers -> diagnosis conversation
+                             through the ASGI app in-process, on SQLite
+plus asgi_request.start and asgi_request.answer over all conversations.
+
+Engines and conversations follow the rule tree paths, so all of them
+must finish. A path that raises or gets an error response is a failure:
+it is listed under "errors", no baseline is saved and the exit status
+is 2. With a baseline, a case is a regression when its median is more
+than --threshold slower, and the exit status is 1. Timings depend on the
+machine: refresh the baseline with --save-baseline where the comparison runs.
+
+    python -m benchmarks.suite [--repeat 5] [--baseline benchmarks/baseline.json]
+                               [--threshold 0.25] [--save-baseline] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_suite_")
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(_tmp, 'bench.db')}")
+os.environ.setdefault("SESSION_SPILL_PATH", ":memory:")
+os.environ.setdefault("SESSION_JOURNAL_PATH", os.path.join(_tmp, "journal.log"))
+# The benchmark drives one user as fast as it can
+os.environ.setdefault("RATE_LIMIT_USER_PER_MINUTE", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_MINUTE", "0")
+os.environ.setdefault("ADMISSION_MAX_QUEUE_MS", "1e9")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS, INFERENCE_MODELS, new_engine  # noqa: E402
+from question_catalog import get_catalog  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def paths_of(diagnostic_type):
+    """[(fact, answer), ...] of every path through the rule tree that reaches a diagnosis"""
+    return [path for path, _ in get_catalog(diagnostic_type).leaf_paths()]
+
+
+def summarize(seconds):
+    ordered = sorted(seconds)
+    if not ordered:
+        return {"n": 0}
+    return {
+        "n": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "median_ms": round(statistics.median(ordered) * 1000, 4),
+        "p90_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))] * 1000, 4),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+    }
+
+
+def bench_construct(diagnostic_type, repeat):
+    inference_class = INFERENCE_MODELS[diagnostic_type]
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        inference_class()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def bench_infer_problem(diagnostic_type, repeat):
+    inference = INFERENCE_MODELS[diagnostic_type]()
+    nodes = set(inference.model.nodes())
+    evidence_sets = [{}] + [{fact: answer == "yes" for fact, answer in path if fact in nodes}
+                            for path in paths_of(diagnostic_type)]
+    seconds = []
+    for _ in range(repeat):
+        for evidence in evidence_sets:
+            started = time.perf_counter()
+            inference.infer_problem(evidence)
+            seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def bench_engine_answers(diagnostic_type, repeat, errors):
+    """Seconds per answer, split into answers followed by a question and answers that finish"""
+    ask, diagnose = [], []
+    for _ in range(repeat):
+        for path in paths_of(diagnostic_type):
+            engine = new_engine(diagnostic_type, "rules")
+            for _, answer in path:
+                started = time.perf_counter()
+                engine.process_answer(answer)
+                try:
+                    engine.run()
+                except Exception as exc:
+                    errors.append({"case": f"engine_answer.{diagnostic_type}",
+                                   "answers": [answer for _, answer in path], "error": repr(exc)})
+                    break
+                elapsed = time.perf_counter() - started
+                (diagnose if engine.diagnostic_complete else ask).append(elapsed)
+    return ask, diagnose
+
+
+async def bench_conversations(repeat, errors):
+    await main.restore_journaled_sessions()
+    # Failures come back as 500 responses, as a real client would see them
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    conversations = {diagnostic_type: [] for diagnostic_type in DIAGNOSTIC_SYSTEMS}
+    requests = {"start": [], "answer": []}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/register", json={"email": "bench@example.com", "name": "Bench", "phone": "0",
+                                                 "password": "bench"})
+            response = await client.post("/token", data={"username": "bench@example.com", "password": "bench"})
+            client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+            for _ in range(repeat):
+                for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+                    for path in paths_of(diagnostic_type):
+                        conversation_started = started = time.perf_counter()
+                        response = await client.post("/api/diagnostic/start",
+                                                      json={"diagnostic_type": diagnostic_type})
+                        requests["start"].append(time.perf_counter() - started)
+                        session_id = response.json()["session_id"]
+                        for _, answer in path:
+                            started = time.perf_counter()
+                            response = await client.post(f"/api/diagnostic/{session_id}/answer",
+                                                         json={"answer": answer})
+                            requests["answer"].append(time.perf_counter() - started)
+                            if response.status_code != 200:
+                                break
+                        if response.status_code != 200 or "diagnostic_result" not in response.json():
+                            errors.append({"case": f"conversation.{diagnostic_type}",
+                                           "answers": [answer for _, answer in path],
+                                           "error": f"{response.status_code} {response.text[:200]}"})
+                            continue
+                        conversations[diagnostic_type].append(time.perf_counter() - conversation_started)
+    finally:
+        await main.close_journal()
+    return conversations, requests
+
+
+def run(repeat=5):
+    results = {}
+    # Paths the pipeline fails on; any of them fails the run
+    errors = []
+    for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+        results[f"construct.{diagnostic_type}"] = summarize(bench_construct(diagnostic_type, repeat))
+        results[f"infer_problem.{diagnostic_type}"] = summarize(bench_infer_problem(diagnostic_type, repeat))
+        ask, diagnose = bench_engine_answers(diagnostic_type, repeat, errors)
+        results[f"engine_answer.{diagnostic_type}.ask"] = summarize(ask)
+        results[f"engine_answer.{diagnostic_type}.diagnose"] = summarize(diagnose)
+    main.Base.metadata.create_all(bind=main.engine)
+    conversations, requests = asyncio.run(bench_conversations(repeat, errors))
+    for diagnostic_type, seconds in conversations.items():
+        results[f"conversation.{diagnostic_type}"] = summarize(seconds)
+    for endpoint, seconds in requests.items():
+        results[f"asgi_request.{endpoint}"] = summarize(seconds)
+    return {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processor": platform.processor() or platform.machine()},
+        "repeat": repeat,
+        "results": results,
+        "errors": errors[:20],
+        "error_count": len(errors),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Median of each case against the baseline; `ratio` > 1 is slower"""
+    cases = {}
+    for name, current in results["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None or not current["n"]:
+            continue
+        ratio = current["median_ms"] / previous["median_ms"] if previous["median_ms"] else float("inf")
+        cases[name] = {
+            "baseline_median_ms": previous["median_ms"],
+            "median_ms": current["median_ms"],
+            "ratio": round(ratio, 3),
+            "status": "regression" if ratio > 1 + threshold else "improvement" if ratio < 1 - threshold else "ok",
+        }
+    return {
+        "threshold": threshold,
+        # Ratios between different machines say little
+        "same_machine": results["machine"] == baseline.get("machine"),
+        "regressions": sorted(name for name, case in cases.items() if case["status"] == "regression"),
+        "missing": sorted(set(baseline["results"]) - set(results["results"])),
+        "cases": cases,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    if report["error_count"]:
+        print(json.dumps(report, indent=2))
+        sys.exit(2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+            baseline_file.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            report["comparison"] = compare(report, json.load(baseline_file), args.threshold)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+    print(text)
+    if report.get("comparison", {}).get("regressions"):
+        sys.exit(1)
@@ -10,6 +10,18 @@ logging.getLogger("experta.watchers").setLevel(logging.ERROR)
 
 
 class StartingInference:
+    # Root causes reported by infer_problem, with their user-facing names
+    problems = ['BrakeEffectiveness', 'ParkingBrake', 'WheelResistance',
+                'BrakePadOrRotorIssue', 'BrakeBehavior']
+
+    problem_mapping = {
+        'BrakeEffectiveness': 'Issues with braking effectiveness',
+        'ParkingBrake': 'Parking brake issues',
+        'WheelResistance': 'Wheel resistance issues',
+        'BrakePadOrRotorIssue': 'Brake pad or rotor issues',
+        'BrakeBehavior': 'Braking behavior issues'
+    }
+
     def __init__(self):
         self.model = self._build_model()
         self.inference = VariableElimination(self.model)
@@ -138,24 +150,13 @@ class StartingInference:
         Returns:
             dict: Probabilities of each general problem.
         """
-        problems = ['BrakeEffectiveness', 'ParkingBrake', 'WheelResistance',
-                    'BrakePadOrRotorIssue', 'BrakeBehavior']
-
         probabilities = {}
 
-        for problem in problems:
+        for problem in self.problems:
             result = self.inference.query(variables=[problem], evidence=evidence_dict)
             probabilities[problem] = result.values[1]
 
-        problem_mapping = {
-            'BrakeEffectiveness': 'Issues with braking effectiveness',
-            'ParkingBrake': 'Parking brake issues',
-            'WheelResistance': 'Wheel resistance issues',
-            'BrakePadOrRotorIssue': 'Brake pad or rotor issues',
-            'BrakeBehavior': 'Braking behavior issues'
-        }
-
-        mapped_probabilities = {problem_mapping[problem]: prob for problem, prob in probabilities.items()}
+        mapped_probabilities = {self.problem_mapping[problem]: prob for problem, prob in probabilities.items()}
 
         return mapped_probabilities
 
@@ -173,6 +174,8 @@ class BrakeDiagnostic(KnowledgeEngine):
         self.diagnostic_complete = False
         self.diagnostic_result = None
         self.diagnostic_message = None
+        # Shared inference model; a fresh one is built when left unset
+        self.inference = None
 
     @DefFacts()
     def initial_fact(self):
@@ -192,7 +195,9 @@ class BrakeDiagnostic(KnowledgeEngine):
             self.evidence_list.append((self.current_fact, answer == 'yes'))
 
     def generate_diagnostic(self, evidence_dict, message=""):
-        inference_engine = StartingInference()
+        inference_engine = self.inference or StartingInference()
+        # Facts without a node in the network carry no probabilistic evidence
+        evidence_dict = {fact: value for fact, value in evidence_dict.items() if fact in inference_engine.model}
         probabilities = inference_engine.infer_problem(evidence_dict)
         most_probable_problem = max(probabilities, key=probabilities.get)
         
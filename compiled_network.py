@@ -0,0 +1,180 @@
+import copy
+import itertools
+
+import numpy as np
+
+from diagnostic_systems import current_version
+
+
+class CompiledNetwork:
+    """
+    Exact joint distribution over the root causes of a diagnostic network.
+
+    The networks in this project have every symptom hanging directly off the
+    root causes (`StartingInference.problems`), so the joint over the roots has
+    only 2**k states. It is stored as a prior vector over those states and one
+    likelihood row per symptom state, which turns any query into a handful of
+    element-wise products over small arrays.
+    """
+
+    def __init__(self, model, problems):
+        self.problems = list(problems)
+        problem_index = {problem: position for position, problem in enumerate(self.problems)}
+        cards = [int(model.get_cardinality(problem)) for problem in self.problems]
+        # states[s, j] is the state of problem j in joint configuration s
+        self.states = np.array(list(itertools.product(*[range(card) for card in cards])), dtype=np.int64)
+        self.prior = np.ones(len(self.states))
+        self.symptoms = []
+        likelihoods = []
+        for cpd in model.get_cpds():
+            parents = list(cpd.variables[1:])
+            missing = [parent for parent in parents if parent not in problem_index]
+            if missing:
+                raise ValueError(f"{cpd.variable} depends on {missing}, which are not root causes")
+            table = self._expand(cpd, parents, problem_index)
+            if cpd.variable in problem_index:
+                own_state = self.states[:, problem_index[cpd.variable]]
+                self.prior *= table[own_state, np.arange(len(self.states))]
+            else:
+                self.symptoms.append(cpd.variable)
+                likelihoods.append(table)
+        self.symptom_index = {symptom: position for position, symptom in enumerate(self.symptoms)}
+        # likelihood[i, v, s] = P(symptom i = v | root configuration s)
+        width = max(table.shape[0] for table in likelihoods)
+        self.likelihood = np.zeros((len(likelihoods), width, len(self.states)))
+        for position, table in enumerate(likelihoods):
+            self.likelihood[position, :table.shape[0]] = table
+        # problem_indicator[s, j] is 1 when problem j is present in configuration s
+        self.problem_indicator = (self.states == 1).astype(float)
+
+    def _expand(self, cpd, parents, problem_index):
+        """CPD values as a (variable states, joint root states) table"""
+        values = cpd.get_values()
+        if not parents:
+            return np.repeat(values, len(self.states), axis=1)
+        columns = np.zeros(len(self.states), dtype=np.int64)
+        for parent, card in zip(parents, cpd.cardinality[1:]):
+            columns = columns * int(card) + self.states[:, problem_index[parent]]
+        return values[:, columns]
+
+    def with_prior_odds(self, odds):
+        """
+        Copy of the network with the prior odds of some root causes multiplied
+        by `odds` (problem -> factor). Only the prior vector is rebuilt; the
+        likelihood tables are shared with this network.
+        """
+        variant = copy.copy(self)
+        weights = np.ones(len(self.states))
+        for problem, factor in odds.items():
+            weights *= np.where(self.states[:, self.problems.index(problem)] == 1, factor, 1.0)
+        prior = self.prior * weights
+        variant.prior = prior / prior.sum()
+        return variant
+
+    def evidence_weights(self, evidence):
+        """Unnormalized likelihood of `evidence` for every joint root state"""
+        weights = np.ones(len(self.states))
+        for variable, value in evidence.items():
+            value = int(value)
+            if variable in self.symptom_index:
+                weights *= self.likelihood[self.symptom_index[variable], value]
+            elif variable in self.problems:
+                weights *= self.states[:, self.problems.index(variable)] == value
+            else:
+                raise ValueError(f"Node {variable} not in network")
+        return weights
+
+    def posterior(self, evidence):
+        """Posterior over the joint root states given `evidence`"""
+        joint = self.prior * self.evidence_weights(evidence)
+        return joint / joint.sum()
+
+    def marginals(self, evidence):
+        """P(problem = 1 | evidence) for every root cause, in `problems` order"""
+        return self.posterior(evidence) @ self.problem_indicator
+
+    def top_configurations(self, evidence, k):
+        """
+        The k most probable joint root-cause configurations given `evidence`
+        (the MPE over the roots and its runners-up).
+
+        Unobserved symptoms have no children, so they sum out to one and the
+        max-product over the roots is the per-state product of prior and
+        evidence likelihoods. k-best selection is a partial sort of those
+        products, so the cost is linear in the number of states for any k.
+
+        Returns:
+            list: (configuration as a 0/1 row over `problems`, posterior probability), best first.
+        """
+        posterior = self.posterior(evidence)
+        k = min(k, len(posterior))
+        if k <= 0:
+            return []
+        best = np.argpartition(-posterior, k - 1)[:k]
+        best = best[np.argsort(-posterior[best], kind="stable")]
+        return [(self.states[state], float(posterior[state])) for state in best]
+
+    def lookahead(self, evidence, symptoms):
+        """
+        Root-cause marginals for each symptom in `symptoms` under each of its
+        answers, in a single vectorized pass.
+
+        Returns:
+            tuple: (answer probabilities with shape (n, values),
+            marginals with shape (n, values, problems)), where n is
+            len(symptoms) and values the widest symptom cardinality.
+        """
+        posterior = self.posterior(evidence)
+        rows = np.array([self.symptom_index[symptom] for symptom in symptoms], dtype=np.int64)
+        joint = self.likelihood[rows] * posterior
+        answer_probability = joint.sum(axis=-1)
+        marginals = (joint @ self.problem_indicator) / np.where(answer_probability > 0, answer_probability, 1.0)[..., None]
+        return answer_probability, marginals
+
+    def attribution(self, evidence):
+        """
+        Leave-one-out contribution of each evidence item to every root cause.
+
+        The contribution of item e to problem r is the log-likelihood ratio
+        log P(e | r=1, E\\e) - log P(e | r=0, E\\e), which equals the change in the
+        log posterior odds of r caused by adding e last. All items are removed
+        at once with prefix/suffix sums of the log-likelihood rows, so no extra
+        inference query is needed.
+
+        Returns:
+            tuple: (evidence variables, array with shape (items, problems)).
+        """
+        variables = list(evidence)
+        if not variables:
+            return variables, np.zeros((0, len(self.problems)))
+        with np.errstate(divide="ignore"):
+            log_rows = np.log(np.array([self.evidence_weights({variable: evidence[variable]})
+                                        for variable in variables]))
+            log_prior = np.log(self.prior)
+        zero = np.zeros((1, len(self.states)))
+        prefix = np.vstack([zero, np.cumsum(log_rows, axis=0)])
+        suffix = np.vstack([np.cumsum(log_rows[::-1], axis=0)[::-1], zero])
+        full = log_prior + prefix[-1]
+        without = log_prior + prefix[:-1] + suffix[1:]
+        return variables, self._log_odds(full[None, :]) - self._log_odds(without)
+
+    def _log_odds(self, log_joint):
+        """Log posterior odds of every problem from rows of unnormalized log joints"""
+        present = self.problem_indicator.astype(bool)
+        odds = []
+        for column in range(len(self.problems)):
+            with_problem = np.logaddexp.reduce(log_joint[:, present[:, column]], axis=1)
+            without_problem = np.logaddexp.reduce(log_joint[:, ~present[:, column]], axis=1)
+            odds.append(with_problem - without_problem)
+        return np.stack(odds, axis=-1)
+
+
+def get_compiled_network(diagnostic_type, version=None):
+    """Compiled form of the shared inference model of a diagnostic type in a model version"""
+    version = version or current_version()
+
+    def build():
+        inference = version.get(diagnostic_type)
+        return CompiledNetwork(inference.model, inference.problems)
+
+    return version.cached(("compiled", diagnostic_type), build)
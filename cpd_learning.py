@@ -0,0 +1,301 @@
+"""
+Incremental CPD learning from finished diagnostic sessions.
+
+Stored conversations only contain symptom answers; the root causes are never
+observed, so the CPDs are fitted with incremental EM. Every batch of new
+records runs one E-step under the current parameters, adds its expected
+counts to the sufficient statistics (counts per CPD cell) and re-estimates
+the CPDs from them (M-step). The hand-written CPDs act as a Dirichlet prior
+of CPD_PRIOR_STRENGTH pseudo-sessions, so a handful of records cannot undo
+them. Each learner keeps the id of the last record it has seen and later runs
+only read newer rows.
+
+The result is written as a versioned JSON artifact per diagnostic type
+({type}-v{version}.json) that get_inference loads when CPD_ARTIFACT_DIR is set.
+
+    python -m cpd_learning [--batch-size 500]
+"""
+import glob
+import json
+import os
+import re
+
+import numpy as np
+from pgmpy.factors.discrete import TabularCPD
+from pgmpy.inference import VariableElimination
+
+from compiled_network import CompiledNetwork
+
+CPD_ARTIFACT_DIR = os.getenv("CPD_ARTIFACT_DIR")
+CPD_PRIOR_STRENGTH = float(os.getenv("CPD_PRIOR_STRENGTH", "50"))
+CPD_LEARNING_BATCH = int(os.getenv("CPD_LEARNING_BATCH", "500"))
+
+
+def _parent_columns(cpd, states, problem_index):
+    """Parent configuration column of `cpd` for every joint root state"""
+    columns = np.zeros(len(states), dtype=np.int64)
+    for parent, card in zip(cpd.variables[1:], cpd.cardinality[1:]):
+        columns = columns * int(card) + states[:, problem_index[parent]]
+    return columns
+
+
+def build_cpds(model, tables):
+    """TabularCPDs with the structure of `model` and the values in `tables` (variable -> 2D array)"""
+    cpds = []
+    for cpd in model.get_cpds():
+        parents = list(cpd.variables[1:])
+        cpds.append(TabularCPD(
+            cpd.variable, int(cpd.cardinality[0]), np.asarray(tables[cpd.variable]),
+            evidence=parents or None,
+            evidence_card=[int(card) for card in cpd.cardinality[1:]] or None,
+        ))
+    return cpds
+
+
+def with_tables(model, tables):
+    """Copy of `model` with its CPD values replaced"""
+    learned = model.copy()
+    learned.remove_cpds(*learned.get_cpds())
+    learned.add_cpds(*build_cpds(model, tables))
+    learned.check_model()
+    return learned
+
+
+class CPDLearner:
+    """Sufficient statistics and current CPD estimate for one diagnostic type"""
+
+    def __init__(self, diagnostic_type, inference, artifact=None, prior_strength=CPD_PRIOR_STRENGTH):
+        self.diagnostic_type = diagnostic_type
+        self.base_model = inference.model
+        self.problems = list(inference.problems)
+        self.prior_strength = prior_strength
+        base = {cpd.variable: cpd.get_values() for cpd in self.base_model.get_cpds()}
+        self.pseudo_counts = {variable: values * prior_strength for variable, values in base.items()}
+        self.counts = {variable: np.zeros_like(values) for variable, values in base.items()}
+        self.version = 0
+        self.last_record_id = 0
+        self.records = 0
+        if artifact is not None:
+            self.version = artifact["version"]
+            self.last_record_id = artifact["last_record_id"]
+            self.records = artifact["records"]
+            for variable, counts in artifact["counts"].items():
+                self.counts[variable] = np.asarray(counts, dtype=float)
+        self._refresh()
+
+    def _refresh(self):
+        """M-step: CPDs from the prior plus the expected counts, and the compiled network for the next E-step"""
+        self.tables = {}
+        for variable, counts in self.counts.items():
+            cells = counts + self.pseudo_counts[variable]
+            self.tables[variable] = cells / cells.sum(axis=0, keepdims=True)
+        self.model = with_tables(self.base_model, self.tables)
+        self.network = CompiledNetwork(self.model, self.problems)
+        problem_index = {problem: position for position, problem in enumerate(self.problems)}
+        self.columns = {cpd.variable: _parent_columns(cpd, self.network.states, problem_index)
+                        for cpd in self.model.get_cpds()}
+
+    def observe(self, evidence_rows):
+        """
+        One incremental EM step over a batch of sessions.
+
+        Args:
+            evidence_rows: list of {symptom: bool} dicts, one per session.
+        """
+        network = self.network
+        if not evidence_rows:
+            return
+        observed = np.full((len(evidence_rows), len(network.symptoms)), -1, dtype=np.int64)
+        for row, evidence in enumerate(evidence_rows):
+            for symptom, value in evidence.items():
+                observed[row, network.symptom_index[symptom]] = int(value)
+
+        # E-step: posterior over the joint root states of every session
+        with np.errstate(divide="ignore"):
+            log_joint = np.tile(np.log(network.prior), (len(evidence_rows), 1))
+            log_likelihood = np.log(network.likelihood)
+        for position in range(len(network.symptoms)):
+            mask = observed[:, position] >= 0
+            log_joint[mask] += log_likelihood[position, observed[mask, position]]
+        log_joint -= log_joint.max(axis=1, keepdims=True)
+        posterior = np.exp(log_joint)
+        posterior /= posterior.sum(axis=1, keepdims=True)
+
+        state_mass = posterior.sum(axis=0)
+        for position, problem in enumerate(self.problems):
+            counts = self.counts[problem]
+            own_state = network.states[:, position]
+            for value in range(counts.shape[0]):
+                counts[value] += np.bincount(self.columns[problem], weights=state_mass * (own_state == value),
+                                             minlength=counts.shape[1])
+        for symptom, position in network.symptom_index.items():
+            counts = self.counts[symptom]
+            for value in range(counts.shape[0]):
+                mass = posterior[observed[:, position] == value].sum(axis=0)
+                counts[value] += np.bincount(self.columns[symptom], weights=mass, minlength=counts.shape[1])
+
+        self.records += len(evidence_rows)
+        self._refresh()
+
+    def artifact(self):
+        return {
+            "format": 1,
+            "diagnostic_type": self.diagnostic_type,
+            "version": self.version,
+            "last_record_id": self.last_record_id,
+            "records": self.records,
+            "prior_strength": self.prior_strength,
+            "counts": {variable: counts.tolist() for variable, counts in self.counts.items()},
+            "cpds": {
+                cpd.variable: {
+                    "parents": list(cpd.variables[1:]),
+                    "values": self.tables[cpd.variable].tolist(),
+                }
+                for cpd in self.base_model.get_cpds()
+            },
+        }
+
+
+def latest_artifact(directory, diagnostic_type):
+    """Path of the newest artifact of a diagnostic type, or None"""
+    versions = []
+    for path in glob.glob(os.path.join(directory, f"{diagnostic_type}-v*.json")):
+        match = re.search(r"-v(\d+)\.json$", path)
+        if match:
+            versions.append((int(match.group(1)), path))
+    return max(versions)[1] if versions else None
+
+
+def load_artifact(path):
+    with open(path, encoding="utf-8") as artifact_file:
+        return json.load(artifact_file)
+
+
+def save_artifact(directory, learner):
+    """Writes the learner state as the next version and returns its path"""
+    learner.version += 1
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{learner.diagnostic_type}-v{learner.version}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as artifact_file:
+        json.dump(learner.artifact(), artifact_file)
+    os.replace(tmp_path, path)
+    return path
+
+
+def apply_tables(inference, tables):
+    """Replaces some CPD values (variable -> 2D table) of a StartingInference, keeping its structure"""
+    values = {cpd.variable: cpd.get_values() for cpd in inference.model.get_cpds()}
+    values.update(tables)
+    inference.model = with_tables(inference.model, values)
+    inference.inference = VariableElimination(inference.model)
+    return inference
+
+
+def apply_artifact(inference, artifact):
+    """Loads learned CPD values into a StartingInference, keeping its network structure"""
+    tables = {}
+    for cpd in inference.model.get_cpds():
+        learned = artifact["cpds"][cpd.variable]
+        if learned["parents"] != list(cpd.variables[1:]):
+            raise ValueError(f"Artifact structure for {cpd.variable} does not match the network")
+        tables[cpd.variable] = learned["values"]
+    apply_tables(inference, tables)
+    inference.cpd_version = artifact["version"]
+    return inference
+
+
+def session_evidence(conversation, question_index):
+    """
+    Diagnostic type and symptom evidence of a stored conversation.
+
+    Returns:
+        tuple: (diagnostic type or None, {fact: bool}).
+    """
+    diagnostic_type = None
+    evidence = {}
+    for turn in conversation:
+        located = question_index.get(turn.get("question"))
+        if located is None:
+            continue
+        turn_type, fact = located
+        if diagnostic_type is None:
+            diagnostic_type = turn_type
+        if turn_type == diagnostic_type and turn.get("answer") in ("yes", "no"):
+            evidence[fact] = turn["answer"] == "yes"
+    return diagnostic_type, evidence
+
+
+def learn(db, record_class, directory=CPD_ARTIFACT_DIR, batch_size=CPD_LEARNING_BATCH):
+    """
+    Streams the records newer than each type's last artifact in id order and
+    writes a new artifact for every type that saw new sessions.
+
+    Returns:
+        dict: diagnostic type -> {"version", "records", "new_records", "path"}.
+    """
+    from diagnostic_systems import DIAGNOSTIC_SYSTEMS, INFERENCE_MODELS
+    from question_catalog import get_catalog
+
+    if not directory:
+        raise ValueError("CPD_ARTIFACT_DIR is not set")
+    learners = {}
+    question_index = {}
+    for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+        path = latest_artifact(directory, diagnostic_type)
+        artifact = load_artifact(path) if path else None
+        # Learning always starts from the hand-written structure and prior
+        learners[diagnostic_type] = CPDLearner(diagnostic_type, INFERENCE_MODELS[diagnostic_type](), artifact)
+        catalog = get_catalog(diagnostic_type)
+        for fact, question in zip(catalog.facts, catalog.questions):
+            question_index[question] = (diagnostic_type, fact)
+
+    new_records = {diagnostic_type: 0 for diagnostic_type in learners}
+    after_id = min(learner.last_record_id for learner in learners.values())
+    while True:
+        rows = (db.query(record_class.id, record_class.conversation)
+                .filter(record_class.id > after_id)
+                .order_by(record_class.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            break
+        batches = {diagnostic_type: [] for diagnostic_type in learners}
+        for record_id, conversation in rows:
+            diagnostic_type, evidence = session_evidence(json.loads(conversation or "[]"), question_index)
+            if diagnostic_type is None:
+                continue
+            learner = learners[diagnostic_type]
+            if record_id <= learner.last_record_id:
+                continue
+            evidence = {fact: value for fact, value in evidence.items() if fact in learner.network.symptom_index}
+            if evidence:
+                batches[diagnostic_type].append(evidence)
+        after_id = rows[-1][0]
+        for diagnostic_type, learner in learners.items():
+            learner.observe(batches[diagnostic_type])
+            new_records[diagnostic_type] += len(batches[diagnostic_type])
+            learner.last_record_id = max(learner.last_record_id, after_id)
+
+    report = {}
+    for diagnostic_type, learner in learners.items():
+        path = save_artifact(directory, learner) if new_records[diagnostic_type] else None
+        report[diagnostic_type] = {"version": learner.version, "records": learner.records,
+                                   "new_records": new_records[diagnostic_type], "path": path}
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from main import DiagnosticSessionRecord, SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=CPD_LEARNING_BATCH)
+    parser.add_argument("--directory", default=CPD_ARTIFACT_DIR)
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        print(json.dumps(learn(db, DiagnosticSessionRecord, args.directory, args.batch_size), indent=2))
+    finally:
+        db.close()
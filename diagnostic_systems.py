@@ -0,0 +1,230 @@
+from brake_system import BrakeDiagnostic
+from brake_system import StartingInference as BrakeInference
+from start_system import StartDiagnostic
+from start_system import StartingInference as StartInference
+from sounds_system import SoundDiagnostic
+from sounds_system import StartingInference as SoundInference
+from experta import Fact
+from metrics import ENGINE_RUN_SECONDS, MODEL_BUILD_SECONDS, instrument_inference
+from rule_profiler import profiler as rule_profiler
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# Tipo de diagnóstico -> (motor de reglas, acción inicial)
+DIAGNOSTIC_SYSTEMS = {
+    "brake": (BrakeDiagnostic, "diagnose_brakes"),
+    "start": (StartDiagnostic, "diagnose"),
+    "sound": (SoundDiagnostic, "sound"),
+}
+
+# Tipo de diagnóstico -> red bayesiana que calcula las probabilidades
+INFERENCE_MODELS = {
+    "brake": BrakeInference,
+    "start": StartInference,
+    "sound": SoundInference,
+}
+
+# "rules" sigue el árbol de reglas; "adaptive" elige la pregunta más informativa
+DIAGNOSTIC_MODES = ("rules", "adaptive")
+
+# Motor de inferencia: "pgmpy" (VariableElimination), "planned" (eliminación con plan
+# cacheado por patrón de consulta), "circuit" (circuito aritmético compilado) o
+# "sampling" (aproximado, con intervalos de confianza).
+# Se puede cambiar por tipo con INFERENCE_BACKEND_<TIPO>.
+INFERENCE_BACKENDS = ("pgmpy", "planned", "circuit", "sampling")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pgmpy")
+# Directorio donde se guardan los circuitos compilados para no recompilarlos al arrancar
+CIRCUIT_CACHE_DIR = os.getenv("CIRCUIT_CACHE_DIR")
+
+# Directorio con las CPDs aprendidas del historial (ver cpd_learning.py)
+CPD_ARTIFACT_DIR = os.getenv("CPD_ARTIFACT_DIR")
+
+# Objetos por bucket de contexto del vehículo que se mantienen por versión (LRU)
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "256"))
+
+
+def inference_backend(diagnostic_type):
+    backend = os.getenv(f"INFERENCE_BACKEND_{diagnostic_type.upper()}", INFERENCE_BACKEND)
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' for {diagnostic_type}")
+    return backend
+
+
+def latest_cpd_artifact(diagnostic_type):
+    """Ruta de la última versión de las CPDs aprendidas del tipo, o None"""
+    if not CPD_ARTIFACT_DIR:
+        return None
+    from cpd_learning import latest_artifact
+
+    return latest_artifact(CPD_ARTIFACT_DIR, diagnostic_type)
+
+
+def build_inference(diagnostic_type, artifact_path=None, tables=None, name=None):
+    """
+    Construye el modelo de inferencia de un tipo con las CPDs del código o de
+    un artefacto. `tables` (variable -> tabla) sustituye además algunas CPDs y
+    `name` distingue el circuito compilado en CIRCUIT_CACHE_DIR.
+    """
+    started = time.perf_counter()
+    inference = INFERENCE_MODELS[diagnostic_type]()
+    if artifact_path:
+        from cpd_learning import apply_artifact, load_artifact
+
+        inference = apply_artifact(inference, load_artifact(artifact_path))
+    if tables:
+        from cpd_learning import apply_tables
+
+        inference = apply_tables(inference, tables)
+    backend = inference_backend(diagnostic_type)
+    if backend == "planned":
+        from query_planner import PlannedInference
+
+        inference = PlannedInference(inference)
+    elif backend == "circuit":
+        from arithmetic_circuit import CircuitInference
+
+        inference = CircuitInference(inference, CIRCUIT_CACHE_DIR, name or diagnostic_type)
+    elif backend == "sampling":
+        from sampling_inference import SamplingInference
+
+        inference = SamplingInference(inference)
+    MODEL_BUILD_SECONDS.observe(time.perf_counter() - started, diagnostic_type, backend)
+    return instrument_inference(inference, diagnostic_type)
+
+
+class VariantCache:
+    """LRU acotada de objetos derivados por bucket de contexto (redes, selectores...)"""
+
+    def __init__(self, max_entries=CONTEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        # Se construye fuera del lock: una variante puede pedir otras (un selector, su red)
+        value = build()
+        with self._lock:
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ModelVersion:
+    """
+    Modelos de inferencia de los tres sistemas que se sirven juntos. Las
+    sesiones quedan fijadas a la versión con la que empezaron.
+    """
+
+    def __init__(self, version_id, artifacts=None):
+        self.id = version_id
+        # Tipo -> ruta del artefacto de CPDs; los tipos que faltan usan el último
+        # artefacto de CPD_ARTIFACT_DIR y None fuerza las CPDs del código
+        self.artifacts = dict(artifacts or {})
+        self.created_at = time.time()
+        self.sessions = 0  # sesiones en curso fijadas a esta versión
+        self.inference = {}
+        self.derived = {}  # objetos calculados a partir de los modelos (redes compiladas, selectores...)
+        self.variants = VariantCache()  # lo mismo por bucket de contexto; hay muchos buckets posibles
+        self._lock = threading.Lock()
+
+    def artifact_path(self, diagnostic_type):
+        if diagnostic_type in self.artifacts:
+            return self.artifacts[diagnostic_type]
+        return latest_cpd_artifact(diagnostic_type)
+
+    def get(self, diagnostic_type):
+        inference = self.inference.get(diagnostic_type)
+        if inference is None:
+            with self._lock:
+                inference = self.inference.get(diagnostic_type)
+                if inference is None:
+                    if diagnostic_type not in INFERENCE_MODELS:
+                        raise KeyError(diagnostic_type)
+                    # La ruta queda fijada aunque después aparezcan artefactos nuevos
+                    self.artifacts[diagnostic_type] = self.artifact_path(diagnostic_type)
+                    inference = build_inference(diagnostic_type, self.artifacts[diagnostic_type])
+                    self.inference[diagnostic_type] = inference
+        return inference
+
+    def cached(self, key, build):
+        """Objeto derivado de los modelos de esta versión; se construye una vez y muere con ella"""
+        value = self.derived.get(key)
+        if value is None:
+            value = self.derived.setdefault(key, build())
+        return value
+
+    def cached_variant(self, key, build):
+        """Como cached, para objetos por bucket de contexto: los menos usados se descartan"""
+        return self.variants.get(key, build)
+
+    def message(self, diagnostic_type, message):
+        """Texto del mensaje de diagnóstico que se muestra (las variantes por cliente lo cambian)"""
+        return message
+
+
+_current = ModelVersion("initial")
+
+
+def current_version():
+    return _current
+
+
+def set_current_version(version):
+    """Cambia la versión para las sesiones nuevas; la asignación es atómica"""
+    global _current
+    _current = version
+
+
+def get_inference(diagnostic_type, version=None):
+    """Instancia compartida del modelo de inferencia de la versión (por defecto, la actual)"""
+    return (version or _current).get(diagnostic_type)
+
+
+def new_engine(diagnostic_type, mode="rules", context=None, version=None):
+    """
+    Crea un motor listo para responder, con la primera pregunta ya calculada.
+    `context` es el bucket de contexto del vehículo (ver vehicle_context.context_bucket)
+    y `version` la versión de modelos a la que queda fijado (por defecto, la actual).
+    """
+    version = version or _current
+    if mode == "adaptive":
+        from information_gain import AdaptiveDiagnostic
+
+        engine = AdaptiveDiagnostic(diagnostic_type, context, version)
+        with ENGINE_RUN_SECONDS.time(diagnostic_type, mode):
+            engine.run()
+        return engine
+
+    engine_class, action = DIAGNOSTIC_SYSTEMS[diagnostic_type]
+    engine = engine_class()
+    if context:
+        from vehicle_context import context_inference
+
+        engine.inference = context_inference(diagnostic_type, context, version)
+    else:
+        engine.inference = get_inference(diagnostic_type, version)
+    with rule_profiler.step(engine, diagnostic_type):
+        engine.reset()
+        engine.declare(Fact(action=action))
+        with ENGINE_RUN_SECONDS.time(diagnostic_type, mode):
+            engine.run()  # Esto activará la primera regla
+    return engine
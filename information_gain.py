@@ -0,0 +1,207 @@
+import os
+
+import numpy as np
+
+from diagnostic_systems import current_version
+from question_catalog import get_catalog
+from vehicle_context import bucket_key, context_inference, context_network
+
+# Stop asking once one root cause reaches this posterior probability
+ADAPTIVE_CONFIDENCE = float(os.getenv("ADAPTIVE_CONFIDENCE", "0.7"))
+# Questions that would remove less uncertainty than this (in bits) are not worth a round-trip
+ADAPTIVE_MIN_GAIN = float(os.getenv("ADAPTIVE_MIN_GAIN", "0.2"))
+# Per diagnostic type (confidence, min gain), from benchmarks/adaptive_questions.py: the lowest
+# number of questions that still beats the rule tree on the posterior of the true cause.
+# ADAPTIVE_CONFIDENCE_<TYPE> and ADAPTIVE_MIN_GAIN_<TYPE> override them.
+ADAPTIVE_THRESHOLDS = {
+    diagnostic_type: (float(os.getenv(f"ADAPTIVE_CONFIDENCE_{diagnostic_type.upper()}", confidence)),
+                      float(os.getenv(f"ADAPTIVE_MIN_GAIN_{diagnostic_type.upper()}", min_gain)))
+    for diagnostic_type, (confidence, min_gain) in {
+        "brake": (ADAPTIVE_CONFIDENCE, ADAPTIVE_MIN_GAIN),
+        "start": (ADAPTIVE_CONFIDENCE, ADAPTIVE_MIN_GAIN),
+        "sound": (0.58, 0.26),
+    }.items()
+}
+
+
+def _entropy(distributions):
+    """Entropy in bits along the last axis"""
+    safe = np.where(distributions > 0, distributions, 1.0)
+    return -(distributions * np.log2(safe)).sum(axis=-1)
+
+
+class QuestionSelector:
+    """
+    Picks the unanswered symptom with the highest expected information gain
+    about the joint root-cause configuration.
+    """
+
+    def __init__(self, network, candidates, confidence=ADAPTIVE_CONFIDENCE, min_gain=ADAPTIVE_MIN_GAIN):
+        self.network = network
+        self.candidates = [symptom for symptom in candidates if symptom in network.symptom_index]
+        self.candidate_rows = np.array([network.symptom_index[symptom] for symptom in self.candidates])
+        self.confidence = confidence
+        self.min_gain = min_gain
+
+    def expected_gains(self, evidence):
+        """
+        Expected information gain of every unanswered candidate, in one pass.
+
+        Returns:
+            tuple: (candidate names, gains in bits, posterior over root states).
+        """
+        posterior = self.network.posterior(evidence)
+        open_mask = np.array([symptom not in evidence for symptom in self.candidates], dtype=bool)
+        if not open_mask.any():
+            return [], np.zeros(0), posterior
+        rows = self.candidate_rows[open_mask]
+        # joint[c, v, s] = P(candidate c = v, root state s | evidence)
+        joint = self.network.likelihood[rows] * posterior
+        answer_probability = joint.sum(axis=-1)
+        conditional = joint / np.where(answer_probability > 0, answer_probability, 1.0)[..., None]
+        expected_entropy = (answer_probability * _entropy(conditional)).sum(axis=-1)
+        gains = _entropy(posterior) - expected_entropy
+        names = [symptom for symptom, is_open in zip(self.candidates, open_mask) if is_open]
+        return names, gains, posterior
+
+    def next_symptom(self, evidence):
+        """Most informative symptom to ask about, or None when it is time to stop"""
+        names, gains, posterior = self.expected_gains(evidence)
+        if not names or (posterior @ self.network.problem_indicator).max() >= self.confidence:
+            return None
+        best = int(np.argmax(gains))
+        if gains[best] < self.min_gain:
+            return None
+        return names[best]
+
+    def likely_answers(self, evidence):
+        """Most probable answer ("yes"/"no") to every symptom of the network given the evidence"""
+        answer_yes = self.network.likelihood[:, 1] @ self.network.posterior(evidence)
+        return {symptom: "yes" if answer_yes[row] >= 0.5 else "no"
+                for symptom, row in self.network.symptom_index.items()}
+
+
+def get_selector(diagnostic_type, bucket=None, version=None):
+    """Selector over the symptoms that have a question in the catalog, per model version and context bucket"""
+    version = version or current_version()
+    cached = version.cached_variant if bucket else version.cached
+    return cached(
+        ("selector", diagnostic_type, bucket_key(bucket)),
+        lambda: QuestionSelector(context_network(diagnostic_type, bucket, version), get_catalog(diagnostic_type).facts,
+                                 *ADAPTIVE_THRESHOLDS.get(diagnostic_type, (ADAPTIVE_CONFIDENCE, ADAPTIVE_MIN_GAIN))))
+
+
+def rule_message(catalog, answers, likely=None):
+    """
+    Message of the rule leaf reached by `answers`. Without `likely` the rule
+    tree must reach a leaf on the answers alone, or the message is "". With
+    it, facts that were not asked take their answer from `likely` (see
+    QuestionSelector.likely_answers), and facts outside it take "no", so
+    adaptive sessions that stop early still get the message of the closest
+    rule. A guessed answer the rules have no branch for is swapped for the other.
+    """
+    node = catalog.tree
+    while node is not None and "fact" in node:
+        fact = node["fact"]
+        if fact in answers:
+            node = node[answers[fact]]
+        elif likely is None:
+            return ""
+        else:
+            guess = likely.get(fact, "no")
+            node = node[guess] or node["no" if guess == "yes" else "yes"]
+    if node is None:
+        return ""
+    return catalog.messages[node["message"]]
+
+
+def _build_cause_messages(catalog, network):
+    leaves = [({fact: answer == "yes" for fact, answer in path}, message) for path, message in catalog.leaf_paths()]
+    # marginals[l, j] = P(root cause j | answers on the path to leaf l)
+    marginals = np.array([
+        network.posterior({fact: value for fact, value in evidence.items() if fact in network.symptom_index})
+        @ network.problem_indicator
+        for evidence, _ in leaves
+    ])
+    return tuple(catalog.messages[leaves[int(np.argmax(marginals[:, j]))][1]] for j in range(len(network.problems)))
+
+
+def cause_messages(diagnostic_type, bucket=None, version=None):
+    """Rule message per root cause of the network: the one of the leaf whose path makes that cause most probable"""
+    version = version or current_version()
+    cached = version.cached_variant if bucket else version.cached
+    return cached(
+        ("cause_messages", diagnostic_type, bucket_key(bucket)),
+        lambda: _build_cause_messages(get_catalog(diagnostic_type), context_network(diagnostic_type, bucket, version)))
+
+
+def adaptive_message(diagnostic_type, evidence, bucket=None, version=None):
+    """
+    Diagnostic message for an adaptive session that stopped with `evidence`:
+    the rule leaf the answers lead to, the questions it skipped answered as
+    the network expects, or, where the rules have no leaf for those answers,
+    the message of the most probable root cause.
+    """
+    selector = get_selector(diagnostic_type, bucket, version)
+    answers = {fact: "yes" if value else "no" for fact, value in evidence.items()}
+    message = rule_message(get_catalog(diagnostic_type), answers, selector.likely_answers(evidence))
+    if message:
+        return message
+    network = selector.network
+    causes = network.posterior(evidence) @ network.problem_indicator
+    return cause_messages(diagnostic_type, bucket, version)[int(np.argmax(causes))]
+
+
+class AdaptiveDiagnostic:
+    """
+    Drop-in replacement for the rule engines that asks questions in order of
+    expected information gain instead of following the rule tree.
+    """
+
+    def __init__(self, diagnostic_type, bucket=None, version=None):
+        self.diagnostic_type = diagnostic_type
+        self.bucket = bucket
+        self.version = version
+        self.selector = get_selector(diagnostic_type, bucket, version)
+        self.inference = context_inference(diagnostic_type, bucket, version)
+        self.catalog = get_catalog(diagnostic_type)
+        self.evidence_list = []
+        self.next_question = None
+        self.current_fact = None
+        self.diagnostic_complete = False
+        self.diagnostic_result = None
+        self.diagnostic_message = None
+
+    def get_next_question(self):
+        return self.next_question
+
+    def process_answer(self, answer):
+        """Procesa la respuesta del usuario y actualiza el estado"""
+        if self.current_fact:
+            self.evidence_list.append((self.current_fact, answer == 'yes'))
+
+    def run(self):
+        if self.diagnostic_complete:
+            return
+        evidence = dict(self.evidence_list)
+        symptom = self.selector.next_symptom(evidence)
+        if symptom is None:
+            self.generate_diagnostic(evidence,
+                                     adaptive_message(self.diagnostic_type, evidence, self.bucket, self.version))
+        else:
+            self.next_question = self.catalog.question(self.catalog.fact_id(symptom))
+            self.current_fact = symptom
+
+    def generate_diagnostic(self, evidence_dict, message=""):
+        probabilities = self.inference.infer_problem(evidence_dict)
+        most_probable_problem = max(probabilities, key=probabilities.get)
+
+        self.diagnostic_complete = True
+        self.diagnostic_message = message
+        self.diagnostic_result = {
+            "most_probable_problem": most_probable_problem,
+            "probabilities": probabilities,
+            "diagnostic_message": message
+        }
+        self.next_question = None
+        return self.diagnostic_result
@@ -1,8 +1,21 @@
-from brake_system import BrakeDiagnostic, BrakeProblem
-from start_system import StartDiagnostic, StartProblem
-from sounds_system import SoundDiagnostic, SoundProblem
-from experta import Fact
-from fastapi import FastAPI, HTTPException, Depends
+from diagnostic_systems import DIAGNOSTIC_MODES, DIAGNOSTIC_SYSTEMS, current_version, get_inference, new_engine
+from model_versions import ModelVersionManager
+from tenants import cache_stats as tenant_cache_stats, discard_version as discard_tenant_version, tenant_for, tenant_version
+from vehicle_context import cache_info as context_cache_info, context_bucket, context_inference, context_network
+from question_catalog import get_catalog
+from offline_bundle import BundleValidationError, get_bundle
+from prefetch import prefetch_branches
+from session_journal import SessionJournal
+from session_store import TieredSessionStore
+import triage
+import metrics
+from rule_profiler import profiler as rule_profiler
+from request_profiler import ProfilingMiddleware, RequestProfiler, current_profile
+from memory_report import Snapshots, deep_sizeof, engine_sizes, process_memory, register_cache, report_caches
+from admission import AdmissionController, Rejected, retry_after_header
+from session_locks import IdempotencyCache, SessionLocks
+import cpd_learning
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
 from fastapi import Body
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy import create_engine, Column, String, Integer
@@ -17,9 +30,14 @@ from datetime import datetime, timedelta
 from pydantic import BaseModel, EmailStr
 from typing import Dict, Optional, List, Any
 from fastapi.middleware.cors import CORSMiddleware
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import json
+import logging
 import os
 import secrets
+import time
+import uuid
 import pgmpy
 from dotenv import load_dotenv
 
@@ -38,6 +56,10 @@ app.add_middleware(
     allow_headers=["*"], 
 )
 
+# Perfiles de peticiones muestreadas o lentas, por ruta; se descargan desde /admin/profiles
+request_profiler = RequestProfiler()
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
 # Configuración de la base de datos
 SQLALCHEMY_DATABASE_URL = os.getenv("DB_URL")
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
@@ -62,13 +84,138 @@ class DiagnosticResult(BaseModel):
     diagnostic_message: str
 
 class DiagnosticSession:
-    def __init__(self):
+    """
+    Sesión compacta: cada turno guarda el id de hecho del catálogo compartido
+    del tipo de diagnóstico y su respuesta como un bit, y la conversación solo
+    se expande a texto al serializarla.
+    """
+
+    __slots__ = ("engine", "diagnostic_type", "user_id", "mode", "context", "tenant", "model_version",
+                 "started_at", "completed", "catalog", "turns", "replies")
+
+    def __init__(self, diagnostic_type, user_id=None, mode="rules", context=None, version=None, tenant=None):
         self.engine = None
-        self.evidence_list = []
+        self.diagnostic_type = diagnostic_type
+        self.user_id = user_id
+        self.mode = mode
+        self.context = context or None  # bucket de contexto del vehículo
+        self.tenant = tenant  # cadena de talleres del usuario, con sus propios ajustes del modelo
+        self.model_version = version or current_version()  # fija hasta que la sesión termine
+        self.started_at = time.time()
         self.completed = False
-        self.conversation = []  # Lista de diccionarios {"question": ..., "answer": ...}
+        self.catalog = get_catalog(diagnostic_type)
+        self.turns = b""  # ids de hecho en el orden en que se preguntaron
+        self.replies = 0  # bit i: el turno i se respondió "yes" (una pregunta puede repetirse)
+
+    def apply_answer(self, answer):
+        """Registra la respuesta a la pregunta actual y avanza el motor"""
+        if self.engine.current_fact is None or self.engine.diagnostic_complete:
+            raise HTTPException(status_code=409, detail="The diagnostic has no pending question")
+        fact_id = self.catalog.fact_id(self.engine.current_fact)
+        if answer == "yes":
+            self.replies |= 1 << len(self.turns)
+        self.turns += bytes((fact_id,))
+        with rule_profiler.step(self.engine, self.diagnostic_type):
+            self.engine.process_answer(answer)
+            with metrics.ENGINE_RUN_SECONDS.time(self.diagnostic_type, self.mode):
+                self.engine.run()
+
+    def answers(self):
+        return ["yes" if self.replies >> turn & 1 else "no" for turn in range(len(self.turns))]
+
+    @property
+    def asked(self):
+        """Bitset de los hechos preguntados"""
+        asked = 0
+        for fact_id in self.turns:
+            asked |= 1 << fact_id
+        return asked
+
+    @property
+    def yes(self):
+        """Bitset de los hechos cuya última respuesta fue afirmativa"""
+        yes = 0
+        for turn, fact_id in enumerate(self.turns):
+            if self.replies >> turn & 1:
+                yes |= 1 << fact_id
+            else:
+                yes &= ~(1 << fact_id)
+        return yes
+
+    @property
+    def conversation(self):
+        """Lista de diccionarios {"question": ..., "answer": ...}"""
+        return [{"question": self.catalog.question(fact_id), "answer": answer}
+                for fact_id, answer in zip(self.turns, self.answers())]
+
+def serialize_session(session):
+    """Forma serializable de una sesión para enviarla a disco"""
+    return {
+        "type": session.diagnostic_type,
+        "user_id": session.user_id,
+        "mode": session.mode,
+        "context": session.context,
+        "tenant": session.tenant,
+        "model_version": getattr(session.model_version, "base", session.model_version).id,
+        "started_at": session.started_at,
+        "answers": session.answers(),
+    }
+
+# Versiones de los modelos de inferencia; se cambian en caliente desde /admin/models
+models = ModelVersionManager()
+models.on_retire.append(discard_tenant_version)
+
+def restore_session(record):
+    """
+    Reconstruye una sesión en memoria a partir de sus respuestas registradas, sobre
+    la versión de modelos con la que empezó. Si esa versión ya no está cargada
+    (p. ej. tras reiniciar), usa la actual.
+    """
+    mode = record.get("mode", "rules")
+    context = record.get("context")
+    tenant = record.get("tenant")
+    base = models.get(record.get("model_version"))
+    if base is None:
+        base = current_version()
+        if record.get("model_version") not in (None, base.id):
+            logger.warning("Model version %s of a %s session is no longer loaded; restoring it on %s",
+                           record.get("model_version"), record["type"], base.id)
+    version = tenant_version(tenant, base)
+    session = DiagnosticSession(record["type"], record["user_id"], mode, context, version, tenant)
+    session.started_at = record.get("started_at", session.started_at)
+    session.engine = new_engine(record["type"], mode, context, version)
+    for answer in record["answers"]:
+        session.apply_answer(answer)
+    return session
+
+# Las sesiones inactivas se envían a disco para no mantener su motor en memoria
+sessions: TieredSessionStore = TieredSessionStore(
+    os.getenv("SESSION_SPILL_PATH", "session_spill.db"),
+    serialize=serialize_session,
+    rehydrate=restore_session,
+    idle_seconds=int(os.getenv("SESSION_IDLE_SECONDS", "300")),
+    max_resident=int(os.getenv("SESSION_MAX_RESIDENT", "1000")),
+)
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "30"))
+# Las sesiones sin respuestas durante este tiempo se dan por abandonadas y se cierran
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
 
-sessions: Dict[str, DiagnosticSession] = {}
+# Diario de sesiones para recuperar las conversaciones tras un reinicio
+journal = SessionJournal(
+    os.getenv("SESSION_JOURNAL_PATH", "session_journal.log"),
+    batch_size=int(os.getenv("SESSION_JOURNAL_BATCH", "64")),
+    compact_every=int(os.getenv("SESSION_JOURNAL_COMPACT_EVERY", "5000")),
+    compact_interval=int(os.getenv("SESSION_JOURNAL_COMPACT_INTERVAL", "300")),
+    ttl=SESSION_TTL_SECONDS,
+)
+
+# Preguntas por sesión terminada, por (tipo, modo): [sesiones, preguntas]
+question_stats: Dict[tuple, List[int]] = {}
+
+# Correos con acceso a los endpoints de administración
+ADMIN_EMAILS = {email.strip() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+logger = logging.getLogger(__name__)
 
 # Modelos de la base de datos
 class User(Base):
@@ -136,17 +283,76 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with metrics.JWT_DECODE_SECONDS.time():
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == email).first()
+    with metrics.USER_LOOKUP_SECONDS.time():
+        user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise credentials_exception
+    # Devolver la conexión al pool: la petición puede quedar esperando (lock de la
+    # sesión, inferencia) y no debe retenerla mientras tanto
+    db.expunge(user)
+    db.rollback()
     return user
 
+async def get_admin_user(current_user: User = Depends(get_current_user)):
+    if current_user.email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return current_user
+
+# Control de admisión de los endpoints de diagnóstico (ver admission.py)
+admission = AdmissionController()
+# Detrás de un proxy, la IP del cliente viene en X-Forwarded-For
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "").lower() in ("1", "true", "yes")
+
+# Bloqueo por sesión y respuestas ya enviadas, para reintentos con Idempotency-Key
+session_locks = SessionLocks(int(os.getenv("SESSION_LOCK_STRIPES", "256")))
+answer_responses = IdempotencyCache(int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000")))
+# Hilos para la inferencia de las respuestas, fuera del bucle de eventos
+inference_pool = ThreadPoolExecutor(max_workers=int(os.getenv("INFERENCE_WORKERS", "4")),
+                                    thread_name_prefix="inference")
+
+async def run_inference(function, *args):
+    """Ejecuta `function` en el pool de inferencia, registrando cuánto esperó en cola"""
+    queued = time.perf_counter()
+    profile = current_profile()
+
+    def timed():
+        admission.observe_queue((time.perf_counter() - queued) * 1000)
+        with request_profiler.attach_thread(profile):
+            return function(*args)
+
+    return await asyncio.get_running_loop().run_in_executor(inference_pool, timed)
+
+def client_ip(request: Request):
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+def admit(request, user, active_sessions=None):
+    try:
+        admission.check(user.id, client_ip(request), active_sessions)
+    except Rejected as rejected:
+        raise HTTPException(status_code=429, detail=f"Too many requests ({rejected.reason})",
+                            headers=retry_after_header(rejected))
+
+async def get_admitted_user(request: Request, current_user: User = Depends(get_current_user)):
+    """Usuario actual, si sus peticiones de diagnóstico no superan los límites"""
+    admit(request, current_user)
+    return current_user
+
+async def get_user_for_new_session(request: Request, current_user: User = Depends(get_current_user)):
+    """Como get_admitted_user, comprobando además el límite global de sesiones activas"""
+    admit(request, current_user, len(sessions))
+    return current_user
+
 # Rutas de la API
 @app.post("/register", response_model=UserResponse)
 async def register_user(user: UserCreate, db: Session = Depends(get_db)):
@@ -187,101 +393,452 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+class VehicleContext(BaseModel):
+    make: Optional[str] = None
+    age_years: Optional[float] = None
+    mileage_km: Optional[float] = None
+    climate: Optional[str] = None  # "cold", "hot", "humid", ...
+
 class DiagnosticType(BaseModel):
     diagnostic_type: str
+    mode: str = "rules"
+    vehicle: Optional[VehicleContext] = None
+
+class TriageRequest(BaseModel):
+    facts: Dict[str, str]  # hecho -> "yes" / "no", de cualquiera de los sistemas
+
+class CompletedAnswer(BaseModel):
+    question_id: str
+    answer: str
+
+class CompletedDiagnostic(BaseModel):
+    bundle_version: str
+    answers: List[CompletedAnswer]
+
+@app.on_event("startup")
+async def restore_journaled_sessions():
+    """Recupera las sesiones en curso que quedaron en el diario"""
+    discarded = []
+    # Los catálogos se recorren una sola vez, antes de atender peticiones
+    for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+        get_catalog(diagnostic_type)
+    for session_id, record in journal.replay().items():
+        try:
+            session = restore_session(record)
+        except Exception:
+            logger.exception("Could not restore session %s from journal", session_id)
+            discarded.append(session_id)
+            continue
+        if session.engine.get_next_question():
+            sessions[session_id] = session
+            models.pin(session.model_version)
+        else:
+            discarded.append(session_id)
+    journal.start()
+    # Las sesiones que no se pudieron recuperar se cierran en el diario
+    for session_id in discarded:
+        journal.record_finish(session_id)
+    asyncio.create_task(spill_idle_sessions())
+    admission.start()
+
+def expire_abandoned_sessions():
+    """
+    Cierra las sesiones abandonadas, para que dejen de fijar su versión de
+    modelos y de ocupar el diario. Devuelve cuántas se cerraron.
+    """
+    expired = sessions.expire(SESSION_TTL_SECONDS)
+    for session_id, record in expired.items():
+        version = models.get(record["model_version"])
+        if version is not None:
+            models.unpin(version)
+        journal.record_finish(session_id)
+        metrics.SESSIONS_EXPIRED.inc(record["type"], record["mode"])
+    return len(expired)
+
+async def spill_idle_sessions():
+    """Envía periódicamente a disco las sesiones inactivas y cierra las abandonadas"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            expire_abandoned_sessions()
+            sessions.sweep()
+        except Exception:
+            logger.exception("Session sweep failed")
+
+@app.on_event("shutdown")
+async def close_journal():
+    journal.close()
+    triage.shutdown()
+    models.shutdown()
+    admission.stop()
+    inference_pool.shutdown(wait=False, cancel_futures=True)
+
+# El catálogo es estático por versión: los clientes pueden cachearlo mucho tiempo
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "604800"))
+
+# Niveles de preguntas siguientes que se adelantan en cada respuesta
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "1"))
+PREFETCH_MAX_DEPTH = int(os.getenv("PREFETCH_MAX_DEPTH", "4"))
+
+# Combinaciones conjuntas de fallos que se devuelven con el diagnóstico
+TOP_FAULTS_K = int(os.getenv("TOP_FAULTS_K", "3"))
+
+def prefetch_depth(requested):
+    if requested is None:
+        return PREFETCH_DEPTH
+    return max(0, min(requested, PREFETCH_MAX_DEPTH))
+
+def with_attribution(diagnostic_type, diagnostic, evidence_list, context=None, version=None):
+    """Añade al diagnóstico cuánto empujó cada respuesta a cada causa (log-razón de verosimilitud)"""
+    network = context_network(diagnostic_type, context, version)
+    mapping = get_inference(diagnostic_type, version).problem_mapping
+    evidence = {fact: value for fact, value in evidence_list if fact in network.symptom_index}
+    facts, contributions = network.attribution(evidence)
+    labels = [mapping[problem] for problem in network.problems]
+    attribution = [
+        {
+            "fact": fact,
+            "answer": "yes" if evidence[fact] else "no",
+            "log_likelihood_ratio": {label: round(value, 6) for label, value in zip(labels, row.tolist())}
+        }
+        for fact, row in zip(facts, contributions)
+    ]
+    return dict(diagnostic, attribution=attribution)
+
+def with_top_faults(diagnostic_type, diagnostic, evidence_list, context=None, version=None):
+    """Añade las TOP_FAULTS_K combinaciones de fallos más probables (MPE y siguientes)"""
+    network = context_network(diagnostic_type, context, version)
+    mapping = get_inference(diagnostic_type, version).problem_mapping
+    evidence = {fact: value for fact, value in evidence_list if fact in network.symptom_index}
+    top_faults = [
+        {
+            "problems": [mapping[problem] for problem, present in zip(network.problems, states) if present],
+            "probability": round(probability, 6)
+        }
+        for states, probability in network.top_configurations(evidence, TOP_FAULTS_K)
+    ]
+    return dict(diagnostic, top_faults=top_faults)
+
+def with_confidence_bounds(diagnostic_type, diagnostic, evidence_dict, context=None, version=None):
+    """
+    Con inferencia por muestreo, añade el intervalo de confianza del 95% de cada probabilidad.
+    Las variantes por contexto se calculan de forma exacta sobre la red compilada: en lugar
+    de intervalos se marca el resultado como exacto.
+    """
+    if not hasattr(get_inference(diagnostic_type, version), "confidence_bounds"):
+        return diagnostic
+    inference = context_inference(diagnostic_type, context, version)
+    if not hasattr(inference, "confidence_bounds"):
+        return dict(diagnostic, exact=True)
+    # Igual que en generate_diagnostic: los hechos sin nodo en la red no son evidencia, y
+    # así los intervalos salen de las mismas muestras que dieron las probabilidades
+    evidence_dict = {fact: value for fact, value in evidence_dict.items() if fact in inference.model}
+    return dict(diagnostic, confidence_bounds=inference.confidence_bounds(evidence_dict))
+
+def compact_diagnostic(session, diagnostic):
+    """Resultado con el id del mensaje en lugar de su texto"""
+    result = {key: value for key, value in diagnostic.items() if key != "diagnostic_message"}
+    result["message_id"] = session.catalog.message_ids.get(diagnostic["diagnostic_message"])
+    if result["message_id"] is None and diagnostic["diagnostic_message"]:
+        # Los mensajes propios de un cliente no están en el catálogo: se envían como texto
+        result["diagnostic_message"] = diagnostic["diagnostic_message"]
+    result["catalog_version"] = session.catalog.version
+    return result
+
+@app.get("/api/diagnostic/{diagnostic_type}/catalog")
+async def get_question_catalog(diagnostic_type: str, if_none_match: Optional[str] = Header(None)):
+    """Ids y textos de todas las preguntas y mensajes de un tipo de diagnóstico"""
+    if diagnostic_type not in DIAGNOSTIC_SYSTEMS:
+        raise HTTPException(status_code=404, detail="Unknown diagnostic type")
+
+    catalog = get_catalog(diagnostic_type)
+    etag = f'"{catalog.version}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalog.document, media_type="application/json", headers=headers)
+
+@app.get("/api/diagnostic/{diagnostic_type}/bundle")
+async def get_offline_bundle(diagnostic_type: str, if_none_match: Optional[str] = Header(None)):
+    """Paquete versionado para ejecutar el diagnóstico completo en el cliente"""
+    if diagnostic_type not in DIAGNOSTIC_SYSTEMS:
+        raise HTTPException(status_code=404, detail="Unknown diagnostic type")
+
+    bundle = get_bundle(diagnostic_type)
+    etag = f'"{bundle.version}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=bundle.document, media_type="application/json", headers=headers)
+
+@app.post("/api/diagnostic/{diagnostic_type}/submit-completed")
+async def submit_completed_diagnostic(diagnostic_type: str, completed: CompletedDiagnostic, current_user: User = Depends(get_admitted_user), db: Session = Depends(get_db)):
+    """Valida y guarda una conversación que el cliente ejecutó sin conexión"""
+    if diagnostic_type not in DIAGNOSTIC_SYSTEMS:
+        raise HTTPException(status_code=404, detail="Unknown diagnostic type")
+
+    # El paquete sin conexión es público y se genera con el modelo base
+    version = current_version()
+    bundle = get_bundle(diagnostic_type, version)
+    if completed.bundle_version != bundle.version:
+        raise HTTPException(status_code=409, detail="Bundle version is outdated")
+
+    answers = [(turn.question_id, turn.answer.lower()) for turn in completed.answers]
+    try:
+        diagnostic = bundle.diagnose(answers)
+    except BundleValidationError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    evidence_list = [(fact, answer == "yes") for fact, answer in answers]
+    tenant_model = tenant_version(tenant_for(current_user.email), version)
+    diagnostic["diagnostic_message"] = tenant_model.message(diagnostic_type, diagnostic["diagnostic_message"])
+    diagnostic = with_attribution(diagnostic_type, diagnostic, evidence_list, version=version)
+    diagnostic = with_top_faults(diagnostic_type, diagnostic, evidence_list, version=version)
+    diagnostic = with_confidence_bounds(diagnostic_type, diagnostic,
+                                        {fact: value for fact, value in evidence_list
+                                         if fact in bundle.network_nodes}, version=version)
+
+    catalog = bundle.catalog
+    conversation = [{"question": catalog.question(catalog.fact_id(fact)), "answer": answer}
+                    for fact, answer in answers]
+    session_record = DiagnosticSessionRecord(
+        user_id=current_user.id,
+        conversation=json.dumps(conversation),
+        diagnostic_result=json.dumps(diagnostic)
+    )
+    db.add(session_record)
+    with metrics.DB_COMMIT_SECONDS.time("submit_completed"):
+        db.commit()
+
+    return {
+        "id": session_record.id,
+        "diagnostic_result": diagnostic
+    }
+
+@app.post("/api/diagnostic/triage")
+async def triage_diagnostic(request: TriageRequest, current_user: User = Depends(get_admitted_user)):
+    """Evalúa los tres sistemas a la vez y recomienda con cuál empezar la conversación"""
+    evidence = {}
+    for fact, answer in request.facts.items():
+        answer = answer.lower()
+        if answer not in ("yes", "no"):
+            raise HTTPException(status_code=400, detail="Answer must be 'yes' or 'no'")
+        evidence[fact] = answer == "yes"
+    return await triage.triage(evidence, tenant_version(tenant_for(current_user.email), current_version()))
 
 @app.post("/api/diagnostic/start")
-async def start_diagnostic(diagnostic_type: DiagnosticType, current_user: User = Depends(get_current_user)):
+async def start_diagnostic(diagnostic_type: DiagnosticType, compact: bool = False, prefetch: Optional[int] = None, current_user: User = Depends(get_user_for_new_session), db: Session = Depends(get_db)):
     """Inicia una nueva sesión de diagnóstico"""
-    session_id = str(len(sessions) + 1)
-    session = DiagnosticSession()
-
-    engine = None
-
-    if (diagnostic_type.diagnostic_type == "brake"):
-        engine = BrakeDiagnostic()
-        engine.reset()
-        engine.declare(Fact(action="diagnose_brakes"))
-    elif (diagnostic_type.diagnostic_type == "start"):
-        engine = StartDiagnostic()
-        engine.reset()
-        engine.declare(Fact(action="diagnose"))
-    elif (diagnostic_type.diagnostic_type == "sound"):
-        engine = SoundDiagnostic()
-        engine.reset()
-        engine.declare(Fact(action="sound"))
+    if diagnostic_type.diagnostic_type not in DIAGNOSTIC_SYSTEMS:
+        raise HTTPException(status_code=400, detail="Unknown diagnostic type")
+    if diagnostic_type.mode not in DIAGNOSTIC_MODES:
+        raise HTTPException(status_code=400, detail="Unknown diagnostic mode")
+
+    session_id = uuid.uuid4().hex
+    vehicle = diagnostic_type.vehicle
+    context = context_bucket(**vehicle.model_dump()) if vehicle else None
+    tenant = tenant_for(current_user.email)
+    version = tenant_version(tenant, current_version())
+    session = DiagnosticSession(diagnostic_type.diagnostic_type, current_user.id, diagnostic_type.mode, context,
+                                version, tenant)
+
+    engine = new_engine(diagnostic_type.diagnostic_type, diagnostic_type.mode, session.context, version)
 
-    
-    engine.run()  # Esto activará la primera regla
-    
     session.engine = engine
     sessions[session_id] = session
-    
+    models.pin(version)
+    metrics.SESSIONS_STARTED.inc(session.diagnostic_type, session.mode)
+    journal.record_start(session_id, diagnostic_type.diagnostic_type, current_user.id, diagnostic_type.mode,
+                         session.context, tenant, getattr(version, "base", version).id)
+
+    # Los ajustes del cliente pueden dejar una causa por encima del umbral del modo
+    # adaptativo antes de la primera pregunta: la sesión termina al empezar
+    if engine.diagnostic_complete:
+        return await finish_session(session_id, session, compact, current_user, db)
+
+    branches = prefetch_branches(session, prefetch_depth(prefetch), compact)
+    if compact:
+        return {
+            "session_id": session_id,
+            "question_id": engine.current_fact,
+            "catalog_version": session.catalog.version,
+            "prefetch": branches
+        }
     return {
         "session_id": session_id,
-        "question": engine.get_next_question()
+        "question": engine.get_next_question(),
+        "prefetch": branches
     }
 
 @app.post("/api/diagnostic/{session_id}/answer")
-async def submit_answer(session_id: str, response: QuestionResponse, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-        
-    session = sessions[session_id]
+async def submit_answer(session_id: str, response: QuestionResponse, compact: bool = False, prefetch: Optional[int] = None, idempotency_key: Optional[str] = Header(None), current_user: User = Depends(get_admitted_user), db: Session = Depends(get_db)):
     answer = response.answer.lower()
-    
     if answer not in ["yes", "no"]:
         raise HTTPException(status_code=400, detail="Answer must be 'yes' or 'no'")
 
-    # Almacenar la pregunta actual y la respuesta
-    current_question = session.engine.get_next_question()
-    session.conversation.append({"question": current_question, "answer": answer})
+    # Las respuestas a una misma sesión se aplican de una en una
+    async with session_locks(session_id):
+        if idempotency_key:
+            replayed = answer_responses.get(session_id, idempotency_key)
+            if replayed is not None:
+                return replayed
+        if session_id not in sessions:
+            raise HTTPException(status_code=404, detail="Session not found")
 
-    # Procesar la respuesta actual
-    session.engine.process_answer(answer)
-    session.engine.run()
+        session = sessions[session_id]
+        # Mientras el hilo de inferencia la modifica, la sesión no se puede enviar a disco
+        with sessions.pinned(session_id):
+            result = await process_answer(session_id, session, answer, compact, prefetch, current_user, db)
+        if idempotency_key:
+            answer_responses.put(session_id, idempotency_key, result)
+        return result
 
-    # Obtener la siguiente pregunta
+def answer_step(session, answer, depth, compact):
+    """Aplica la respuesta y adelanta las preguntas siguientes (se ejecuta fuera del bucle de eventos)"""
+    session.apply_answer(answer)
     next_question = session.engine.get_next_question()
+    branches = prefetch_branches(session, depth, compact) if next_question else None
+    return next_question, branches
+
+def final_diagnostic(session):
+    """Diagnóstico final con la atribución, los fallos conjuntos y los intervalos de confianza"""
+    # Usar el diagnóstico que ya generó la regla final (conserva su mensaje)
+    diagnostic = session.engine.diagnostic_result
+    if diagnostic is None:
+        diagnostic = session.engine.generate_diagnostic(dict(session.engine.evidence_list))
+    diagnostic = dict(diagnostic, diagnostic_message=session.model_version.message(
+        session.diagnostic_type, diagnostic["diagnostic_message"]))
+    diagnostic = with_attribution(session.diagnostic_type, diagnostic, session.engine.evidence_list,
+                                  session.context, session.model_version)
+    diagnostic = with_top_faults(session.diagnostic_type, diagnostic, session.engine.evidence_list,
+                                 session.context, session.model_version)
+    return with_confidence_bounds(session.diagnostic_type, diagnostic,
+                                  dict(session.engine.evidence_list), session.context,
+                                  session.model_version)
+
+async def process_answer(session_id, session, answer, compact, prefetch, current_user, db):
+    # Almacenar la respuesta y procesarla; la inferencia no bloquea a las demás sesiones
+    next_question, branches = await run_inference(answer_step, session, answer, prefetch_depth(prefetch), compact)
+    journal.record_answer(session_id, answer)
 
     if next_question:
+        if compact:
+            return {
+                "session_id": session_id,
+                "question_id": session.engine.current_fact,
+                "prefetch": branches
+            }
         return {
             "session_id": session_id,
-            "question": next_question
+            "question": next_question,
+            "prefetch": branches
         }
-    else:
-        # Generar el diagnóstico final
-        diagnostic = session.engine.generate_diagnostic(dict(session.engine.evidence_list))
-        sessions.pop(session_id)  # Limpiar la sesión
+    return await finish_session(session_id, session, compact, current_user, db)
 
-        # Guardar la conversación y el diagnóstico en la base de datos
-        session_record = DiagnosticSessionRecord(
-            user_id=current_user.id,
-            conversation=json.dumps(session.conversation),
-            diagnostic_result=json.dumps(diagnostic)
-        )
-        db.add(session_record)
+async def finish_session(session_id, session, compact, current_user, db):
+    """Genera el diagnóstico final, lo guarda y cierra la sesión"""
+    diagnostic = await run_inference(final_diagnostic, session)
+    sessions.pop(session_id)  # Limpiar la sesión
+    models.unpin(session.model_version)
+    stats = question_stats.setdefault((session.diagnostic_type, session.mode), [0, 0])
+    stats[0] += 1
+    stats[1] += len(session.turns)
+
+    # Guardar la conversación y el diagnóstico en la base de datos
+    session_record = DiagnosticSessionRecord(
+        user_id=current_user.id,
+        conversation=json.dumps(session.conversation),
+        diagnostic_result=json.dumps(diagnostic)
+    )
+    db.add(session_record)
+    with metrics.DB_COMMIT_SECONDS.time("answer"):
         db.commit()
+    journal.record_finish(session_id)
+    metrics.SESSIONS_FINISHED.inc(session.diagnostic_type, session.mode)
+    metrics.SESSION_DURATION_SECONDS.observe(time.time() - session.started_at, session.diagnostic_type)
+
+    if compact:
+        diagnostic = compact_diagnostic(session, diagnostic)
+    return {
+        "session_id": session_id,
+        "diagnostic_result": diagnostic
+    }
+
+
+@app.post("/api/diagnostic/{session_id}/resume")
+async def resume_diagnostic(session_id: str, current_user: User = Depends(get_admitted_user)):
+    """Reconstruye una sesión a partir de las respuestas registradas en el diario"""
+    record = journal.live_session(session_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if record["user_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="Session belongs to another user")
+
+    # Con el lock de la sesión: una respuesta en curso no se ve a medias
+    async with session_locks(session_id):
+        if session_id not in sessions:
+            sessions[session_id] = restore_session(record)
+            models.pin(sessions[session_id].model_version)
 
+        session = sessions[session_id]
         return {
             "session_id": session_id,
-            "diagnostic_result": diagnostic
+            "question": session.engine.get_next_question(),
+            "conversation": session.conversation
         }
 
+@app.get("/api/diagnostic/{session_id}/lookahead")
+async def get_diagnostic_lookahead(session_id: str, current_user: User = Depends(get_admitted_user)):
+    """Cómo cambiaría el diagnóstico con cada posible respuesta a cada síntoma pendiente"""
+    # La evidencia se copia con el lock de la sesión, para no ver una respuesta a medio aplicar
+    async with session_locks(session_id):
+        if session_id not in sessions:
+            raise HTTPException(status_code=404, detail="Session not found")
+        session = sessions[session_id]
+        evidence_list = list(session.engine.evidence_list)
 
-@app.get("/api/diagnostic/{session_id}")
-async def get_diagnostic_status(session_id: str, current_user: User = Depends(get_current_user)):
-    """Obtiene el estado actual del diagnóstico"""
-    if session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-        
-    session = sessions[session_id]
+    network = context_network(session.diagnostic_type, session.context, session.model_version)
+    mapping = get_inference(session.diagnostic_type, session.model_version).problem_mapping
+    labels = [mapping[problem] for problem in network.problems]
+    evidence = {fact: value for fact, value in evidence_list if fact in network.symptom_index}
+    pending = [symptom for symptom in network.symptoms if symptom not in evidence]
+
+    answer_probability, marginals = network.lookahead(evidence, pending)
+    catalog = session.catalog
     return {
         "session_id": session_id,
-        "current_question": session.engine.get_next_question(),
-        "completed": session.engine.diagnostic_complete
+        "probabilities": dict(zip(labels, network.marginals(evidence).tolist())),
+        "symptoms": [
+            {
+                "symptom": symptom,
+                "question": catalog.question(catalog.fact_id(symptom)) if symptom in catalog.fact_ids else None,
+                "probability_yes": float(answer_probability[position, 1]),
+                "yes": dict(zip(labels, marginals[position, 1].tolist())),
+                "no": dict(zip(labels, marginals[position, 0].tolist()))
+            }
+            for position, symptom in enumerate(pending)
+        ]
     }
 
+@app.get("/api/diagnostic/{session_id}")
+async def get_diagnostic_status(session_id: str, compact: bool = False, current_user: User = Depends(get_admitted_user)):
+    """Obtiene el estado actual del diagnóstico"""
+    async with session_locks(session_id):
+        if session_id not in sessions:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        session = sessions[session_id]
+        if compact:
+            return {
+                "session_id": session_id,
+                "current_question_id": session.engine.current_fact,
+                "completed": session.engine.diagnostic_complete
+            }
+        return {
+            "session_id": session_id,
+            "current_question": session.engine.get_next_question(),
+            "completed": session.engine.diagnostic_complete
+        }
+
 @app.post("/api/diagnostic/sessions", response_model=List[Dict[str, Any]])
 async def get_user_diagnostics(db: Session = Depends(get_db)):
     sessions = db.query(DiagnosticSessionRecord)
@@ -295,6 +852,292 @@ async def get_user_diagnostics(db: Session = Depends(get_db)):
         for session in sessions
     ]
 
+# Token opcional para /metrics (Authorization: Bearer <token>); sin él, el endpoint es público
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+def collect_runtime_metrics():
+    """Valores que ya mantienen otros componentes, leídos en cada scrape"""
+    store = sessions.stats()
+    admission_stats = admission.stats()
+    tenant_stats = tenant_cache_stats()
+    return [
+        ("diagnostic_sessions_active", "gauge", "Diagnostic sessions alive, in memory or spilled to disk",
+         [({"tier": "resident"}, store["resident"]), ({"tier": "spilled"}, store["spilled"])]),
+        ("admission_decisions_total", "counter", "Admission control decisions on diagnostic endpoints",
+         [({"decision": decision}, count) for decision, count in admission_stats["decisions"].items()]),
+        ("admission_queue_milliseconds", "gauge", "Smoothed inference queue latency used for load shedding",
+         [({"source": "event_loop"}, admission_stats["loop_lag_ms"]),
+          ({"source": "inference_pool"}, admission_stats["pool_wait_ms"])]),
+        ("model_version_sessions", "gauge", "Sessions pinned to each loaded model version",
+         [({"version": version["id"], "status": version["status"]}, version["sessions"])
+          for version in models.describe()["versions"]]),
+        ("tenant_model_cache_bytes", "gauge", "Estimated bytes of the cached tenant model variants",
+         [({}, tenant_stats["bytes"])]),
+        ("tenant_model_cache_evictions_total", "counter", "Tenant model variants evicted from the LRU",
+         [({}, tenant_stats["evictions"])]),
+    ]
+
+metrics.register_collector(collect_runtime_metrics)
+
+@app.get("/metrics")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Métricas en formato de texto de Prometheus"""
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/sessions")
+async def get_session_store_stats(admin: User = Depends(get_admin_user)):
+    """Sesiones en memoria frente a sesiones enviadas a disco"""
+    return sessions.stats()
+
+@app.get("/admin/question-stats")
+async def get_question_stats(admin: User = Depends(get_admin_user)):
+    """Promedio de preguntas por sesión terminada, por tipo y modo"""
+    return [
+        {
+            "diagnostic_type": diagnostic_type,
+            "mode": mode,
+            "sessions": finished,
+            "average_questions": questions / finished
+        }
+        for (diagnostic_type, mode), (finished, questions) in sorted(question_stats.items())
+    ]
+
+@app.post("/admin/learn-cpds")
+async def learn_cpds(admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Actualiza las CPDs con las sesiones nuevas y guarda una nueva versión del artefacto"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, cpd_learning.learn, db, DiagnosticSessionRecord)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+@app.get("/admin/vehicle-context")
+async def get_vehicle_context_cache(admin: User = Depends(get_admin_user)):
+    """Aciertos y fallos al buscar las variantes por contexto de vehículo"""
+    return context_cache_info()
+
+@app.get("/admin/admission")
+async def get_admission_stats(admin: User = Depends(get_admin_user)):
+    """Decisiones del control de admisión y latencia actual de la cola de inferencia"""
+    return admission.stats()
+
+@app.get("/admin/tenants")
+async def get_tenant_models(admin: User = Depends(get_admin_user)):
+    """Variantes por cliente en memoria, su tamaño estimado y los desalojos de la LRU"""
+    return tenant_cache_stats()
+
+@app.get("/admin/query-plans")
+async def get_query_plans(admin: User = Depends(get_admin_user)):
+    """
+    Planes de consulta cacheados: nodos podados, tamaño de factores y, con
+    QUERY_PLANNER_MEASURE, tiempo ahorrado frente a pgmpy
+    """
+    report = {}
+    for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+        planner = getattr(get_inference(diagnostic_type), "planner", None)
+        if planner is not None:
+            report[diagnostic_type] = planner.report()
+    return report
+
+class ModelLoadRequest(BaseModel):
+    # Tipo -> número de versión del artefacto de CPDs (null = CPDs del código);
+    # los tipos que no aparecen usan el último artefacto
+    artifacts: Dict[str, Optional[int]] = {}
+    activate: bool = True
+
+@app.get("/admin/models")
+async def get_model_versions(admin: User = Depends(get_admin_user)):
+    """Versiones de modelos cargadas, la activa y las sesiones fijadas a cada una"""
+    return models.describe()
+
+@app.post("/admin/models/load")
+async def load_model_version(request: ModelLoadRequest, admin: User = Depends(get_admin_user)):
+    """Carga y precalienta una versión en segundo plano; con activate=True pasa a ser la actual al terminar"""
+    try:
+        version_id = models.load(request.artifacts, request.activate)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"id": version_id, "status": "loading"}
+
+@app.post("/admin/models/rollback")
+async def rollback_model_version(admin: User = Depends(get_admin_user)):
+    """Vuelve a la versión activa anterior"""
+    try:
+        version = models.rollback()
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"current": version.id}
+
+@app.post("/admin/models/{version_id}/activate")
+async def activate_model_version(version_id: str, admin: User = Depends(get_admin_user)):
+    """Usa una versión ya cargada para las sesiones nuevas"""
+    try:
+        version = models.activate(version_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"current": version.id}
+
+class RuleProfileRequest(BaseModel):
+    enabled: bool
+    reset: bool = False
+
+@app.get("/admin/rule-profile")
+async def get_rule_profile(recent: int = 20, admin: User = Depends(get_admin_user)):
+    """Activaciones, operaciones de agenda y hechos por respuesta, y tiempo de cada regla de los motores"""
+    return rule_profiler.report(recent)
+
+@app.post("/admin/rule-profile")
+async def set_rule_profiling(request: RuleProfileRequest, admin: User = Depends(get_admin_user)):
+    """Activa o desactiva el perfilado de reglas; con reset=True descarta lo acumulado"""
+    if request.reset:
+        rule_profiler.reset()
+    rule_profiler.enabled = request.enabled
+    return {"enabled": rule_profiler.enabled}
+
+@app.get("/admin/rule-profile/flamegraph")
+async def get_rule_flamegraph(admin: User = Depends(get_admin_user)):
+    """Disparos de reglas del buffer en formato de pilas colapsadas (flamegraph.pl, speedscope)"""
+    return Response(content=rule_profiler.collapsed_stacks(), media_type="text/plain")
+
+class ProfilingSettings(BaseModel):
+    # null deja el valor actual
+    sample_rate: Optional[float] = None
+    slow_ms: Optional[float] = None
+    clear: bool = False
+
+@app.get("/admin/profiles")
+async def get_request_profiles(admin: User = Depends(get_admin_user)):
+    """Perfiles guardados por ruta: duración, motivo (muestreada o lenta) y número de muestras"""
+    return request_profiler.report()
+
+@app.post("/admin/profiles")
+async def configure_request_profiling(settings: ProfilingSettings, admin: User = Depends(get_admin_user)):
+    """Cambia la fracción de peticiones perfiladas y el umbral de petición lenta (0 desactiva)"""
+    if settings.clear:
+        request_profiler.clear()
+    request_profiler.configure(settings.sample_rate, settings.slow_ms)
+    return {"sample_rate": request_profiler.sample_rate, "slow_ms": request_profiler.slow_ms}
+
+@app.get("/admin/profiles/collapsed")
+async def get_collapsed_profiles(route: Optional[str] = None, index: Optional[int] = None,
+                                 admin: User = Depends(get_admin_user)):
+    """
+    Pilas colapsadas (flamegraph.pl, speedscope) de los perfiles de una ruta,
+    p. ej. /api/diagnostic/{session_id}/answer, o de todas; `index` elige un solo perfil
+    """
+    try:
+        stacks = request_profiler.collapsed_stacks(route, index)
+    except (KeyError, IndexError):
+        raise HTTPException(status_code=404, detail="No such profile")
+    return Response(content=stacks, media_type="text/plain")
+
+# Estructuras de este módulo que crecen con el tráfico, para /admin/memory
+for name, cache in (("idempotency_responses", answer_responses), ("session_journal", journal),
+                    ("rate_limit_users", admission.users), ("rate_limit_ips", admission.ips),
+                    ("question_stats", question_stats), ("rule_profiler", rule_profiler),
+                    ("request_profiles", request_profiler)):
+    register_cache(name, cache)
+
+memory_snapshots = Snapshots()
+
+def memory_usage(resident, sample):
+    """
+    Tamaño aproximado de lo que retiene el proceso. Se mide primero lo
+    compartido (modelos, cachés) y después las sesiones, que solo suman lo
+    suyo. De cada tipo y modo se miden como mucho `sample` sesiones de
+    `resident` y el resto se extrapola.
+    """
+    seen = set()
+    versions = []
+    for version_id, version in list(models.versions.items()):
+        # Los modelos antes que lo derivado: bundles y variantes apuntan a ellos
+        inference = {diagnostic_type: deep_sizeof(model, seen)
+                     for diagnostic_type, model in list(version.inference.items())}
+        derived = {}
+        for key, value in list(version.derived.items()) + version.variants.items():
+            derived[key[0]] = derived.get(key[0], 0) + deep_sizeof(value, seen)
+        versions.append({
+            "id": version_id,
+            "status": models.status.get(version_id),
+            "inference_bytes": inference,
+            "derived_bytes": derived,
+        })
+    caches = report_caches(seen)
+
+    groups = {}
+    for _, session in resident:
+        groups.setdefault(f"{session.diagnostic_type}/{session.mode}", []).append(session)
+    engines = {}
+    for name, group in sorted(groups.items()):
+        measured = group[:sample]
+        engine_bytes = {}
+        session_bytes = facts = 0
+        for session in measured:
+            if session.engine is not None:
+                for part, size in engine_sizes(session.engine, seen).items():
+                    engine_bytes[part] = engine_bytes.get(part, 0) + size
+                facts += len(getattr(session.engine, "facts", ()))
+            session_bytes += deep_sizeof(session, seen)
+        count = len(measured)
+        engines[name] = {
+            "sessions": len(group),
+            "measured": count,
+            "engine_bytes_per_session": {part: size // count for part, size in engine_bytes.items()},
+            "session_bytes_per_session": session_bytes // count,
+            "facts_per_session": round(facts / count, 2),
+            "estimated_bytes": (sum(engine_bytes.values()) + session_bytes) * len(group) // count,
+        }
+    return {"models": versions, "caches": caches, "engines": engines}
+
+@app.get("/admin/memory")
+async def get_memory_usage(sample: int = 20, admin: User = Depends(get_admin_user)):
+    """
+    Bytes aproximados del almacén de sesiones, de la memoria de trabajo de
+    los motores por tipo, de cada modelo cacheado y de cada capa de caché
+    """
+    resident = sessions.resident()
+    report = await asyncio.get_running_loop().run_in_executor(None, memory_usage, resident, max(1, sample))
+    report["sessions"] = {
+        "resident": len(resident),
+        "resident_estimated_bytes": sum(engine["estimated_bytes"] for engine in report["engines"].values()),
+        "spilled": sessions.spilled_count(),
+        "spilled_bytes": sessions.spilled_bytes(),
+    }
+    report["process"] = process_memory()
+    return report
+
+@app.post("/admin/memory/snapshots")
+async def take_memory_snapshot(admin: User = Depends(get_admin_user)):
+    """Toma una instantánea de tracemalloc; la primera empieza el trazado"""
+    return await asyncio.get_running_loop().run_in_executor(None, memory_snapshots.take)
+
+@app.get("/admin/memory/snapshots")
+async def list_memory_snapshots(admin: User = Depends(get_admin_user)):
+    return memory_snapshots.list()
+
+@app.get("/admin/memory/snapshots/diff")
+async def diff_memory_snapshots(start: int, end: Optional[int] = None, key_type: str = "lineno", limit: int = 30,
+                                admin: User = Depends(get_admin_user)):
+    """
+    Lo que más creció entre dos instantáneas (sin `end`, hasta ahora),
+    agrupado por línea ("lineno"), archivo ("filename") o pila ("traceback")
+    """
+    if key_type not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="key_type must be lineno, filename or traceback")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, memory_snapshots.diff, start, end, key_type, limit)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No such snapshot")
+
+@app.delete("/admin/memory/snapshots")
+async def stop_memory_tracing(admin: User = Depends(get_admin_user)):
+    """Descarta las instantáneas y detiene tracemalloc, que ralentiza todas las asignaciones"""
+    memory_snapshots.stop()
+    return {"tracing": False}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Approximate memory accounting and tracemalloc snapshot diffs.
+
+deep_sizeof walks gc.get_referents from a root and adds up sys.getsizeof of
+everything reachable, stopping at classes, modules and functions. Sizes are
+attributed in the order objects are measured: with a shared `seen` set, an
+object reachable from two roots is counted under the first one only, so
+measure shared things (models) before the things that point at them
+(sessions).
+
+Modules register their caches with register_cache so one report covers
+them all without reaching into private module state.
+"""
+import gc
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import OrderedDict
+
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+TRACEMALLOC_KEEP = int(os.getenv("TRACEMALLOC_KEEP", "5"))
+
+_STOP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+               types.CodeType, types.FrameType)
+
+_caches = []
+
+
+def register_cache(name, cache):
+    """Adds an object to report_caches"""
+    _caches.append((name, cache))
+
+
+def deep_sizeof(root, seen=None):
+    """Bytes reachable from `root` not already in `seen` (object ids), which is updated"""
+    seen = set() if seen is None else seen
+    total = 0
+    pending = [root]
+    while pending:
+        objects = []
+        for obj in pending:
+            if id(obj) in seen or isinstance(obj, _STOP_TYPES):
+                continue
+            seen.add(id(obj))
+            total += sys.getsizeof(obj, 0)
+            objects.append(obj)
+        pending = gc.get_referents(*objects) if objects else []
+    return total
+
+
+def report_caches(seen):
+    report = {}
+    for name, cache in _caches:
+        report[name] = {"entries": len(cache) if hasattr(cache, "__len__") else None,
+                        "bytes": deep_sizeof(cache, seen)}
+    return report
+
+
+def engine_sizes(engine, seen):
+    """
+    Working memory of one engine: for experta engines the fact list, the
+    agenda and the Rete matcher, measured apart; the rest under "other"
+    """
+    # The matcher points back to the engine; keep the engine itself out of its part
+    shell = [id(engine), id(getattr(engine, "__dict__", None))]
+    shell = [object_id for object_id in shell if object_id not in seen]
+    seen.update(shell)
+    sizes = {}
+    for part in ("facts", "agenda", "matcher"):
+        value = getattr(engine, part, None)
+        if value is not None:
+            sizes[part] = deep_sizeof(value, seen)
+    seen.difference_update(shell)
+    sizes["other"] = deep_sizeof(engine, seen)
+    return sizes
+
+
+def process_memory():
+    memory = {}
+    try:
+        with open("/proc/self/statm") as statm:
+            memory["rss_bytes"] = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        # Peak, in KiB on Linux
+        memory["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if tracemalloc.is_tracing():
+        memory["traced_bytes"], memory["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+    return memory
+
+
+class Snapshots:
+    """
+    tracemalloc snapshots kept by id, the `keep` most recent. Taking the
+    first one starts tracing, so only allocations made after it are seen;
+    compare two later snapshots to find what grows.
+    """
+
+    def __init__(self, keep=TRACEMALLOC_KEEP, frames=TRACEMALLOC_FRAMES):
+        self.keep = keep
+        self.frames = frames
+        self._snapshots = OrderedDict()  # id -> (time, snapshot)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def take(self):
+        return self._describe(*self._take())
+
+    def _take(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        taken = time.time()
+        with self._lock:
+            snapshot_id = next(self._ids)
+            self._snapshots[snapshot_id] = (taken, snapshot)
+            while len(self._snapshots) > self.keep:
+                self._snapshots.popitem(last=False)
+        return snapshot_id, taken, snapshot
+
+    def _describe(self, snapshot_id, taken, snapshot):
+        return {"id": snapshot_id, "time": taken, "traced_bytes": sum(trace.size for trace in snapshot.traces)}
+
+    def list(self):
+        with self._lock:
+            snapshots = list(self._snapshots.items())
+        return {"tracing": tracemalloc.is_tracing(), "frames": self.frames,
+                "snapshots": [self._describe(snapshot_id, *entry) for snapshot_id, entry in snapshots]}
+
+    def diff(self, start, end=None, key_type="lineno", limit=30):
+        """
+        Largest differences from snapshot `start` to snapshot `end` (a new
+        one when None). Raises KeyError for unknown ids.
+        """
+        # Both are resolved before taking a new snapshot, which may evict `start`
+        with self._lock:
+            start_time, start_snapshot = self._snapshots[start]
+            if end is not None:
+                end_time, end_snapshot = self._snapshots[end]
+        if end is None:
+            end, end_time, end_snapshot = self._take()
+        stats = end_snapshot.compare_to(start_snapshot, key_type)
+        return {
+            "start": start,
+            "end": end,
+            "seconds": round(end_time - start_time, 3),
+            "size_diff": sum(stat.size_diff for stat in stats),
+            "count_diff": sum(stat.count_diff for stat in stats),
+            "top": [
+                {"location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                 "size_diff": stat.size_diff, "size": stat.size,
+                 "count_diff": stat.count_diff, "count": stat.count}
+                for stat in stats[:limit]
+            ],
+        }
+
+    def stop(self):
+        with self._lock:
+            self._snapshots.clear()
+        tracemalloc.stop()
@@ -0,0 +1,195 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms keep one series per label tuple behind a
+per-metric lock, so they can be updated from the event loop and from the
+worker pools. Observing a histogram is a bisect plus three additions.
+Values that already live elsewhere (session counts, admission decisions)
+are read at scrape time through collectors instead of being mirrored.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self._header() + [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+                                 for labels, value in series]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self._header() + [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+                                 for labels, value in series]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count)
+                            in self._series.items())
+        lines = self._header()
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.label_names, labels, ('le', _format_value(float(bound))))}"
+                             f" {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+def register_collector(collector):
+    """
+    Adds a function called at every scrape. It returns a list of
+    (name, kind, documentation, [(labels dict, value), ...]).
+    """
+    _collectors.append(collector)
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def instrument_inference(inference, diagnostic_type):
+    """Times every infer_problem call of one inference instance"""
+    infer_problem = inference.infer_problem
+    backend = type(inference).__name__
+
+    def timed_infer_problem(evidence_dict):
+        start = time.perf_counter()
+        try:
+            return infer_problem(evidence_dict)
+        finally:
+            INFER_PROBLEM_SECONDS.observe(time.perf_counter() - start, diagnostic_type, backend)
+
+    inference.infer_problem = timed_infer_problem
+    return inference
+
+
+# Request stages
+JWT_DECODE_SECONDS = Histogram("auth_jwt_decode_seconds", "JWT decoding and validation in get_current_user")
+USER_LOOKUP_SECONDS = Histogram("auth_user_lookup_seconds", "User lookup by email in get_current_user")
+ENGINE_RUN_SECONDS = Histogram("engine_run_seconds", "Rule engine run() after a start or an answer",
+                               ("diagnostic_type", "mode"))
+INFER_PROBLEM_SECONDS = Histogram("infer_problem_seconds", "Posterior of the root causes for one evidence set",
+                                  ("diagnostic_type", "backend"))
+MODEL_BUILD_SECONDS = Histogram("model_build_seconds", "Building an inference model and its backend",
+                                ("diagnostic_type", "backend"), buckets=LATENCY_BUCKETS + (30.0, 60.0))
+DB_COMMIT_SECONDS = Histogram("db_commit_seconds", "Commit of a finished diagnostic session", ("endpoint",))
+
+# Sessions
+SESSIONS_STARTED = Counter("diagnostic_sessions_started_total", "Diagnostic sessions started",
+                           ("diagnostic_type", "mode"))
+SESSIONS_FINISHED = Counter("diagnostic_sessions_finished_total", "Diagnostic sessions that reached a diagnosis",
+                            ("diagnostic_type", "mode"))
+SESSIONS_EXPIRED = Counter("diagnostic_sessions_expired_total",
+                           "Diagnostic sessions closed after SESSION_TTL_SECONDS without answers",
+                           ("diagnostic_type", "mode"))
+SESSION_DURATION_SECONDS = Histogram("diagnostic_session_duration_seconds",
+                                     "Time from the start of a session to its diagnosis", ("diagnostic_type",),
+                                     buckets=DURATION_BUCKETS)
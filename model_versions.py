@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from compiled_network import get_compiled_network
+from diagnostic_systems import (CPD_ARTIFACT_DIR, DIAGNOSTIC_SYSTEMS, ModelVersion, current_version,
+                                set_current_version)
+from information_gain import cause_messages, get_selector
+from offline_bundle import get_bundle
+from question_catalog import get_catalog
+
+# Previously active versions kept loaded for rollback
+MODEL_VERSIONS_KEEP = int(os.getenv("MODEL_VERSIONS_KEEP", "2"))
+
+
+def warm(version):
+    """
+    Builds everything a session touches for every diagnostic type, so the
+    first requests after a swap do not pay for it.
+    """
+    for diagnostic_type in DIAGNOSTIC_SYSTEMS:
+        inference = version.get(diagnostic_type)
+        get_compiled_network(diagnostic_type, version)
+        get_selector(diagnostic_type, None, version)
+        cause_messages(diagnostic_type, None, version)
+        get_bundle(diagnostic_type, version)
+        nodes = set(inference.model.nodes())
+        inference.infer_problem({})
+        for path, _ in get_catalog(diagnostic_type).leaf_paths():
+            inference.infer_problem({fact: answer == "yes" for fact, answer in path if fact in nodes})
+
+
+class ModelVersionManager:
+    """
+    Loads model versions in the background and swaps them in for new
+    sessions. A session keeps the version it started with until it finishes
+    or is closed as abandoned (SESSION_TTL_SECONDS in main), and old versions are dropped once no session is pinned to them and they
+    are out of the rollback window.
+
+    Rules are Python code and change with deployments; a model version covers
+    the inference side (CPD artifacts and everything compiled from them).
+    """
+
+    def __init__(self, keep=MODEL_VERSIONS_KEEP):
+        self.keep = keep
+        initial = current_version()
+        self.versions = OrderedDict([(initial.id, initial)])
+        self.status = {initial.id: "active"}
+        self.errors = {}
+        self.history = [initial.id]
+        self._counter = 1
+        # Called with the id of every retired version
+        self.on_retire = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+
+    def get(self, version_id):
+        return self.versions.get(version_id)
+
+    def artifact_paths(self, artifact_versions):
+        """Type -> artifact version number (or None for the CPDs in the code) as paths"""
+        paths = {}
+        for diagnostic_type, number in (artifact_versions or {}).items():
+            if diagnostic_type not in DIAGNOSTIC_SYSTEMS:
+                raise ValueError(f"Unknown diagnostic type '{diagnostic_type}'")
+            if number is None:
+                paths[diagnostic_type] = None
+                continue
+            if not CPD_ARTIFACT_DIR:
+                raise ValueError("CPD_ARTIFACT_DIR is not set")
+            path = os.path.join(CPD_ARTIFACT_DIR, f"{diagnostic_type}-v{int(number)}.json")
+            if not os.path.exists(path):
+                raise ValueError(f"Artifact {path} does not exist")
+            paths[diagnostic_type] = path
+        return paths
+
+    def load(self, artifact_versions=None, activate=True):
+        """Starts building a version in the background and returns its id"""
+        artifacts = self.artifact_paths(artifact_versions)
+        with self._lock:
+            self._counter += 1
+            version = ModelVersion(f"v{self._counter}", artifacts)
+            self.versions[version.id] = version
+            self.status[version.id] = "loading"
+        self._pool.submit(self._build, version, activate)
+        return version.id
+
+    def _build(self, version, activate):
+        try:
+            warm(version)
+        except Exception as exc:
+            with self._lock:
+                self.status[version.id] = "failed"
+                self.errors[version.id] = str(exc)
+                self.versions.pop(version.id, None)
+            return
+        with self._lock:
+            self.status[version.id] = "ready"
+        if activate:
+            self.activate(version.id)
+
+    def activate(self, version_id):
+        with self._lock:
+            version = self.versions.get(version_id)
+            if version is None or self.status.get(version_id) not in ("ready", "active", "retained"):
+                raise ValueError(f"Version {version_id} is not ready")
+            previous = current_version()
+            set_current_version(version)
+            if previous is not version:
+                self.status[previous.id] = "retained"
+            self.status[version_id] = "active"
+            if version_id in self.history:
+                self.history.remove(version_id)
+            self.history.append(version_id)
+            self._retire()
+        return version
+
+    def rollback(self):
+        """Goes back to the version that was active before the current one"""
+        with self._lock:
+            candidates = [version_id for version_id in self.history[:-1] if version_id in self.versions]
+            if not candidates:
+                raise ValueError("No previous version to roll back to")
+            self.history.pop()
+            target = candidates[-1]
+        return self.activate(target)
+
+    def pin(self, version):
+        # Tenant variants pin the version they are derived from
+        version = getattr(version, "base", version)
+        with self._lock:
+            version.sessions += 1
+
+    def unpin(self, version):
+        version = getattr(version, "base", version)
+        with self._lock:
+            version.sessions -= 1
+            self._retire()
+
+    def _retire(self):
+        """Drops versions outside the rollback window that no session uses (lock held)"""
+        current = current_version()
+        window = set(self.history[-(self.keep + 1):])
+        for version_id, version in list(self.versions.items()):
+            if version is current or version_id in window or self.status.get(version_id) == "loading":
+                continue
+            if version.sessions <= 0:
+                del self.versions[version_id]
+                self.status[version_id] = "retired"
+                for callback in self.on_retire:
+                    callback(version_id)
+        self.history = [version_id for version_id in self.history if version_id in self.versions]
+
+    def describe(self):
+        with self._lock:
+            current = current_version()
+            return {
+                "current": current.id,
+                "history": list(self.history),
+                "versions": [
+                    {
+                        "id": version_id,
+                        "status": self.status.get(version_id),
+                        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(version.created_at)),
+                        "sessions": version.sessions,
+                        "artifacts": {diagnostic_type: version.artifact_path(diagnostic_type)
+                                      for diagnostic_type in DIAGNOSTIC_SYSTEMS},
+                    }
+                    for version_id, version in self.versions.items()
+                ],
+                "failed": dict(self.errors),
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
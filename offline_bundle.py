@@ -0,0 +1,125 @@
+import hashlib
+import json
+
+from diagnostic_systems import current_version, get_inference
+from question_catalog import get_catalog
+
+
+class BundleValidationError(ValueError):
+    """A submitted path does not follow the rule tree of the bundle"""
+
+
+def _flatten_tree(tree):
+    """
+    Turns the catalog tree into a flat transition table.
+
+    Each node is [fact_id, yes, no]. A child >= 0 is the index of the next
+    node, a negative child -(m + 1) is leaf message m, and null means the rules
+    have no follow-up for that answer.
+    """
+    catalog_nodes = [tree]
+    index = {id(tree): 0}
+    table = []
+    position = 0
+    while position < len(catalog_nodes):
+        node = catalog_nodes[position]
+        position += 1
+        row = [node["fact"]]
+        for answer in ("yes", "no"):
+            child = node[answer]
+            if child is None:
+                row.append(None)
+            elif "message" in child:
+                row.append(-(child["message"] + 1))
+            else:
+                if id(child) not in index:
+                    index[id(child)] = len(catalog_nodes)
+                    catalog_nodes.append(child)
+                row.append(index[id(child)])
+        table.append(row)
+    return table
+
+
+def _network_tables(inference):
+    cpds = []
+    for cpd in inference.model.get_cpds():
+        cpds.append({
+            "variable": cpd.variable,
+            "parents": list(cpd.variables[1:]),
+            "cardinality": [int(card) for card in cpd.cardinality],
+            # Rows are the variable states, columns the parent configurations
+            # with the last parent varying fastest
+            "values": [[round(float(value), 6) for value in row] for row in cpd.get_values()],
+        })
+    return {
+        "problems": list(inference.problems),
+        "labels": dict(inference.problem_mapping),
+        "cpds": cpds,
+    }
+
+
+class OfflineBundle:
+    """Everything a client needs to run one diagnostic type without the server"""
+
+    def __init__(self, diagnostic_type, inference=None):
+        catalog = get_catalog(diagnostic_type)
+        inference = inference or get_inference(diagnostic_type)
+        self.diagnostic_type = diagnostic_type
+        self.inference = inference
+        self.catalog = catalog
+        self.network_nodes = set(inference.model.nodes())
+        table = _flatten_tree(catalog.tree)
+        content = {
+            "format": 1,
+            "diagnostic_type": diagnostic_type,
+            "catalog_version": catalog.version,
+            "facts": list(catalog.facts),
+            "questions": list(catalog.questions),
+            "messages": list(catalog.messages),
+            "transitions": [[catalog.fact_id(row[0])] + row[1:] for row in table],
+            "network": _network_tables(inference),
+        }
+        canonical = json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        self.version = hashlib.sha256(canonical).hexdigest()[:16]
+        self.document = json.dumps(dict(content, version=self.version), separators=(",", ":")).encode("utf-8")
+
+    def follow(self, answers):
+        """
+        Walks the rule tree with a finished list of (fact, answer) pairs.
+
+        Returns:
+            tuple: (evidence list, diagnostic message).
+        """
+        node = self.catalog.tree
+        evidence = []
+        for position, (fact, answer) in enumerate(answers):
+            if node is None or "fact" not in node:
+                raise BundleValidationError(f"Answer {position} comes after the diagnosis was reached")
+            if fact != node["fact"]:
+                raise BundleValidationError(f"Answer {position} is for '{fact}', expected '{node['fact']}'")
+            if answer not in ("yes", "no"):
+                raise BundleValidationError("Answer must be 'yes' or 'no'")
+            evidence.append((fact, answer == "yes"))
+            node = node[answer]
+        if node is None or "message" not in node:
+            raise BundleValidationError("The path does not reach a diagnosis")
+        return evidence, self.catalog.messages[node["message"]]
+
+    def diagnose(self, answers):
+        """Validates a completed path and computes its diagnostic on the server"""
+        evidence, message = self.follow(answers)
+        # Facts without a node in the network carry no probabilistic evidence
+        evidence_dict = {fact: value for fact, value in evidence if fact in self.network_nodes}
+        probabilities = self.inference.infer_problem(evidence_dict)
+        return {
+            "most_probable_problem": max(probabilities, key=probabilities.get),
+            "probabilities": probabilities,
+            "diagnostic_message": message
+        }
+
+
+def get_bundle(diagnostic_type, version=None):
+    """Bundle of a model version; a new version gets a new bundle version"""
+    version = version or current_version()
+    return version.cached(("bundle", diagnostic_type),
+                          lambda: OfflineBundle(diagnostic_type, version.get(diagnostic_type)))
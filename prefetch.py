@@ -0,0 +1,82 @@
+from information_gain import adaptive_message, get_selector
+
+
+def _rule_node(catalog, turns, answers):
+    """Node of the compiled rule tree the session is currently at"""
+    node = catalog.tree
+    for fact_id, answer in zip(turns, answers):
+        if node is None or "fact" not in node or node["fact"] != catalog.facts[fact_id]:
+            return None
+        # A missing child means the engine repeats the same question
+        node = node[answer] or node
+    return node
+
+
+def _describe_diagnosis(session, catalog, message, compact):
+    """Diagnosis marker with the message the session would end with, tenant overrides included"""
+    message = session.model_version.message(session.diagnostic_type, message)
+    if not compact:
+        return {"diagnosis": True, "diagnostic_message": message}
+    branch = {"diagnosis": True, "message_id": catalog.message_ids.get(message)}
+    if branch["message_id"] is None and message:
+        # Tenant messages are not in the catalog: they are sent as text, as in the final diagnosis
+        branch["diagnostic_message"] = message
+    return branch
+
+
+def _describe_rule_child(session, catalog, child, depth, compact):
+    if child is None:
+        return None
+    if "message" in child:
+        return _describe_diagnosis(session, catalog, catalog.messages[child["message"]], compact)
+    branch = {"question_id": child["fact"]}
+    if not compact:
+        branch["question"] = child["question"]
+    if depth > 1:
+        for answer in ("yes", "no"):
+            branch[answer] = _describe_rule_child(session, catalog, child[answer], depth - 1, compact)
+    return branch
+
+
+def _describe_adaptive(session, catalog, selector, evidence, depth, compact):
+    symptom = selector.next_symptom(evidence)
+    if symptom is None:
+        message = adaptive_message(session.diagnostic_type, evidence, session.context, session.model_version)
+        return _describe_diagnosis(session, catalog, message, compact)
+    branch = {"question_id": symptom}
+    if not compact:
+        branch["question"] = catalog.question(catalog.fact_id(symptom))
+    if depth > 1:
+        for answer in ("yes", "no"):
+            branch[answer] = _describe_adaptive(
+                session, catalog, selector, dict(evidence, **{symptom: answer == "yes"}), depth - 1, compact)
+    return branch
+
+
+def prefetch_branches(session, depth, compact=False):
+    """
+    Follow-up question for each possible answer to the current question, down
+    to `depth` levels, computed without touching the live engine.
+
+    Returns:
+        dict: {"yes": branch, "no": branch}, where a branch is the next question,
+        a {"diagnosis": True, ...} marker, or None when the rules have no
+        follow-up and would repeat the current question.
+    """
+    engine = session.engine
+    catalog = session.catalog
+    current = engine.current_fact
+    if depth < 1 or current is None or engine.diagnostic_complete:
+        return None
+
+    if session.mode == "adaptive":
+        selector = get_selector(session.diagnostic_type, session.context, session.model_version)
+        evidence = dict(engine.evidence_list)
+        return {answer: _describe_adaptive(session, catalog, selector, dict(evidence, **{current: answer == "yes"}),
+                                           depth, compact)
+                for answer in ("yes", "no")}
+
+    node = _rule_node(catalog, session.turns, session.answers())
+    if node is None or node.get("fact") != current:
+        return None
+    return {answer: _describe_rule_child(session, catalog, node[answer], depth, compact) for answer in ("yes", "no")}
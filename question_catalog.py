@@ -0,0 +1,146 @@
+import hashlib
+import json
+import sys
+from collections import deque
+
+from experta import Fact
+
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS
+from memory_report import register_cache
+
+
+class QuestionCatalog:
+    """
+    Interned question texts of one diagnostic type, indexed by fact id.
+
+    Fact ids are assigned in breadth-first order over the rule tree, so they are
+    stable for a given rule set and small enough to be packed into bitsets.
+    """
+
+    __slots__ = ("diagnostic_type", "facts", "questions", "fact_ids", "messages", "message_ids", "tree",
+                 "version", "document")
+
+    def __init__(self, diagnostic_type, facts, questions, messages, tree):
+        self.diagnostic_type = diagnostic_type
+        self.facts = tuple(facts)
+        self.questions = tuple(sys.intern(question) for question in questions)
+        self.fact_ids = {fact: fact_id for fact_id, fact in enumerate(self.facts)}
+        self.messages = tuple(messages)
+        self.message_ids = {message: message_id for message_id, message in enumerate(self.messages)}
+        self.tree = tree
+        content = {
+            "diagnostic_type": diagnostic_type,
+            "questions": [{"id": fact, "text": question} for fact, question in zip(self.facts, self.questions)],
+            "messages": [{"id": message_id, "text": message} for message_id, message in enumerate(self.messages)],
+        }
+        # The version is a hash of the content, so it doubles as a strong ETag
+        canonical = json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        self.version = hashlib.sha256(canonical).hexdigest()[:16]
+        self.document = json.dumps(dict(content, version=self.version), separators=(",", ":")).encode("utf-8")
+
+    def fact_id(self, fact):
+        return self.fact_ids[fact]
+
+    def question(self, fact_id):
+        return self.questions[fact_id]
+
+    def leaf_paths(self):
+        """
+        Every path through the rule tree that reaches a diagnosis, depth first
+        with "yes" before "no". Answers the rules have no branch for (the
+        question is asked again) do not lead anywhere and are skipped.
+
+        Yields:
+            tuple: ([(fact, answer), ...], message id of the leaf).
+        """
+        stack = [(self.tree, ())]
+        while stack:
+            node, path = stack.pop()
+            if node is None:
+                continue
+            if "message" in node:
+                yield list(path), node["message"]
+                continue
+            for answer in ("no", "yes"):
+                stack.append((node[answer], path + ((node["fact"], answer),)))
+
+
+def _explore_step(diagnostic_type, answers):
+    """
+    Replays `answers` on a fresh engine without running any inference.
+
+    Returns:
+        tuple: (next fact, next question, diagnostic message or None).
+    """
+    engine_class, action = DIAGNOSTIC_SYSTEMS[diagnostic_type]
+    engine = engine_class()
+    outcome = {}
+
+    def record_diagnostic(evidence_dict, message=""):
+        outcome["message"] = message
+        engine.next_question = None
+
+    # Rules call self.generate_diagnostic; shadow it so leaves skip pgmpy
+    engine.generate_diagnostic = record_diagnostic
+    engine.reset()
+    engine.declare(Fact(action=action))
+    engine.run()
+    for answer in answers:
+        engine.process_answer(answer)
+        engine.run()
+    return engine.current_fact, engine.get_next_question(), outcome.get("message")
+
+
+def explore_rules(diagnostic_type):
+    """
+    Walks every yes/no path of a rule engine.
+
+    Returns:
+        tuple: (root node, questions by fact in discovery order, messages).
+        Nodes are dicts {"fact", "question", "yes", "no"}; leaves are
+        {"message": index}. A child is None when the rules have no follow-up
+        for that answer and the engine would repeat the same question.
+    """
+    questions = {}
+    messages = []
+    message_ids = {}
+
+    def make_node(path, asked):
+        fact, question, message = _explore_step(diagnostic_type, path)
+        if message is not None:
+            if message not in message_ids:
+                message_ids[message] = len(messages)
+                messages.append(message)
+            return {"message": message_ids[message]}
+        if question is None or fact in asked:
+            return None
+        questions.setdefault(fact, question)
+        return {"fact": fact, "question": question, "yes": None, "no": None}
+
+    root = make_node([], set())
+    pending = deque([(root, [], set())]) if root else deque()
+    while pending:
+        node, path, asked = pending.popleft()
+        asked = asked | {node["fact"]}
+        for answer in ("yes", "no"):
+            child = make_node(path + [answer], asked)
+            node[answer] = child
+            if child is not None and "fact" in child:
+                pending.append((child, path + [answer], asked))
+    return root, questions, messages
+
+
+_catalogs = {}
+register_cache("question_catalogs", _catalogs)
+
+
+def get_catalog(diagnostic_type):
+    """Shared catalog for a diagnostic type, built once per process"""
+    catalog = _catalogs.get(diagnostic_type)
+    if catalog is None:
+        tree, questions, messages = explore_rules(diagnostic_type)
+        if len(questions) > 255:
+            raise ValueError("Too many questions to pack fact ids into bytes")
+        catalog = QuestionCatalog(diagnostic_type, questions.keys(), questions.values(), messages, tree)
+        _catalogs[diagnostic_type] = catalog
+    return catalog
@@ -0,0 +1,254 @@
+"""
+Statistical profiling of slow or sampled HTTP requests.
+
+ProfilingMiddleware picks a request for profiling either up front (a random
+PROFILE_SAMPLE_RATE fraction of requests) or once it has been running for
+PROFILE_SLOW_MS, so slow requests are profiled for the part past the
+threshold. A single sampler thread, running only while some request is
+being profiled, reads the stacks of the threads working for it: the event
+loop thread and the inference workers running its jobs (attach_thread).
+Samples are folded into collapsed stacks and kept per route template in a
+bounded store.
+
+With both settings at 0 (the default) the middleware does one attribute
+check per request.
+"""
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Profiles kept per route, and routes kept (least recently profiled are dropped)
+PROFILE_KEEP_PER_ROUTE = int(os.getenv("PROFILE_KEEP_PER_ROUTE", "20"))
+PROFILE_MAX_ROUTES = int(os.getenv("PROFILE_MAX_ROUTES", "100"))
+
+_current = contextvars.ContextVar("request_profile", default=None)
+_labels = {}
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def _collapse(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Profile:
+    __slots__ = ("method", "path", "reason", "started", "seconds", "status", "threads", "stacks", "samples")
+
+    def __init__(self, method, path, reason, thread_id):
+        self.method = method
+        self.path = path
+        self.reason = reason  # "sampled" or "slow"
+        self.started = time.time()
+        self.seconds = None
+        self.status = None
+        self.threads = {thread_id: 1}  # thread id -> jobs of this request running on it
+        self.stacks = Counter()
+        self.samples = 0
+
+    def summary(self):
+        return {"method": self.method, "path": self.path, "reason": self.reason, "started": self.started,
+                "ms": round(self.seconds * 1000, 3), "status": self.status, "samples": self.samples}
+
+
+class _Sampler:
+    """
+    Samples the threads of the active profiles every `interval` seconds while
+    there are any. A profile starts being sampled at its deadline, checked by
+    this thread so that a request blocking the event loop is still caught.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}  # profile -> monotonic time to start sampling it
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, profile, delay=0.0):
+        with self._lock:
+            self._active[profile] = time.monotonic() + delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="request-profiler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def discard(self, profile):
+        with self._lock:
+            self._active.pop(profile, None)
+
+    def attach(self, profile, thread_id):
+        with self._lock:
+            profile.threads[thread_id] = profile.threads.get(thread_id, 0) + 1
+
+    def detach(self, profile, thread_id):
+        with self._lock:
+            remaining = profile.threads[thread_id] - 1
+            if remaining:
+                profile.threads[thread_id] = remaining
+            else:
+                del profile.threads[thread_id]
+
+    def _loop(self):
+        own_id = threading.get_ident()
+        while True:
+            self._wake.wait()
+            while True:
+                now = time.monotonic()
+                with self._lock:
+                    if not self._active:
+                        self._wake.clear()
+                        break
+                    targets = [(profile, list(profile.threads)) for profile, start in self._active.items()
+                               if start <= now]
+                    if not targets:
+                        # Only waiting for deadlines; add() wakes the loop early
+                        self._wake.clear()
+                        next_start = min(self._active.values())
+                if targets:
+                    frames = sys._current_frames()
+                    for profile, thread_ids in targets:
+                        for thread_id in thread_ids:
+                            frame = frames.get(thread_id)
+                            if frame is not None and thread_id != own_id:
+                                profile.stacks[_collapse(frame)] += 1
+                        profile.samples += 1
+                    del frames
+                    time.sleep(self.interval)
+                else:
+                    self._wake.wait(max(next_start - now, 0.0))
+
+
+class RequestProfiler:
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, slow_ms=PROFILE_SLOW_MS, interval_ms=PROFILE_INTERVAL_MS,
+                 keep_per_route=PROFILE_KEEP_PER_ROUTE, max_routes=PROFILE_MAX_ROUTES):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.keep_per_route = keep_per_route
+        self.max_routes = max_routes
+        self.sampler = _Sampler(interval_ms / 1000)
+        self._routes = OrderedDict()  # route template -> deque of finished profiles
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or self.slow_ms > 0
+
+    def configure(self, sample_rate=None, slow_ms=None):
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def store(self, route, profile):
+        with self._lock:
+            profiles = self._routes.get(route)
+            if profiles is None:
+                profiles = self._routes[route] = deque(maxlen=self.keep_per_route)
+                while len(self._routes) > self.max_routes:
+                    self._routes.popitem(last=False)
+            else:
+                self._routes.move_to_end(route)
+            profiles.append(profile)
+
+    @contextmanager
+    def attach_thread(self, profile):
+        """Samples the current thread for `profile` (if any) while the block runs"""
+        if profile is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        self.sampler.attach(profile, thread_id)
+        try:
+            yield
+        finally:
+            self.sampler.detach(profile, thread_id)
+
+    def report(self):
+        with self._lock:
+            routes = {route: [profile.summary() for profile in profiles] for route, profiles in self._routes.items()}
+        return {"sample_rate": self.sample_rate, "slow_ms": self.slow_ms,
+                "interval_ms": self.sampler.interval * 1000, "routes": routes}
+
+    def collapsed_stacks(self, route=None, index=None):
+        """
+        Samples of the stored profiles as collapsed stacks ("frame;frame count"
+        lines, for flamegraph.pl or speedscope), merged over all profiles of
+        `route` (every route when None) or only its profile at `index`.
+        Raises KeyError or IndexError when there is no such profile.
+        """
+        with self._lock:
+            if route is None:
+                profiles = [profile for stored in self._routes.values() for profile in stored]
+            else:
+                profiles = list(self._routes[route])
+                if index is not None:
+                    profiles = [profiles[index]]
+        stacks = Counter()
+        for profile in profiles:
+            stacks.update(profile.stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def current_profile():
+    """Profile of the request being handled in this context, or None"""
+    return _current.get()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware; the route template comes from the scope FastAPI fills in while routing"""
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        sampled = random.random() < profiler.sample_rate
+        if not sampled and profiler.slow_ms <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], "sampled" if sampled else "slow", threading.get_ident())
+        token = _current.set(profile)
+        profiler.sampler.add(profile, 0.0 if sampled else profiler.slow_ms / 1000)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            profile.seconds = time.perf_counter() - started
+            profiler.sampler.discard(profile)
+            _current.reset(token)
+            if sampled or profile.samples:
+                route = scope.get("route")
+                profiler.store(getattr(route, "path", "<unmatched>"), profile)
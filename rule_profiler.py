@@ -0,0 +1,174 @@
+"""
+Opt-in profiling of the experta rule engines.
+
+A step is everything one start or one answer does to an engine: the facts
+declared by process_answer (experta matches them and updates the agenda
+right away when the engine is not running) and the following run(). While
+profiling is on, RuleProfiler.step swaps the engine's run for a copy of
+KnowledgeEngine.run that times every rule's right-hand side, and counts the
+activations added to and removed from the agenda and the facts declared and
+retracted. Firings go into a ring buffer; per-rule totals are kept until
+reset.
+
+Enable with RULE_PROFILING=1 or at runtime from /admin/rule-profile.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from experta import KnowledgeEngine
+
+RULE_PROFILING = os.getenv("RULE_PROFILING", "").lower() in ("1", "true", "yes")
+RULE_PROFILE_BUFFER = int(os.getenv("RULE_PROFILE_BUFFER", "10000"))
+
+
+class _Step:
+    def __init__(self, engine):
+        self.engine = engine
+        self.added = self.removed = 0
+        self.rhs_seconds = 0.0
+        self.firings = []  # (rule, seconds, declared, retracted)
+
+    def get_activations(self):
+        added, removed = KnowledgeEngine.get_activations(self.engine)
+        self.added += len(added)
+        self.removed += len(removed)
+        return added, removed
+
+    def run(self):
+        # Same loop as KnowledgeEngine.run, without steps and watchers
+        engine = self.engine
+        engine.running = True
+        while engine.running:
+            added, removed = engine.get_activations()
+            engine.strategy.update_agenda(engine.agenda, added, removed)
+            activation = engine.agenda.get_next()
+            if activation is None:
+                break
+            last_index = engine.facts.last_index
+            fact_count = len(engine.facts)
+            started = time.perf_counter()
+            activation.rule(engine, **{key: value for key, value in activation.context.items()
+                                       if not key.startswith("__")})
+            seconds = time.perf_counter() - started
+            declared = engine.facts.last_index - last_index
+            self.rhs_seconds += seconds
+            self.firings.append((activation.rule.__name__, seconds, declared,
+                                 declared - (len(engine.facts) - fact_count)))
+        engine.running = False
+
+
+class RuleProfiler:
+    def __init__(self, capacity=RULE_PROFILE_BUFFER, enabled=RULE_PROFILING):
+        self.enabled = enabled
+        self.firings = deque(maxlen=capacity)  # (time, type, rule, seconds, declared, retracted)
+        self.steps = deque(maxlen=capacity)
+        self.rules = {}  # (type, rule) -> [fires, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.firings.clear()
+            self.steps.clear()
+            self.rules.clear()
+
+    @contextmanager
+    def step(self, engine, diagnostic_type):
+        """Profiles what the engine does inside the block; a no-op when disabled or for non-experta engines"""
+        if not self.enabled or not isinstance(engine, KnowledgeEngine):
+            yield
+            return
+        step = _Step(engine)
+        last_index = engine.facts.last_index
+        fact_count = len(engine.facts)
+        # Instance attributes shadow the class methods only for this engine and this step
+        engine.get_activations = step.get_activations
+        engine.run = step.run
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            del engine.get_activations, engine.run
+            self._record(step, diagnostic_type, seconds, engine.facts.last_index - last_index,
+                         len(engine.facts) - fact_count)
+
+    def _record(self, step, diagnostic_type, seconds, declared, fact_delta):
+        now = time.time()
+        with self._lock:
+            for rule, rule_seconds, rule_declared, rule_retracted in step.firings:
+                self.firings.append((now, diagnostic_type, rule, rule_seconds, rule_declared, rule_retracted))
+                stats = self.rules.setdefault((diagnostic_type, rule), [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += rule_seconds
+                stats[2] = max(stats[2], rule_seconds)
+            self.steps.append({
+                "time": now,
+                "diagnostic_type": diagnostic_type,
+                "fired": len(step.firings),
+                "activations_added": step.added,
+                "activations_removed": step.removed,
+                "facts_declared": declared,
+                "facts_retracted": declared - fact_delta,
+                "seconds": seconds,
+                # Matching, agenda updates and whatever else the block did outside the rules
+                "other_seconds": seconds - step.rhs_seconds,
+            })
+
+    def report(self, recent=20):
+        with self._lock:
+            steps = list(self.steps)
+            rules = sorted(self.rules.items(), key=lambda item: item[1][1], reverse=True)
+            firings = list(self.firings)[-recent:]
+        per_type = {}
+        for step in steps:
+            totals = per_type.setdefault(step["diagnostic_type"], {"steps": 0, "fired": 0, "activations_added": 0,
+                                                                   "activations_removed": 0, "facts_declared": 0,
+                                                                   "facts_retracted": 0, "seconds": 0.0})
+            totals["steps"] += 1
+            for key in ("fired", "activations_added", "activations_removed", "facts_declared", "facts_retracted",
+                        "seconds"):
+                totals[key] += step[key]
+        return {
+            "enabled": self.enabled,
+            # Averages per start or answer
+            "per_step": {
+                diagnostic_type: {key: round(value / totals["steps"], 6) for key, value in totals.items()
+                                  if key != "steps"} | {"steps": totals["steps"]}
+                for diagnostic_type, totals in per_type.items()
+            },
+            "rules": [
+                {"diagnostic_type": diagnostic_type, "rule": rule, "fires": fires,
+                 "total_ms": round(total * 1000, 3), "mean_ms": round(total / fires * 1000, 4),
+                 "max_ms": round(longest * 1000, 3)}
+                for (diagnostic_type, rule), (fires, total, longest) in rules
+            ],
+            "recent_firings": [
+                {"diagnostic_type": diagnostic_type, "rule": rule, "ms": round(seconds * 1000, 4),
+                 "facts_declared": declared, "facts_retracted": retracted}
+                for _, diagnostic_type, rule, seconds, declared, retracted in firings
+            ],
+        }
+
+    def collapsed_stacks(self):
+        """
+        Buffered firings in the collapsed-stack format of flamegraph.pl and
+        speedscope: one "frame;frame;frame value" line per stack, in microseconds.
+        Time outside the rules (matching, agenda updates) shows up as "(agenda)".
+        """
+        with self._lock:
+            firings = list(self.firings)
+            steps = list(self.steps)
+        stacks = {}
+        for _, diagnostic_type, rule, seconds, _, _ in firings:
+            key = f"engine;{diagnostic_type};{rule}"
+            stacks[key] = stacks.get(key, 0) + seconds
+        for step in steps:
+            key = f"engine;{step['diagnostic_type']};(agenda)"
+            stacks[key] = stacks.get(key, 0) + step["other_seconds"]
+        return "".join(f"{stack} {max(1, round(seconds * 1e6))}\n" for stack, seconds in sorted(stacks.items()))
+
+
+profiler = RuleProfiler()
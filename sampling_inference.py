@@ -0,0 +1,171 @@
+import os
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+
+# Stop sampling once every root-cause interval is narrower than +/- this
+SAMPLING_TOLERANCE = float(os.getenv("SAMPLING_TOLERANCE", "0.02"))
+SAMPLING_MAX_SAMPLES = int(os.getenv("SAMPLING_MAX_SAMPLES", "50000"))
+SAMPLING_BATCH = int(os.getenv("SAMPLING_BATCH", "5000"))
+SAMPLING_SEED = os.getenv("SAMPLING_SEED")
+# z-score of the reported confidence bounds (95%)
+SAMPLING_Z = 1.96
+
+
+def wilson_bounds(estimate, effective_samples, z=SAMPLING_Z):
+    """Wilson score interval for a proportion measured on `effective_samples` samples"""
+    n = np.maximum(effective_samples, 1e-12)
+    denominator = 1 + z * z / n
+    center = (estimate + z * z / (2 * n)) / denominator
+    half = z * np.sqrt(estimate * (1 - estimate) / n + z * z / (4 * n * n)) / denominator
+    return np.clip(center - half, 0.0, 1.0), np.clip(center + half, 0.0, 1.0)
+
+
+class SamplingInference:
+    """
+    Approximate backend with the interface of StartingInference, based on
+    vectorized likelihood weighting.
+
+    Batches of samples are drawn in topological order, evidence nodes are
+    clamped and weight their sample by P(value | parents). Batches are added
+    until every root-cause marginal has a confidence interval within
+    `tolerance`, or `max_samples` is reached. Unlike the exact backends, the
+    network may have any structure.
+
+    The random generator lives on the instance, so consecutive calls continue
+    the same stream instead of reseeding. Queries from several threads sample
+    concurrently; only the result cache is locked.
+    """
+
+    def __init__(self, base, tolerance=SAMPLING_TOLERANCE, max_samples=SAMPLING_MAX_SAMPLES,
+                 batch_size=SAMPLING_BATCH, seed=SAMPLING_SEED, cache_size=256):
+        self.model = base.model
+        self.problems = base.problems
+        self.problem_mapping = base.problem_mapping
+        self.tolerance = tolerance
+        self.max_samples = max_samples
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(None if seed is None else int(seed))
+        self._lock = threading.Lock()
+        # Recent results, so that the bounds of a diagnosis match its probabilities
+        self._results = OrderedDict()
+        self._cache_size = cache_size
+
+        self.variables = list(nx.topological_sort(self.model))
+        self.index = {variable: position for position, variable in enumerate(self.variables)}
+        cpds = {cpd.variable: cpd for cpd in self.model.get_cpds()}
+        # Per node: (cumulative table by parent column, table, parent positions, parent cardinalities)
+        self.tables = []
+        for variable in self.variables:
+            cpd = cpds[variable]
+            values = cpd.get_values()
+            self.tables.append((
+                np.cumsum(values, axis=0),
+                values,
+                [self.index[parent] for parent in cpd.variables[1:]],
+                [int(card) for card in cpd.cardinality[1:]],
+            ))
+        self.problem_positions = np.array([self.index[problem] for problem in self.problems])
+
+    def _sample_batch(self, evidence, size):
+        """One batch of weighted samples: (samples with shape (size, variables), weights)"""
+        samples = np.empty((size, len(self.variables)), dtype=np.int64)
+        weights = np.ones(size)
+        for position, (cumulative, values, parents, cards) in enumerate(self.tables):
+            column = np.zeros(size, dtype=np.int64)
+            for parent, card in zip(parents, cards):
+                column = column * card + samples[:, parent]
+            if position in evidence:
+                value = evidence[position]
+                samples[:, position] = value
+                weights *= values[value, column]
+            else:
+                draws = self.rng.random(size)
+                states = (draws[None, :] > cumulative[:, column]).sum(axis=0)
+                samples[:, position] = np.minimum(states, len(values) - 1)
+        return samples, weights
+
+    def query(self, evidence_dict):
+        """
+        Estimates P(problem = 1 | evidence) for every root cause.
+
+        Returns:
+            dict: {"probabilities", "lower", "upper"} keyed by problem label,
+            plus the number of samples drawn and the effective sample size.
+        """
+        evidence = {}
+        for variable, value in evidence_dict.items():
+            if variable not in self.index:
+                raise ValueError(f"Node {variable} not in graph")
+            evidence[self.index[variable]] = int(value)
+        key = frozenset(evidence.items())
+
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return cached
+
+        # Sampling runs without the lock so that queries from other threads are not serialized
+        result = self._estimate(evidence)
+
+        with self._lock:
+            # If another thread finished the same query first, keep its result so every
+            # caller sees the same probabilities and bounds
+            result = self._results.setdefault(key, result)
+            self._results.move_to_end(key)
+            if len(self._results) > self._cache_size:
+                self._results.popitem(last=False)
+            return result
+
+    def _estimate(self, evidence):
+        total_weight = 0.0
+        total_square = 0.0
+        hits = np.zeros(len(self.problems))
+        unweighted_hits = np.zeros(len(self.problems))
+        drawn = 0
+        while drawn < self.max_samples:
+            size = min(self.batch_size, self.max_samples - drawn)
+            samples, weights = self._sample_batch(evidence, size)
+            drawn += size
+            present = samples[:, self.problem_positions] == 1
+            total_weight += weights.sum()
+            total_square += (weights * weights).sum()
+            hits += weights @ present
+            unweighted_hits += present.sum(axis=0)
+            if total_weight > 0:
+                estimate = hits / total_weight
+                effective = total_weight ** 2 / total_square
+                lower, upper = wilson_bounds(estimate, effective)
+                if (upper - lower).max() / 2 <= self.tolerance:
+                    break
+        if total_weight == 0:
+            # No sample is consistent with the evidence (it is impossible, or too unlikely
+            # to be drawn): report the prior, estimated from the unweighted samples, with
+            # bounds that say nothing is known
+            estimate = unweighted_hits / drawn
+            effective = 0.0
+            lower = np.zeros(len(self.problems))
+            upper = np.ones(len(self.problems))
+
+        labels = [self.problem_mapping[problem] for problem in self.problems]
+        return {
+            "probabilities": {label: float(p) for label, p in zip(labels, estimate)},
+            "lower": {label: float(p) for label, p in zip(labels, lower)},
+            "upper": {label: float(p) for label, p in zip(labels, upper)},
+            "samples": drawn,
+            "effective_samples": float(effective),
+        }
+
+    def infer_problem(self, evidence_dict):
+        return dict(self.query(evidence_dict)["probabilities"])
+
+    def confidence_bounds(self, evidence_dict):
+        """95% bounds of the estimates returned by infer_problem for the same evidence"""
+        result = self.query(evidence_dict)
+        return {
+            label: [round(result["lower"][label], 6), round(result["upper"][label], 6)]
+            for label in result["probabilities"]
+        }
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_directory(path):
+    """Hace durable la entrada del archivo en su directorio (creación o rename)"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SessionJournal:
+    """
+    Diario append-only de eventos de sesión (start, answer, finish).
+
+    Las escrituras se encolan y un hilo las vuelca al archivo en lotes con un
+    solo fsync por lote. Al arrancar, `replay` reconstruye las sesiones vivas y
+    el diario se compacta a una entrada por sesión viva cada `compact_every`
+    eventos escritos o, si hubo alguno, cada `compact_interval` segundos.
+
+    Con `ttl`, las sesiones sin eventos durante `ttl` segundos se dan por
+    abandonadas: el hilo escritor las cierra cada `expire_interval` segundos y
+    `replay` no las devuelve.
+    """
+
+    def __init__(self, path, batch_size=64, flush_interval=0.05, compact_every=5000, compact_interval=300,
+                 ttl=None, expire_interval=60):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.ttl = ttl
+        self.expire_interval = expire_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = {}  # session_id -> {"type", "user_id", "mode", "context", "tenant", "model_version", "answers"}
+        self._updated = {}  # session_id -> hora (time.time()) de su último evento
+        self._file = None
+        self._thread = None
+        self._since_compaction = 0
+        self._last_compaction = time.monotonic()
+        self._next_expiry = 0.0
+
+    def replay(self):
+        """Lee el diario y devuelve las sesiones que no llegaron a terminar"""
+        self._live = {}
+        self._updated = {}
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Última línea truncada por una caída a mitad de escritura
+                    logger.warning("Ignoring corrupt journal line in %s", self.path)
+                    continue
+                self._apply(event)
+        # Las abandonadas antes del reinicio se cierran en el diario al arrancar
+        for session_id in self._stale():
+            self._record({"op": "finish", "id": session_id})
+        return {session_id: dict(record, answers=list(record["answers"]))
+                for session_id, record in self._live.items()}
+
+    def start(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        _fsync_directory(self.path)
+        self._thread = threading.Thread(target=self._writer, name="session-journal", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+    def record_start(self, session_id, diagnostic_type, user_id, mode="rules", context=None, tenant=None,
+                     model_version=None):
+        self._record({"op": "start", "id": session_id, "type": diagnostic_type, "user_id": user_id,
+                      "mode": mode, "context": context, "tenant": tenant, "model_version": model_version})
+
+    def record_answer(self, session_id, answer):
+        self._record({"op": "answer", "id": session_id, "answer": answer})
+
+    def record_finish(self, session_id):
+        self._record({"op": "finish", "id": session_id})
+
+    def live_session(self, session_id):
+        """Devuelve la copia registrada de una sesión viva, o None"""
+        with self._lock:
+            record = self._live.get(session_id)
+            if record is None:
+                return None
+            return dict(record, answers=list(record["answers"]))
+
+    def _record(self, event):
+        event["at"] = time.time()
+        # El estado en memoria y la cola se actualizan bajo el mismo lock para
+        # que la compactación vea exactamente lo que ya se escribió.
+        with self._lock:
+            self._apply(event)
+            self._queue.put(event)
+
+    def _stale(self):
+        """Sesiones vivas sin eventos desde hace más de `ttl` segundos"""
+        if self.ttl is None:
+            return []
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            return [session_id for session_id, updated in self._updated.items() if updated < cutoff]
+
+    def _maybe_expire(self):
+        if self.ttl is None or time.monotonic() < self._next_expiry:
+            return
+        self._next_expiry = time.monotonic() + self.expire_interval
+        stale = self._stale()
+        for session_id in stale:
+            self._record({"op": "finish", "id": session_id})
+        if stale:
+            logger.info("Closed %d abandoned sessions in the journal", len(stale))
+
+    def _apply(self, event):
+        op = event["op"]
+        session_id = event["id"]
+        if op == "start":
+            self._live[session_id] = {"type": event["type"], "user_id": event["user_id"],
+                                      "mode": event.get("mode", "rules"), "context": event.get("context"),
+                                      "tenant": event.get("tenant"), "model_version": event.get("model_version"),
+                                      "answers": []}
+        elif op == "session":
+            self._live[session_id] = {"type": event["type"], "user_id": event["user_id"],
+                                      "mode": event.get("mode", "rules"), "context": event.get("context"),
+                                      "tenant": event.get("tenant"), "model_version": event.get("model_version"),
+                                      "answers": list(event["answers"])}
+        elif op == "answer":
+            record = self._live.get(session_id)
+            if record is None:
+                return
+            record["answers"].append(event["answer"])
+        elif op == "finish":
+            self._live.pop(session_id, None)
+            self._updated.pop(session_id, None)
+            return
+        # Los diarios anteriores no tienen hora: cuentan desde ahora
+        self._updated[session_id] = event.get("at") or time.time()
+
+    def _writer(self):
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._maybe_expire()
+                self._maybe_compact()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [event for event in batch if event is not None]
+            if batch:
+                self._file.write("".join(json.dumps(event) + "\n" for event in batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._since_compaction += len(batch)
+            self._maybe_expire()
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._since_compaction >= self.compact_every or (
+                self._since_compaction and time.monotonic() - self._last_compaction >= self.compact_interval):
+            self._compact()
+
+    def _compact(self):
+        """
+        Reescribe el diario con una sola entrada por sesión viva (hilo escritor).
+        Los eventos que siguen en la cola ya están en _live, así que la
+        compactación los incluye y se descartan.
+        """
+        with self._lock:
+            closing = False
+            while True:
+                try:
+                    closing = self._queue.get_nowait() is None or closing
+                except queue.Empty:
+                    break
+            if closing:
+                self._queue.put(None)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+                for session_id, record in self._live.items():
+                    tmp_file.write(json.dumps({"op": "session", "id": session_id, "type": record["type"],
+                                               "user_id": record["user_id"], "mode": record["mode"],
+                                               "context": record["context"], "tenant": record["tenant"],
+                                               "model_version": record["model_version"],
+                                               "answers": record["answers"],
+                                               "at": self._updated[session_id]}) + "\n")
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            _fsync_directory(self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._since_compaction = 0
+            self._last_compaction = time.monotonic()
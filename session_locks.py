@@ -0,0 +1,49 @@
+import asyncio
+import threading
+import zlib
+from collections import OrderedDict
+
+
+class SessionLocks:
+    """
+    Locks asyncio repartidos en franjas: cada sesión usa siempre el mismo lock
+    de un conjunto fijo, así que las respuestas a una misma sesión se aplican
+    de una en una sin un lock global y sin crear un lock por sesión.
+    """
+
+    def __init__(self, stripes=256):
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+
+    def __call__(self, session_id):
+        return self._locks[zlib.crc32(session_id.encode()) % len(self._locks)]
+
+
+class IdempotencyCache:
+    """
+    Respuestas ya enviadas por (sesión, clave de idempotencia), para que un
+    reintento devuelva la misma respuesta en lugar de aplicar otra vez la
+    respuesta del usuario. Guarda las `max_entries` más recientes.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def get(self, session_id, key):
+        with self._lock:
+            response = self._responses.get((session_id, key))
+            if response is not None:
+                self._responses.move_to_end((session_id, key))
+                self.replays += 1
+            return response
+
+    def put(self, session_id, key, response):
+        with self._lock:
+            self._responses[(session_id, key)] = response
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def __len__(self):
+        return len(self._responses)
@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+
+class TieredSessionStore(MutableMapping):
+    """
+    Almacén de sesiones en dos niveles: las activas en memoria y las inactivas
+    serializadas en un archivo SQLite local.
+
+    Una sesión se envía a disco cuando lleva `idle_seconds` sin usarse o cuando
+    hay más de `max_resident` sesiones en memoria (se expulsa la menos usada).
+    Al volver a pedirla se rehidrata de forma transparente. Las sesiones
+    fijadas con `pinned` (p. ej. mientras se aplica una respuesta) no se
+    envían a disco. `expire` borra las que llevan demasiado tiempo abandonadas.
+    """
+
+    def __init__(self, path, serialize, rehydrate, idle_seconds=300, max_resident=1000):
+        self.serialize = serialize
+        self.rehydrate = rehydrate
+        self.idle_seconds = idle_seconds
+        self.max_resident = max_resident
+        self._resident = OrderedDict()  # session_id -> sesión, de la menos a la más usada
+        self._last_access = {}
+        self._pins = Counter()  # session_id -> usos en curso que impiden enviarla a disco
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        # Lo que haya quedado de otro proceso se recupera desde el diario
+        self._db.execute("DROP TABLE IF EXISTS spilled")
+        # last_access es time.monotonic() de este proceso
+        self._db.execute("CREATE TABLE spilled (id TEXT PRIMARY KEY, data TEXT NOT NULL, last_access REAL NOT NULL)")
+
+    def __getitem__(self, session_id):
+        session = self._resident.get(session_id)
+        if session is None:
+            row = self._db.execute("SELECT data FROM spilled WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                raise KeyError(session_id)
+            session = self.rehydrate(json.loads(row[0]))
+            self._db.execute("DELETE FROM spilled WHERE id = ?", (session_id,))
+            self._resident[session_id] = session
+            self._enforce_capacity()
+        self._touch(session_id)
+        return session
+
+    def __setitem__(self, session_id, session):
+        self._db.execute("DELETE FROM spilled WHERE id = ?", (session_id,))
+        self._resident[session_id] = session
+        self._touch(session_id)
+        self._enforce_capacity()
+
+    def __delitem__(self, session_id):
+        if session_id in self._resident:
+            del self._resident[session_id]
+            del self._last_access[session_id]
+            return
+        deleted = self._db.execute("DELETE FROM spilled WHERE id = ?", (session_id,)).rowcount
+        if not deleted:
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id):
+        if session_id in self._resident:
+            return True
+        return self._db.execute("SELECT 1 FROM spilled WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def __iter__(self):
+        yield from list(self._resident)
+        for (session_id,) in self._db.execute("SELECT id FROM spilled").fetchall():
+            yield session_id
+
+    def __len__(self):
+        return len(self._resident) + self.spilled_count()
+
+    def spilled_count(self):
+        return self._db.execute("SELECT COUNT(*) FROM spilled").fetchone()[0]
+
+    def spilled_bytes(self):
+        """Tamaño de las sesiones serializadas en disco"""
+        return self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM spilled").fetchone()[0]
+
+    def resident(self):
+        """Copia de las sesiones en memoria, (session_id, sesión), sin tocar su último acceso"""
+        return list(self._resident.items())
+
+    def stats(self):
+        return {"resident": len(self._resident), "spilled": self.spilled_count()}
+
+    @contextmanager
+    def pinned(self, session_id):
+        """Mantiene la sesión en memoria mientras dura el bloque"""
+        self._pins[session_id] += 1
+        try:
+            yield
+        finally:
+            self._pins[session_id] -= 1
+            if not self._pins[session_id]:
+                del self._pins[session_id]
+            if session_id in self._resident:
+                self._touch(session_id)
+            self._enforce_capacity()
+
+    def sweep(self):
+        """Envía a disco las sesiones inactivas. Devuelve cuántas se movieron."""
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [session_id for session_id in self._resident
+                if self._last_access[session_id] < cutoff and session_id not in self._pins]
+        self._spill(idle)
+        return len(idle)
+
+    def expire(self, max_age):
+        """
+        Borra las sesiones, en memoria o en disco, que llevan más de `max_age`
+        segundos sin usarse. Las fijadas no caducan.
+
+        Returns:
+            dict: session_id -> forma serializada de cada sesión borrada.
+        """
+        cutoff = time.monotonic() - max_age
+        expired = {}
+        for session_id in [session_id for session_id in self._resident
+                           if self._last_access[session_id] < cutoff and session_id not in self._pins]:
+            expired[session_id] = self.serialize(self._resident.pop(session_id))
+            del self._last_access[session_id]
+        rows = self._db.execute("SELECT id, data FROM spilled WHERE last_access < ?", (cutoff,)).fetchall()
+        if rows:
+            self._db.executemany("DELETE FROM spilled WHERE id = ?", [(session_id,) for session_id, _ in rows])
+        for session_id, data in rows:
+            expired[session_id] = json.loads(data)
+        return expired
+
+    def _touch(self, session_id):
+        self._resident.move_to_end(session_id)
+        self._last_access[session_id] = time.monotonic()
+
+    def _enforce_capacity(self):
+        overflow = len(self._resident) - self.max_resident
+        if overflow > 0:
+            unpinned = [session_id for session_id in self._resident if session_id not in self._pins]
+            self._spill(unpinned[:overflow])
+
+    def _spill(self, session_ids):
+        if not session_ids:
+            return
+        rows = [(session_id, json.dumps(self.serialize(self._resident[session_id])), self._last_access[session_id])
+                for session_id in session_ids]
+        self._db.execute("BEGIN")
+        self._db.executemany("INSERT OR REPLACE INTO spilled (id, data, last_access) VALUES (?, ?, ?)", rows)
+        self._db.execute("COMMIT")
+        for session_id in session_ids:
+            del self._resident[session_id]
+            del self._last_access[session_id]
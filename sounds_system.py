@@ -8,6 +8,16 @@ import logging
 logging.getLogger("experta.watchers").setLevel(logging.ERROR)
 
 class StartingInference:
+    problems = [
+        'Suspension_issues',
+        'Brake_and_wheel_problems',
+        'Transmission_or_drivetrain',
+        'Exhaust_or_engine_noises',
+        'CV_joint_or_alignment'
+    ]
+
+    problem_mapping = {system: system for system in problems}
+
     def __init__(self):
         self.model = self._build_model()
         self.inference = VariableElimination(self.model)
@@ -231,17 +241,9 @@ class StartingInference:
 
     def infer_problem(self, evidence_dict):
 
-        systems =  [
-            'Suspension_issues',
-            'Brake_and_wheel_problems',
-            'Transmission_or_drivetrain',
-            'Exhaust_or_engine_noises',
-            'CV_joint_or_alignment'
-        ] 
-        
         probabilities = {}
         
-        for system in systems:
+        for system in self.problems:
             result = self.inference.query(variables=[system], evidence=evidence_dict)
             probabilities[system] = result.values[1]
         
@@ -262,6 +264,8 @@ class SoundDiagnostic(KnowledgeEngine):
         self.diagnostic_complete = False
         self.diagnostic_result = None
         self.diagnostic_message = None
+        # Shared inference model; a fresh one is built when left unset
+        self.inference = None
 
     def get_next_question(self):
         return self.next_question
@@ -277,7 +281,9 @@ class SoundDiagnostic(KnowledgeEngine):
             self.evidence_list.append((self.current_fact, answer == 'yes'))
 
     def generate_diagnostic(self, evidence_dict, message=""):
-        inference_engine = StartingInference()
+        inference_engine = self.inference or StartingInference()
+        # Facts without a node in the network carry no probabilistic evidence
+        evidence_dict = {fact: value for fact, value in evidence_dict.items() if fact in inference_engine.model}
         probabilities = inference_engine.infer_problem(evidence_dict)
         most_probable_problem = max(probabilities, key=probabilities.get)
         
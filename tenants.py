@@ -0,0 +1,245 @@
+"""
+Per-tenant model overrides.
+
+TENANT_OVERRIDES_PATH points to a JSON file with one entry per tenant:
+
+    {
+      "chain-a": {
+        "users": ["owner@example.com"],
+        "domains": ["chain-a.example.com"],
+        "overrides": {
+          "brake": {
+            "priors": {"BrakePadOrRotorIssue": 0.35},
+            "cpds": {"GrindingNoise": [[0.9, ...], [0.1, ...]]},
+            "messages": {"<rule message>": "<tenant message>"}
+          }
+        }
+      }
+    }
+
+Overrides are deltas against the base model version: "priors" sets the
+probability of a root cause without parents being present, "cpds" replaces
+whole CPD tables (same shape as in the base network) and "messages" replaces
+rule messages by their base text. Anything not listed comes from the base.
+
+A tenant variant is a TenantVersion, which quacks like a ModelVersion, so
+compiled networks, selectors, context variants and bundles are derived from
+it the same way as for the base. Variants are built lazily and kept in an
+LRU bounded by their estimated size.
+
+The rule engines are not tenant-specific. Rules are Python code shared by
+every tenant and deployed with the service. A tenant changes the rule
+runtime only through "messages", which replace the text of the diagnosis a
+rule reaches (final diagnoses, prefetched leaves and offline submissions).
+Tenants cannot add, remove or reorder rules or questions.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from compiled_network import CompiledNetwork
+from diagnostic_systems import VariantCache, build_inference
+from memory_report import register_cache
+
+TENANT_OVERRIDES_PATH = os.getenv("TENANT_OVERRIDES_PATH")
+TENANT_CACHE_BYTES = int(os.getenv("TENANT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+def _load_tenants():
+    if TENANT_OVERRIDES_PATH:
+        with open(TENANT_OVERRIDES_PATH, encoding="utf-8") as tenants_file:
+            return json.load(tenants_file)
+    return {}
+
+
+TENANTS = _load_tenants()
+_tenant_by_email = {email.lower(): tenant for tenant, spec in TENANTS.items() for email in spec.get("users", [])}
+_tenant_by_domain = {domain.lower(): tenant for tenant, spec in TENANTS.items()
+                     for domain in spec.get("domains", [])}
+
+
+def tenant_for(email):
+    """Tenant of a user, by explicit address first and then by email domain"""
+    if not email:
+        return None
+    email = email.lower()
+    return _tenant_by_email.get(email) or _tenant_by_domain.get(email.rpartition("@")[2])
+
+
+def override_tables(model, delta):
+    """CPD tables (variable -> 2D array) that a tenant delta replaces in `model`"""
+    cpds = {cpd.variable: cpd for cpd in model.get_cpds()}
+    tables = {}
+    for variable, probability in delta.get("priors", {}).items():
+        cpd = cpds.get(variable)
+        if cpd is None or len(cpd.variables) > 1 or cpd.cardinality[0] != 2:
+            raise ValueError(f"'{variable}' is not a binary root cause without parents")
+        tables[variable] = np.array([[1.0 - probability], [probability]])
+    for variable, values in delta.get("cpds", {}).items():
+        cpd = cpds.get(variable)
+        values = np.asarray(values, dtype=float)
+        if cpd is None or values.shape != cpd.get_values().shape:
+            raise ValueError(f"Override table for '{variable}' does not match the network")
+        tables[variable] = values
+    return tables
+
+
+class TenantVersion:
+    """A model version with one tenant's overrides applied"""
+
+    def __init__(self, base, tenant, overrides):
+        self.base = base
+        self.tenant = tenant
+        self.id = f"{base.id}@{tenant}"
+        self.created_at = time.time()
+        self.overrides = overrides
+        self.inference = {}
+        self.derived = {}
+        self.variants = VariantCache()
+        self._lock = threading.Lock()
+
+    def _has_model_delta(self, diagnostic_type):
+        delta = self.overrides.get(diagnostic_type, {})
+        return bool(delta.get("priors") or delta.get("cpds"))
+
+    def artifact_path(self, diagnostic_type):
+        return self.base.artifact_path(diagnostic_type)
+
+    def get(self, diagnostic_type):
+        if not self._has_model_delta(diagnostic_type):
+            return self.base.get(diagnostic_type)
+        inference = self.inference.get(diagnostic_type)
+        if inference is None:
+            with self._lock:
+                inference = self.inference.get(diagnostic_type)
+                if inference is None:
+                    tables = override_tables(self.base.get(diagnostic_type).model, self.overrides[diagnostic_type])
+                    inference = build_inference(diagnostic_type, self.base.artifact_path(diagnostic_type), tables,
+                                                f"{diagnostic_type}-{self.tenant}")
+                    self.inference[diagnostic_type] = inference
+        return inference
+
+    def cached(self, key, build):
+        # Keys are (kind, diagnostic type, ...); types without a model delta share the base objects
+        if not self._has_model_delta(key[1]):
+            return self.base.cached(key, build)
+        value = self.derived.get(key)
+        if value is None:
+            value = self.derived.setdefault(key, build())
+        return value
+
+    def cached_variant(self, key, build):
+        if not self._has_model_delta(key[1]):
+            return self.base.cached_variant(key, build)
+        return self.variants.get(key, build)
+
+    def message(self, diagnostic_type, message):
+        messages = self.overrides.get(diagnostic_type, {}).get("messages", {})
+        return messages.get(message, message)
+
+    def estimated_bytes(self):
+        """Rough size of what the variant owns: its CPD tables and compiled arrays"""
+        seen = set()
+        total = 0
+
+        def add(array):
+            nonlocal total
+            if isinstance(array, np.ndarray) and id(array) not in seen:
+                seen.add(id(array))
+                total += array.nbytes
+
+        for inference in list(self.inference.values()):
+            for cpd in inference.model.get_cpds():
+                add(cpd.values)
+        for value in list(self.derived.values()) + [value for _, value in self.variants.items()]:
+            network = getattr(value, "network", value)
+            if isinstance(network, CompiledNetwork):
+                for array in (network.prior, network.likelihood, network.states, network.problem_indicator):
+                    add(array)
+        return total
+
+
+class TenantModelCache:
+    """LRU of tenant variants per (tenant, base version), bounded by estimated bytes"""
+
+    def __init__(self, max_bytes=TENANT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (tenant, base id) -> [variant, estimated bytes]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def get(self, tenant, base):
+        key = (tenant, base.id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                # Variants grow as their types get used; re-measure on every access
+                entry[1] = entry[0].estimated_bytes()
+            else:
+                self.misses += 1
+                entry = self._entries[key] = [TenantVersion(base, tenant, TENANTS[tenant].get("overrides", {})), 0]
+            self._evict(keep=key)
+            return entry[0]
+
+    def _evict(self, keep):
+        """Drops least recently used variants until the total fits (lock held)"""
+        total = sum(size for _, size in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            _, size = self._entries.pop(key)
+            total -= size
+            self.evictions += 1
+            self.evicted_bytes += size
+
+    def discard_version(self, base_id):
+        """Forgets the variants of a base version that was retired"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == base_id]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": [{"tenant": tenant, "base_version": base_id, "estimated_bytes": size}
+                            for (tenant, base_id), (_, size) in self._entries.items()],
+                "bytes": sum(size for _, size in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+_cache = TenantModelCache()
+register_cache("tenant_variants", _cache)
+
+
+def tenant_version(tenant, base):
+    """Model version to use for a tenant: the base version when it has no overrides"""
+    if not tenant or tenant not in TENANTS:
+        return base
+    return _cache.get(tenant, base)
+
+
+def discard_version(base_id):
+    _cache.discard_version(base_id)
+
+
+def cache_stats():
+    return _cache.stats()
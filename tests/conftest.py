@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# main reads its configuration at import time; keep the tests off the working directory
+_tmp = tempfile.mkdtemp(prefix="tests_")
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+os.environ.setdefault("SESSION_SPILL_PATH", ":memory:")
+os.environ.setdefault("SESSION_JOURNAL_PATH", os.path.join(_tmp, "journal.log"))
+os.environ.setdefault("RATE_LIMIT_USER_PER_MINUTE", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_MINUTE", "0")
+os.environ.setdefault("ADMISSION_MAX_QUEUE_MS", "1e9")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
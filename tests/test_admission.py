@@ -0,0 +1,37 @@
+import pytest
+
+from admission import AdmissionController, Rejected, TokenBuckets
+
+
+def controller(user_burst, ip_burst):
+    admission = AdmissionController()
+    admission.users = TokenBuckets(60, user_burst)
+    admission.ips = TokenBuckets(60, ip_burst)
+    return admission
+
+
+def test_a_request_refused_by_the_ip_limit_keeps_the_user_token():
+    admission = controller(user_burst=2, ip_burst=1)
+    admission.check(1, "10.0.0.1")
+
+    with pytest.raises(Rejected) as rejected:
+        admission.check(1, "10.0.0.1")
+    assert rejected.value.reason == "ip_rate"
+
+    # The refused request did not spend the user's second token
+    admission.check(1, "10.0.0.2")
+    assert admission.stats()["decisions"]["admitted"] == 2
+
+
+def test_a_request_refused_by_the_user_limit_keeps_the_ip_token():
+    admission = controller(user_burst=1, ip_burst=2)
+    admission.check(1, "10.0.0.1")
+
+    with pytest.raises(Rejected) as rejected:
+        admission.check(1, "10.0.0.1")
+    assert rejected.value.reason == "user_rate"
+
+    admission.check(2, "10.0.0.1")
+    with pytest.raises(Rejected) as rejected:
+        admission.check(3, "10.0.0.1")
+    assert rejected.value.reason == "ip_rate"
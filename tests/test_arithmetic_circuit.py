@@ -0,0 +1,54 @@
+import os
+
+import pytest
+from pgmpy.factors.discrete import TabularCPD
+from pgmpy.models import BayesianNetwork
+
+from arithmetic_circuit import ArithmeticCircuit, CircuitInference, check_parity, model_fingerprint
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS, INFERENCE_MODELS
+
+
+@pytest.fixture(scope="module", params=list(DIAGNOSTIC_SYSTEMS))
+def inference(request):
+    return request.param, INFERENCE_MODELS[request.param]()
+
+
+def test_circuit_matches_pgmpy(inference, tmp_path):
+    diagnostic_type, base = inference
+    circuit_inference = CircuitInference(base, str(tmp_path), diagnostic_type)
+
+    assert check_parity(base, circuit_inference, trials=100, seed=1) <= 1e-9
+    assert circuit_inference.infer_problem({}).keys() == base.infer_problem({}).keys()
+
+
+def test_cached_circuit_is_reused_and_matches_pgmpy(inference, tmp_path, monkeypatch):
+    diagnostic_type, base = inference
+    CircuitInference(base, str(tmp_path), diagnostic_type)
+    path = os.path.join(str(tmp_path), f"{diagnostic_type}.npz")
+    assert ArithmeticCircuit.load(path).fingerprint == model_fingerprint(base.model)
+
+    def compile_again(*args):
+        raise AssertionError("the cached circuit was not used")
+
+    monkeypatch.setattr(ArithmeticCircuit, "compile", compile_again)
+    cached = CircuitInference(base, str(tmp_path), diagnostic_type)
+
+    assert check_parity(base, cached, trials=50, seed=2) <= 1e-9
+
+
+def test_circuit_grows_with_the_network_not_with_its_joint_states():
+    # 24 independent root causes: 2**24 joint states, but a circuit linear in the network
+    problems = [f"Cause{i}" for i in range(24)]
+    model = BayesianNetwork([(problem, f"symptom{i}") for i, problem in enumerate(problems)])
+    for i, problem in enumerate(problems):
+        prior = 0.05 + 0.01 * i
+        model.add_cpds(TabularCPD(problem, 2, [[1 - prior], [prior]]),
+                       TabularCPD(f"symptom{i}", 2, [[0.9, 0.2], [0.1, 0.8]], evidence=[problem], evidence_card=[2]))
+
+    circuit = ArithmeticCircuit.compile(model, problems)
+    marginals = circuit.problem_marginals({"symptom0": 1, "symptom1": 0})
+
+    assert circuit.node_count < 20 * len(problems)
+    assert marginals[0] == pytest.approx(0.05 * 0.8 / (0.05 * 0.8 + 0.95 * 0.1))
+    assert marginals[1] == pytest.approx(0.06 * 0.2 / (0.06 * 0.2 + 0.94 * 0.9))
+    assert marginals[2] == pytest.approx(0.07)
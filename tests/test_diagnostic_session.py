@@ -0,0 +1,68 @@
+import pytest
+from fastapi import HTTPException
+
+from diagnostic_systems import new_engine
+from prefetch import prefetch_branches
+from tenants import TenantVersion
+
+import main
+
+
+def answers_of(path):
+    return [answer for _, answer in path]
+
+
+def path_to(catalog, fact):
+    """Answers that lead to the first question about `fact`"""
+    for path, _ in catalog.leaf_paths():
+        facts = [step_fact for step_fact, _ in path]
+        if fact in facts:
+            return answers_of(path[:facts.index(fact)])
+    return None
+
+
+def test_a_repeated_question_keeps_each_answer():
+    session = main.DiagnosticSession("start")
+    session.engine = new_engine("start")
+    # The rules ask mechanical_distributor again after a "yes"
+    path = path_to(session.catalog, "mechanical_distributor")
+    for answer in path + ["yes", "no"]:
+        session.apply_answer(answer)
+
+    assert session.answers() == path + ["yes", "no"]
+    assert [turn["answer"] for turn in session.conversation[-2:]] == ["yes", "no"]
+    mechanical = 1 << session.catalog.fact_id("mechanical_distributor")
+    assert session.asked & mechanical
+    assert not session.yes & mechanical
+
+    restored = main.restore_session(main.serialize_session(session))
+    assert restored.answers() == session.answers()
+    assert restored.engine.evidence_list == session.engine.evidence_list
+
+
+def test_prefetched_diagnosis_uses_the_tenant_message():
+    catalog = main.get_catalog("start")
+    path = path_to(catalog, "mechanical_distributor")
+    leaf = next(catalog.messages[message] for leaf_path, message in catalog.leaf_paths()
+                if answers_of(leaf_path) == path + ["no"])
+    version = TenantVersion(main.current_version(), "chain-a", {"start": {"messages": {leaf: "Call chain A"}}})
+    session = main.DiagnosticSession("start", version=version, tenant="chain-a")
+    session.engine = new_engine("start", version=version)
+    for answer in path:
+        session.apply_answer(answer)
+
+    assert prefetch_branches(session, 1)["no"] == {"diagnosis": True, "diagnostic_message": "Call chain A"}
+    assert prefetch_branches(session, 1, compact=True)["no"] == {"diagnosis": True, "message_id": None,
+                                                                  "diagnostic_message": "Call chain A"}
+
+
+def test_an_answer_without_a_pending_question_is_refused():
+    session = main.DiagnosticSession("start")
+    session.engine = new_engine("start")
+    session.engine.current_fact = None
+
+    with pytest.raises(HTTPException) as refused:
+        session.apply_answer("yes")
+
+    assert refused.value.status_code == 409
+    assert session.turns == b""
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+from pgmpy.factors.discrete import TabularCPD
+from pgmpy.models import BayesianNetwork
+
+import diagnostic_systems
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS, ModelVersion, new_engine
+from question_catalog import get_catalog
+from sampling_inference import SamplingInference
+
+import main
+
+
+def deterministic_network():
+    """A root cause that always shows one symptom when present and the other when absent"""
+    model = BayesianNetwork([("Fault", "Symptom"), ("Fault", "Healthy")])
+    model.add_cpds(
+        TabularCPD("Fault", 2, [[0.7], [0.3]]),
+        TabularCPD("Symptom", 2, [[1.0, 0.0], [0.0, 1.0]], evidence=["Fault"], evidence_card=[2]),
+        TabularCPD("Healthy", 2, [[0.0, 1.0], [1.0, 0.0]], evidence=["Fault"], evidence_card=[2]),
+    )
+    return SimpleNamespace(model=model, problems=["Fault"], problem_mapping={"Fault": "fault"})
+
+
+def test_consistent_evidence_is_estimated():
+    inference = SamplingInference(deterministic_network(), max_samples=2000, batch_size=500, seed=0)
+
+    assert inference.infer_problem({"Symptom": 1}) == {"fault": 1.0}
+
+
+def test_impossible_evidence_reports_the_prior_without_bounds():
+    inference = SamplingInference(deterministic_network(), max_samples=2000, batch_size=500, seed=0)
+
+    result = inference.query({"Symptom": 1, "Healthy": 1})
+
+    assert result["samples"] == 2000
+    assert result["effective_samples"] == 0.0
+    assert 0.2 < result["probabilities"]["fault"] < 0.4
+    assert inference.confidence_bounds({"Symptom": 1, "Healthy": 1}) == {"fault": [0.0, 1.0]}
+
+
+@pytest.mark.parametrize("diagnostic_type", list(DIAGNOSTIC_SYSTEMS))
+def test_every_rule_path_ends_in_a_diagnosis_with_sampling(diagnostic_type, monkeypatch):
+    monkeypatch.setattr(diagnostic_systems, "INFERENCE_BACKEND", "sampling")
+    version = ModelVersion("sampling")
+    catalog = get_catalog(diagnostic_type)
+
+    for path, _ in catalog.leaf_paths():
+        session = main.DiagnosticSession(diagnostic_type, version=version)
+        session.engine = new_engine(diagnostic_type, version=version)
+        for _, answer in path:
+            session.apply_answer(answer)
+        diagnostic = main.final_diagnostic(session)
+
+        # Rule facts outside the network are left out of the bounds, as they are of the probabilities
+        for label, probability in diagnostic["probabilities"].items():
+            lower, upper = diagnostic["confidence_bounds"][label]
+            assert lower - 1e-6 <= probability <= upper + 1e-6
@@ -0,0 +1,247 @@
+import asyncio
+import random
+import threading
+
+import httpx
+import pytest
+
+import diagnostic_systems
+import main
+import tenants
+from diagnostic_systems import ModelVersion
+
+
+@pytest.fixture(scope="module")
+def app_loop():
+    """Event loop with the app started once: shutdown also stops the inference pool"""
+    main.Base.metadata.create_all(bind=main.engine)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(main.restore_journaled_sessions())
+    yield loop
+    loop.run_until_complete(main.close_journal())
+    # The session sweeper started with the app
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture
+def run(app_loop):
+    async def with_client(scenario):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/register", json={"email": "test@example.com", "name": "Test", "phone": "0",
+                                                 "password": "test"})
+            response = await client.post("/token", data={"username": "test@example.com", "password": "test"})
+            client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+            return await scenario(client)
+
+    return lambda scenario: app_loop.run_until_complete(with_client(scenario))
+
+
+async def start(client, diagnostic_type):
+    response = await client.post("/api/diagnostic/start?prefetch=0", json={"diagnostic_type": diagnostic_type})
+    assert response.status_code == 200
+    return response.json()["session_id"]
+
+
+async def answer(client, session_id, value, key=None, copies=1):
+    headers = {"Idempotency-Key": key} if key else {}
+    return await asyncio.gather(*[
+        client.post(f"/api/diagnostic/{session_id}/answer?prefetch=0", json={"answer": value}, headers=headers)
+        for _ in range(copies)
+    ])
+
+
+def test_retries_with_the_same_key_apply_the_answer_once(run):
+    async def scenario(client):
+        session_id = await start(client, "brake")
+        replays = main.answer_responses.replays
+        responses = await answer(client, session_id, "yes", key="turn-1", copies=4)
+
+        assert [response.status_code for response in responses] == [200] * 4
+        assert all(response.json() == responses[0].json() for response in responses)
+        assert main.answer_responses.replays - replays == 3
+        session = main.sessions[session_id]
+        assert len(session.turns) == 1
+        assert len(session.engine.evidence_list) == 1
+
+    run(scenario)
+
+
+def test_concurrent_answers_without_key_are_applied_one_at_a_time(run):
+    async def scenario(client):
+        session_id = await start(client, "start")
+        responses = await answer(client, session_id, "no", copies=2)
+
+        assert [response.status_code for response in responses] == [200, 200]
+        session = main.sessions[session_id]
+        # Serialized by the session lock: two turns, each with its own evidence
+        assert len(session.turns) == len(session.engine.evidence_list) == 2
+
+    run(scenario)
+
+
+def test_concurrent_sessions_reach_a_diagnosis(run):
+    async def converse(client, session_id, rng):
+        for turn in range(1, 30):
+            responses = await answer(client, session_id, rng.choice(("yes", "no")), key=f"{session_id}-{turn}",
+                                     copies=3)
+            assert [response.status_code for response in responses] == [200] * 3
+            body = responses[0].json()
+            assert all(response.json() == body for response in responses)
+            if "diagnostic_result" in body:
+                return
+            session = main.sessions[session_id]
+            assert len(session.turns) == len(session.engine.evidence_list) == turn
+        raise AssertionError(f"session {session_id} did not finish")
+
+    async def scenario(client):
+        types = list(main.DIAGNOSTIC_SYSTEMS)
+        session_ids = [await start(client, types[position % len(types)]) for position in range(12)]
+        await asyncio.gather(*[converse(client, session_id, random.Random(position))
+                               for position, session_id in enumerate(session_ids)])
+        assert not any(session_id in main.sessions for session_id in session_ids)
+
+    run(scenario)
+
+
+def test_session_is_not_spilled_while_an_answer_is_applied(run, monkeypatch):
+    async def scenario(client):
+        loop = asyncio.get_running_loop()
+        answer_step = main.answer_step
+
+        def sweep_then_answer(*args):
+            # The periodic sweep runs on the event loop while the worker holds the session;
+            # the round trip waits until it has run
+            loop.call_soon_threadsafe(main.sessions.sweep)
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result()
+            return answer_step(*args)
+
+        session_id = await start(client, "start")
+        monkeypatch.setattr(main.sessions, "idle_seconds", -1)
+        monkeypatch.setattr(main, "answer_step", sweep_then_answer)
+        (response,) = await answer(client, session_id, "no")
+
+        assert response.status_code == 200
+        session = main.sessions[session_id]
+        assert session.answers() == ["no"]
+        assert len(session.engine.evidence_list) == 1
+
+    run(scenario)
+
+
+def test_abandoned_sessions_expire_and_release_their_model_version(run, monkeypatch):
+    async def scenario(client):
+        session_id = await start(client, "sound")
+        version = main.sessions[session_id].model_version
+        pinned = version.sessions
+        assert main.journal.live_session(session_id) is not None
+
+        monkeypatch.setattr(main, "SESSION_TTL_SECONDS", -1)
+        assert main.expire_abandoned_sessions() >= 1
+
+        assert session_id not in main.sessions
+        assert version.sessions < pinned
+        assert main.journal.live_session(session_id) is None
+        response = await client.post(f"/api/diagnostic/{session_id}/answer", json={"answer": "yes"})
+        assert response.status_code == 404
+
+    run(scenario)
+
+
+def test_triage_says_which_session_to_start(run):
+    async def scenario(client):
+        response = await client.post("/api/diagnostic/triage",
+                                     json={"facts": {"scrape_or_grind": "yes", "pedal_to_floor": "yes"}})
+        assert response.status_code == 200
+        result = response.json()
+        assert result["recommended"] == "brake"
+        assert result["start"] == {"method": "POST", "path": "/api/diagnostic/start",
+                                   "body": {"diagnostic_type": "brake"}}
+
+        started = await client.request(result["start"]["method"], result["start"]["path"],
+                                       json=result["start"]["body"])
+        assert started.status_code == 200
+
+    run(scenario)
+
+
+def test_a_tenant_prior_can_finish_the_session_at_start(run, monkeypatch):
+    monkeypatch.setattr(tenants, "TENANTS", {"chain-a": {"overrides": {"start": {"priors": {"BatterySystem": 0.6}}}}})
+    monkeypatch.setattr(tenants, "_tenant_by_email", {"test@example.com": "chain-a"})
+
+    async def scenario(client):
+        response = await client.post("/api/diagnostic/start?prefetch=0", json={
+            "diagnostic_type": "start", "mode": "adaptive", "vehicle": {"climate": "cold"}})
+
+        assert response.status_code == 200
+        result = response.json()
+        assert result["diagnostic_result"]["most_probable_problem"]
+        assert result["session_id"] not in main.sessions
+        assert main.journal.live_session(result["session_id"]) is None
+
+    run(scenario)
+
+
+def test_resumed_sessions_keep_their_model_version(run, monkeypatch, caplog):
+    async def scenario(client):
+        session_id = await start(client, "brake")
+        (response,) = await answer(client, session_id, "yes")
+        assert response.status_code == 200
+        started_on = main.sessions[session_id].model_version
+
+        def resume_after_restart():
+            # As if the process had restarted: the session is only in the journal
+            main.sessions.pop(session_id)
+            main.models.unpin(started_on)
+            return client.post(f"/api/diagnostic/{session_id}/resume")
+
+        swapped = ModelVersion("swapped")
+        monkeypatch.setitem(main.models.versions, swapped.id, swapped)
+        monkeypatch.setattr(diagnostic_systems, "_current", swapped)
+        response = await resume_after_restart()
+        assert response.status_code == 200
+        assert main.sessions[session_id].model_version is started_on
+        assert main.sessions[session_id].answers() == ["yes"]
+
+        # Once its version is gone, the session falls back to the current one
+        monkeypatch.delitem(main.models.versions, started_on.id)
+        response = await resume_after_restart()
+        assert response.status_code == 200
+        assert main.sessions[session_id].model_version is swapped
+        assert "no longer loaded" in caplog.text
+
+    run(scenario)
+
+
+def test_reads_wait_for_an_answer_being_applied(run, monkeypatch):
+    async def scenario(client):
+        gate = threading.Event()
+        answer_step = main.answer_step
+
+        def held_answer(*args):
+            gate.wait(5)
+            return answer_step(*args)
+
+        session_id = await start(client, "brake")
+        first = main.sessions[session_id].engine.current_fact
+        monkeypatch.setattr(main, "answer_step", held_answer)
+        answering = asyncio.create_task(answer(client, session_id, "yes"))
+        await asyncio.sleep(0.05)
+        reads = [asyncio.create_task(client.get(f"/api/diagnostic/{session_id}")),
+                 asyncio.create_task(client.get(f"/api/diagnostic/{session_id}/lookahead")),
+                 asyncio.create_task(client.post(f"/api/diagnostic/{session_id}/resume"))]
+        await asyncio.sleep(0.05)
+        assert not any(read.done() for read in reads)
+
+        gate.set()
+        (answered,) = await answering
+        status, lookahead, resumed = await asyncio.gather(*reads)
+        assert status.json()["current_question"] == answered.json()["question"]
+        assert first not in [symptom["symptom"] for symptom in lookahead.json()["symptoms"]]
+        assert resumed.json()["conversation"][-1]["answer"] == "yes"
+
+    run(scenario)
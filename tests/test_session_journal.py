@@ -0,0 +1,134 @@
+import json
+import time
+
+from session_journal import SessionJournal
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as journal_file:
+        return [json.loads(line) for line in journal_file]
+
+
+def test_replay_returns_unfinished_sessions(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = SessionJournal(path, compact_every=1000)
+    journal.start()
+    journal.record_start("a", "brake", 1, context={"climate": "cold"}, tenant="acme", model_version="v2")
+    journal.record_start("b", "start", 2, mode="adaptive")
+    journal.record_answer("a", "yes")
+    journal.record_answer("b", "no")
+    journal.record_answer("a", "no")
+    journal.record_finish("b")
+    journal.close()
+
+    live = SessionJournal(path).replay()
+
+    assert live == {"a": {"type": "brake", "user_id": 1, "mode": "rules", "context": {"climate": "cold"},
+                          "tenant": "acme", "model_version": "v2", "answers": ["yes", "no"]}}
+
+
+def test_replay_skips_a_truncated_last_line(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = SessionJournal(path)
+    journal.start()
+    journal.record_start("a", "sound", 1)
+    journal.record_answer("a", "yes")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"op": "answer", "id": "a", "ans')
+
+    assert SessionJournal(path).replay()["a"]["answers"] == ["yes"]
+
+
+def test_missing_journal_replays_nothing(tmp_path):
+    assert SessionJournal(str(tmp_path / "missing.log")).replay() == {}
+
+
+def test_compaction_keeps_one_entry_per_live_session(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = SessionJournal(path, batch_size=1, compact_every=1)
+    journal.start()
+    for session_id in ("a", "b", "c"):
+        journal.record_start(session_id, "brake", 7, model_version="initial")
+        journal.record_answer(session_id, "yes")
+    journal.record_answer("a", "no")
+    journal.record_finish("b")
+    journal.close()
+
+    events = read_events(path)
+    assert sorted(event["id"] for event in events) == ["a", "c"]
+    assert all(event["op"] == "session" for event in events)
+    assert SessionJournal(path).replay() == {
+        "a": {"type": "brake", "user_id": 7, "mode": "rules", "context": None, "tenant": None,
+              "model_version": "initial", "answers": ["yes", "no"]},
+        "c": {"type": "brake", "user_id": 7, "mode": "rules", "context": None, "tenant": None,
+              "model_version": "initial", "answers": ["yes"]},
+    }
+
+
+def test_events_after_compaction_are_replayed(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = SessionJournal(path, batch_size=1, compact_every=1)
+    journal.start()
+    journal.record_start("a", "start", 3)
+    journal.close()
+
+    journal = SessionJournal(path, compact_every=1000)
+    assert list(journal.replay()) == ["a"]
+    journal.start()
+    journal.record_answer("a", "yes")
+    journal.record_start("b", "sound", 4)
+    journal.close()
+
+    live = SessionJournal(path).replay()
+    assert live["a"]["answers"] == ["yes"]
+    assert live["b"]["answers"] == []
+
+
+def test_abandoned_sessions_are_closed(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = SessionJournal(path, ttl=0.05, expire_interval=0.01)
+    journal.start()
+    journal.record_start("a", "brake", 1)
+    journal.record_answer("a", "yes")
+    time.sleep(0.2)
+    journal.record_start("b", "sound", 2)
+
+    assert journal.live_session("a") is None
+    assert journal.live_session("b") is not None
+    journal.close()
+    assert list(SessionJournal(path).replay()) == ["b"]
+
+
+def test_replay_skips_sessions_abandoned_before_the_restart(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = SessionJournal(path)
+    journal.start()
+    journal.record_start("a", "start", 1)
+    journal.close()
+    time.sleep(0.05)
+
+    journal = SessionJournal(path, ttl=0.01)
+    assert journal.replay() == {}
+    journal.start()
+    journal.close()
+    assert SessionJournal(path).replay() == {}
+
+
+def test_compaction_runs_while_events_are_queued(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = SessionJournal(path, batch_size=1, compact_every=10 ** 6, compact_interval=0)
+    journal.start()
+    for session_id in range(50):
+        journal.record_start(str(session_id), "brake", 1)
+        for _ in range(3):
+            journal.record_answer(str(session_id), "no")
+        if session_id % 2:
+            journal.record_finish(str(session_id))
+    journal.close()
+
+    events = read_events(path)
+    assert all(event["op"] == "session" for event in events)
+    live = SessionJournal(path).replay()
+    assert sorted(live, key=int) == [str(session_id) for session_id in range(0, 50, 2)]
+    assert all(record["answers"] == ["no"] * 3 for record in live.values())
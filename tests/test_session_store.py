@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from session_store import TieredSessionStore
+
+
+class Session:
+    def __init__(self, answers):
+        self.answers = answers
+
+
+def make_store(**kwargs):
+    rehydrated = []
+
+    def rehydrate(data):
+        rehydrated.append(data)
+        return Session(data["answers"])
+
+    store = TieredSessionStore(":memory:", serialize=lambda session: {"answers": session.answers},
+                               rehydrate=rehydrate, **kwargs)
+    return store, rehydrated
+
+
+def test_over_capacity_spills_the_least_recently_used():
+    store, _ = make_store(max_resident=2)
+    store["a"] = Session(["yes"])
+    store["b"] = Session(["no"])
+    store["a"]
+    store["c"] = Session([])
+
+    assert store.stats() == {"resident": 2, "spilled": 1}
+    assert [session_id for session_id, _ in store.resident()] == ["a", "c"]
+    assert "b" in store
+    assert len(store) == 3
+    assert sorted(store) == ["a", "b", "c"]
+    assert store.spilled_bytes() > 0
+
+
+def test_spilled_session_is_rehydrated_on_access():
+    store, rehydrated = make_store(max_resident=1)
+    original = Session(["yes", "no"])
+    store["a"] = original
+    store["b"] = Session([])
+
+    session = store["a"]
+
+    assert session is not original
+    assert session.answers == ["yes", "no"]
+    assert rehydrated == [{"answers": ["yes", "no"]}]
+    # Rehydrating counts as a use: b is the one that goes to disk now
+    assert store.stats() == {"resident": 1, "spilled": 1}
+    assert [session_id for session_id, _ in store.resident()] == ["a"]
+    assert store["a"] is session
+
+
+def test_sweep_spills_idle_sessions():
+    store, rehydrated = make_store(idle_seconds=0.01)
+    store["a"] = Session(["yes"])
+    time.sleep(0.02)
+    store["b"] = Session(["no"])
+
+    assert store.sweep() == 1
+    assert store.stats() == {"resident": 1, "spilled": 1}
+    assert store["a"].answers == ["yes"]
+    assert len(rehydrated) == 1
+    assert store.sweep() == 0
+
+
+def test_setting_a_spilled_session_replaces_the_copy_on_disk():
+    store, rehydrated = make_store(max_resident=1)
+    store["a"] = Session(["yes"])
+    store["b"] = Session([])
+    store["a"] = Session(["no"])
+
+    assert store["a"].answers == ["no"]
+    assert rehydrated == []
+    assert len(store) == 2
+
+
+def test_delete_resident_and_spilled_sessions():
+    store, _ = make_store(max_resident=1)
+    store["a"] = Session([])
+    store["b"] = Session([])
+
+    del store["a"]
+    del store["b"]
+
+    assert len(store) == 0
+    with pytest.raises(KeyError):
+        del store["a"]
+    with pytest.raises(KeyError):
+        store["b"]
+
+
+def test_pinned_sessions_are_not_spilled():
+    store, rehydrated = make_store(max_resident=1, idle_seconds=0)
+    pinned = Session([])
+    store["a"] = pinned
+
+    with store.pinned("a"):
+        store["b"] = Session([])
+        pinned.answers.append("yes")
+        assert store.sweep() == 0
+        assert [session_id for session_id, _ in store.resident()] == ["a"]
+
+    assert store["a"] is pinned
+    assert rehydrated == []
+    assert store.stats() == {"resident": 1, "spilled": 1}
+
+
+def test_expire_deletes_abandoned_sessions_in_both_tiers():
+    store, _ = make_store(max_resident=1)
+    store["a"] = Session(["yes"])
+    store["b"] = Session(["no"])
+    store["c"] = Session([])
+    time.sleep(0.02)
+    store["d"] = Session([])
+
+    with store.pinned("d"):
+        expired = store.expire(0.01)
+
+    assert expired == {"a": {"answers": ["yes"]}, "b": {"answers": ["no"]}, "c": {"answers": []}}
+    assert sorted(store) == ["d"]
+    assert store.expire(0) == {"d": {"answers": []}}
+    assert len(store) == 0
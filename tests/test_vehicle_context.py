@@ -0,0 +1,19 @@
+from diagnostic_systems import ModelVersion, VariantCache
+from vehicle_context import cache_info, context_network
+
+
+def test_context_variants_are_kept_in_a_bounded_lru():
+    version = ModelVersion("context-test")
+    version.variants = VariantCache(max_entries=2)
+    cold = context_network("start", {"climate": "cold"}, version)
+    context_network("start", {"climate": "hot"}, version)
+    assert context_network("start", {"climate": "cold"}, version) is cold
+
+    context_network("start", {"age": "old"}, version)
+
+    assert len(version.variants) == 2
+    assert version.variants.evictions == 1
+    # hot was the least recently used; cold is still cached
+    assert context_network("start", {"climate": "cold"}, version) is cold
+    assert version.variants.evictions == 1
+    assert set(cache_info()["lru"]) == {"entries", "max_entries", "evictions"}
@@ -0,0 +1,92 @@
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from diagnostic_systems import DIAGNOSTIC_SYSTEMS, current_version, get_inference
+from memory_report import register_cache
+
+TRIAGE_WORKERS = int(os.getenv("TRIAGE_WORKERS", str(len(DIAGNOSTIC_SYSTEMS))))
+TRIAGE_CACHE_SIZE = int(os.getenv("TRIAGE_CACHE_SIZE", "1024"))
+
+_pool = ThreadPoolExecutor(max_workers=TRIAGE_WORKERS, thread_name_prefix="triage")
+_cache = OrderedDict()
+register_cache("triage_results", _cache)
+
+
+def _system_posterior(diagnostic_type, evidence, version):
+    """Runs one network with the facts it knows about, next to its evidence-free priors"""
+    inference = get_inference(diagnostic_type, version)
+    nodes = version.cached(("triage_nodes", diagnostic_type), lambda: set(inference.model.nodes()))
+    priors = version.cached(("triage_priors", diagnostic_type), lambda: inference.infer_problem({}))
+    matched = {fact: value for fact, value in evidence.items() if fact in nodes}
+    probabilities = inference.infer_problem(matched) if matched else priors
+    return sorted(matched), probabilities, priors
+
+
+def _rank(evidence, results):
+    systems = {}
+    root_causes = []
+    known = set()
+    for diagnostic_type, (matched, probabilities, priors) in results.items():
+        known.update(matched)
+        # How far the evidence moved the most affected root cause; priors
+        # alone say nothing about which system the user's problem is in
+        lift = max(abs(probabilities[label] - priors[label]) for label in probabilities)
+        systems[diagnostic_type] = {
+            "matched_facts": matched,
+            "most_probable_problem": max(probabilities, key=probabilities.get),
+            "score": round(float(lift), 6) if matched else None,
+        }
+        for label, probability in probabilities.items():
+            root_causes.append({
+                "diagnostic_type": diagnostic_type,
+                "problem": label,
+                "probability": round(float(probability), 6),
+                "prior": round(float(priors[label]), 6),
+            })
+    root_causes.sort(key=lambda cause: cause["probability"], reverse=True)
+    candidates = [diagnostic_type for diagnostic_type in systems if systems[diagnostic_type]["matched_facts"]]
+    recommended = max(candidates, key=lambda t: systems[t]["score"]) if candidates else None
+    return {
+        "recommended": recommended,
+        # Request that opens a diagnostic session for the recommended system
+        "start": {"method": "POST", "path": "/api/diagnostic/start",
+                  "body": {"diagnostic_type": recommended}} if recommended else None,
+        "systems": systems,
+        "root_causes": root_causes,
+        "unknown_facts": sorted(fact for fact in evidence if fact not in known),
+    }
+
+
+async def triage(evidence, version=None):
+    """
+    Runs every diagnostic network on the same evidence in parallel on a
+    worker pool, ranks all root causes together and recommends the system
+    whose root causes the evidence moved the most.
+
+    Results are cached per evidence set, so repeated calls return the same
+    (shared) dict.
+    """
+    version = version or current_version()
+    key = (version.id, frozenset(evidence.items()))
+    result = _cache.get(key)
+    if result is not None:
+        _cache.move_to_end(key)
+        return result
+
+    loop = asyncio.get_running_loop()
+    types = list(DIAGNOSTIC_SYSTEMS)
+    outputs = await asyncio.gather(*[
+        loop.run_in_executor(_pool, _system_posterior, diagnostic_type, evidence, version)
+        for diagnostic_type in types
+    ])
+    result = _rank(evidence, dict(zip(types, outputs)))
+    _cache[key] = result
+    if len(_cache) > TRIAGE_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+
+def shutdown():
+    _pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,153 @@
+import json
+import math
+import os
+from collections import Counter
+
+from compiled_network import get_compiled_network
+from diagnostic_systems import current_version, get_inference
+from metrics import instrument_inference
+
+# JSON file with the same shape as DEFAULT_CONTEXT_PRIORS; replaces the defaults
+VEHICLE_PRIORS_PATH = os.getenv("VEHICLE_PRIORS_PATH")
+
+# field -> bucket -> root cause -> multiplier on the prior odds of the root cause being present
+DEFAULT_CONTEXT_PRIORS = {
+    "climate": {
+        "cold": {"BatterySystem": 2.0, "StarterSystem": 1.3, "FuelSystem": 1.3, "SensorSystem": 1.1,
+                 "Suspension_issues": 1.2},
+        "hot": {"BatterySystem": 1.5, "FuelSystem": 1.2, "BrakeEffectiveness": 1.1},
+        "humid": {"BrakePadOrRotorIssue": 1.4, "ParkingBrake": 1.3, "Exhaust_or_engine_noises": 1.2},
+    },
+    "age": {
+        "new": {"BatterySystem": 0.6, "StarterSystem": 0.6, "IgnitionSystem": 0.7, "Suspension_issues": 0.6,
+                "CV_joint_or_alignment": 0.7, "BrakePadOrRotorIssue": 0.7},
+        "old": {"BatterySystem": 1.5, "StarterSystem": 1.6, "IgnitionSystem": 1.4, "Suspension_issues": 1.6,
+                "CV_joint_or_alignment": 1.5, "Exhaust_or_engine_noises": 1.5, "BrakeEffectiveness": 1.3,
+                "ParkingBrake": 1.4},
+    },
+    "mileage": {
+        "low": {"BrakePadOrRotorIssue": 0.6, "Transmission_or_drivetrain": 0.7},
+        "high": {"BrakePadOrRotorIssue": 1.8, "Transmission_or_drivetrain": 1.6, "CV_joint_or_alignment": 1.5,
+                 "Suspension_issues": 1.5, "FuelSystem": 1.3, "WheelResistance": 1.3},
+    },
+    "make": {},
+}
+
+# Upper bounds (exclusive) of the numeric buckets
+AGE_BUCKETS = ((4, "new"), (11, "mid"), (math.inf, "old"))
+MILEAGE_BUCKETS = ((60000, "low"), (150000, "mid"), (math.inf, "high"))
+
+
+def _load_priors():
+    if VEHICLE_PRIORS_PATH:
+        with open(VEHICLE_PRIORS_PATH, encoding="utf-8") as priors_file:
+            return json.load(priors_file)
+    return DEFAULT_CONTEXT_PRIORS
+
+
+CONTEXT_PRIORS = _load_priors()
+
+
+def _numeric_bucket(value, buckets):
+    for upper, label in buckets:
+        if value < upper:
+            return label
+
+
+def context_bucket(make=None, age_years=None, mileage_km=None, climate=None):
+    """
+    Reduces a vehicle context to the buckets that have an entry in the prior
+    table, so contexts that lead to the same priors share one compiled variant.
+
+    Returns:
+        dict: field -> bucket label, empty when nothing in the context matters.
+    """
+    labels = {
+        "make": make.strip().lower() if make else None,
+        "age": _numeric_bucket(age_years, AGE_BUCKETS) if age_years is not None else None,
+        "mileage": _numeric_bucket(mileage_km, MILEAGE_BUCKETS) if mileage_km is not None else None,
+        "climate": climate.strip().lower() if climate else None,
+    }
+    return {field: label for field, label in labels.items()
+            if label is not None and label in CONTEXT_PRIORS.get(field, {})}
+
+
+def bucket_key(bucket):
+    return tuple(sorted(bucket.items())) if bucket else ()
+
+
+def prior_odds(bucket):
+    """Combined odds multiplier per root cause for a context bucket"""
+    odds = {}
+    for field, label in bucket_key(bucket):
+        for problem, factor in CONTEXT_PRIORS[field][label].items():
+            odds[problem] = odds.get(problem, 1.0) * factor
+    return odds
+
+
+# Variants live in their model version's LRU (CONTEXT_CACHE_SIZE entries) and die with it;
+# these only count lookups
+_lookups = {"networks": Counter(), "inference": Counter()}
+
+
+def _cached(kind, diagnostic_type, bucket, version, build):
+    version = version or current_version()
+    key = (f"context_{kind}", diagnostic_type, bucket_key(bucket))
+    built = []
+
+    def counted_build():
+        built.append(True)
+        return build(version)
+
+    value = version.cached_variant(key, counted_build)
+    _lookups[kind]["misses" if built else "hits"] += 1
+    return value
+
+
+def _context_network(diagnostic_type, bucket, version):
+    network = get_compiled_network(diagnostic_type, version)
+    odds = {problem: factor for problem, factor in prior_odds(bucket).items() if problem in network.problems}
+    if not odds:
+        return network
+    return network.with_prior_odds(odds)
+
+
+def context_network(diagnostic_type, bucket=None, version=None):
+    """Compiled network of a diagnostic type with the root priors of a context bucket"""
+    if not bucket:
+        return get_compiled_network(diagnostic_type, version)
+    return _cached("networks", diagnostic_type, bucket, version,
+                   lambda version: _context_network(diagnostic_type, bucket, version))
+
+
+class ContextInference:
+    """Inference backend with the interface of StartingInference over a context variant"""
+
+    def __init__(self, diagnostic_type, bucket, version=None):
+        base = get_inference(diagnostic_type, version)
+        self.model = base.model
+        self.problems = base.problems
+        self.problem_mapping = base.problem_mapping
+        self.network = context_network(diagnostic_type, bucket, version)
+        instrument_inference(self, diagnostic_type)
+
+    def infer_problem(self, evidence_dict):
+        marginals = self.network.marginals(evidence_dict)
+        return {self.problem_mapping[problem]: float(probability)
+                for problem, probability in zip(self.network.problems, marginals)}
+
+
+def context_inference(diagnostic_type, bucket=None, version=None):
+    """Shared inference of a diagnostic type, adjusted to a context bucket when it has one"""
+    if not bucket:
+        return get_inference(diagnostic_type, version)
+    return _cached("inference", diagnostic_type, bucket, version,
+                   lambda version: ContextInference(diagnostic_type, bucket, version))
+
+
+def cache_info():
+    """Hits and misses of the context variant lookups, and the current version's LRU"""
+    info = {kind: {"hits": counts["hits"], "misses": counts["misses"]} for kind, counts in _lookups.items()}
+    variants = current_version().variants
+    info["lru"] = {"entries": len(variants), "max_entries": variants.max_entries, "evictions": variants.evictions}
+    return info